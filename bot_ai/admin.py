@@ -8,6 +8,7 @@ from .models import CatalogPreferences
 from .models import ClientData
 from .models import CompanyData
 from .models import Contact
+from .models import ConversationSummary
 from .models import CustomFeature
 from .models import IntegrationSettings
 from .models import MediasForIATrainig
@@ -178,3 +179,9 @@ class ProductDataAdmin(admin.ModelAdmin):
         "SKU",
         "category",
     )
+
+
+@admin.register(ConversationSummary)
+class ConversationSummaryAdmin(admin.ModelAdmin):
+    list_display = ("conversation_id", "summarized_messages", "updated_at")
+    search_fields = ("conversation_id",)
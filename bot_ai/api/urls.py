@@ -15,4 +15,5 @@ urlpatterns = [
         views.ProductDataListView.as_view(),
         name="product-data-list",
     ),
+    path("ai-data/metrics/", views.MetricsView.as_view(), name="metrics"),
 ]
@@ -1,5 +1,6 @@
 import logging
 
+from django.http import HttpResponse
 from rest_framework import generics
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
@@ -7,6 +8,7 @@ from rest_framework.views import APIView
 
 from app.bot_ai.api.serializers import CompanyDataSerializer
 from app.bot_ai.api.serializers import ProductDataSerializer
+from app.bot_ai.instrumentation import metrics
 from app.bot_ai.models import CompanyData
 from app.bot_ai.models import ProductData
 
@@ -28,3 +30,17 @@ class ProductDataListView(generics.ListAPIView):
     permission_classes = [AllowAny]
     queryset = ProductData.objects.all()
     serializer_class = ProductDataSerializer
+
+
+class MetricsView(APIView):
+    """
+    Exposes the call metrics of this worker process in the Prometheus text format.
+    """
+
+    permission_classes = [AllowAny]
+    serializer_class = None
+
+    def get(self, request, *args, **kwargs):
+        histogram = metrics.histogram
+        body = histogram.prometheus_text() if histogram is not None else ""
+        return HttpResponse(body, content_type="text/plain; version=0.0.4")
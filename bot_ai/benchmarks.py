@@ -0,0 +1,516 @@
+import csv
+import gc
+import itertools
+import logging
+import math
+import random
+import resource
+import shutil
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from dataclasses import field
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BENCH_CUSTOMER_NAME = "bench"
+BENCH_CUSTOMER_ID = 0
+BENCH_BUCKET = "dev_lumi_company_files"
+FIXTURE_SEED = 1234
+
+CHAT_INSTRUCTIONS = (
+    "Eres un asistente de ventas de una tienda. Responde en español, de forma "
+    "breve y amable, usando solo la información de la empresa."
+)
+CHAT_MESSAGES = [
+    "Hola, ¿tienen envíos a Monterrey?",
+    "¿Cuánto cuesta el envío express?",
+    "Quiero saber si el modelo azul está disponible en talla mediana.",
+    "¿Aceptan pago con tarjeta de crédito a meses sin intereses?",
+    "¿Cuál es la garantía de los productos electrónicos?",
+]
+FIXTURE_DOCUMENTS = [
+    f"gs://{BENCH_BUCKET}/{BENCH_CUSTOMER_NAME}_ID_{BENCH_CUSTOMER_ID}/permanent/catalogo.txt",
+    f"gs://{BENCH_BUCKET}/{BENCH_CUSTOMER_NAME}_ID_{BENCH_CUSTOMER_ID}/permanent/politicas.txt",
+]
+ONBOARDING_NAMES = ["María Fernanda López", "José Luis Hernández", "Ana Sofía Ruiz"]
+ONBOARDING_CITIES = ["Guadalajara", "Ciudad de México", "Monterrey"]
+
+
+PROC_STATUS = Path("/proc/self/status")
+PROC_CLEAR_REFS = Path("/proc/self/clear_refs")
+
+
+def reset_peak_rss():
+    """
+    Resets the peak resident set size of the process, so the next reading only
+    covers what runs after the reset. Only supported on Linux.
+
+    Returns:
+        bool: Whether the peak could be reset.
+    """
+    try:
+        PROC_CLEAR_REFS.write_text("5")
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of the process since the last reset, in MB."""  # noqa: E501
+    try:
+        for line in PROC_STATUS.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def traced_peak_mb(scenario):
+    """
+    Runs one untimed iteration of a scenario under tracemalloc and returns the
+    peak of the memory it allocated, in MB.
+    """
+    if scenario.setup is not None:
+        scenario.setup()
+    tracemalloc.start()
+    try:
+        scenario.run()
+    except Exception:  # noqa: BLE001
+        logger.warning(f"Benchmark {scenario.name} failed while tracing memory")  # noqa: G004
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def percentile(samples, q):
+    """Returns the `q` percentile of the samples (nearest rank)."""
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def build_pdf(pages):
+    """
+    Returns the bytes of a minimal PDF with one page of text per item of `pages`.
+    Only used to build extraction fixtures without extra dependencies.
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None]
+    kids = []
+    font_id = 3
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    for text in pages:
+        lines = [
+            line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            for line in text.splitlines()
+        ]
+        shown = " ".join(f"({line}) '" for line in lines)
+        stream = f"BT /F1 10 Tf 14 TL 40 800 Td {shown} ET"
+        stream = stream.encode("latin-1", "replace")
+        objects.append(
+            b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        )
+        content_id = len(objects)
+        objects.append(
+            (
+                "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                f"/Resources << /Font << /F1 {font_id} 0 R >> >> "
+                f"/Contents {content_id} 0 R >>"
+            ).encode("ascii"),
+        )
+        kids.append(len(objects))
+
+    objects[1] = (
+        f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] "
+        f"/Count {len(kids)} >>"
+    ).encode("ascii")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += (
+        b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+        % (len(objects) + 1, xref)
+    )
+    return bytes(output)
+
+
+def fixture_text(generator, words=400):
+    vocabulary = (
+        "producto envío garantía precio tienda cliente pedido pago tarjeta entrega "
+        "catálogo marca devolución factura inventario sucursal horario descuento"
+    ).split()
+    return " ".join(generator.choice(vocabulary) for _ in range(words))
+
+
+@dataclass
+class Scenario:
+    """
+    A benchmark case.
+
+    Attributes:
+        name (str): The name reported in the results.
+        run (callable): The measured operation.
+        setup (callable, optional): Untimed preparation run before every iteration.
+        iterations (int): Number of measured iterations.
+        warmup (int): Number of unmeasured iterations run first.
+    """
+
+    name: str
+    run: object
+    setup: object = None
+    iterations: int = 20
+    warmup: int = 1
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    iterations: int
+    p50: float
+    p95: float
+    p99: float
+    throughput: float
+    peak_rss_mb: float
+    errors: int = 0
+    samples: list = field(default_factory=list, repr=False)
+
+    def as_dict(self):
+        return {
+            "iterations": self.iterations,
+            "p50": self.p50,
+            "p95": self.p95,
+            "p99": self.p99,
+            "throughput": self.throughput,
+            "peak_rss_mb": self.peak_rss_mb,
+            "errors": self.errors,
+        }
+
+
+def run_scenario(scenario, clock=time.perf_counter):
+    """
+    Runs a scenario and returns its latency percentiles (seconds), throughput
+    (operations per second) and its peak memory.
+
+    Failed iterations are counted in `errors` and left out of the latencies
+    and the throughput. The peak memory is the peak RSS while the scenario
+    ran; where the peak RSS cannot be reset (not Linux), it is the peak
+    allocated by one extra iteration traced with tracemalloc.
+    """
+    rss_reset = reset_peak_rss()
+    for _ in range(scenario.warmup):
+        if scenario.setup is not None:
+            scenario.setup()
+        scenario.run()
+
+    samples = []
+    busy = 0.0
+    errors = 0
+    for _ in range(scenario.iterations):
+        if scenario.setup is not None:
+            scenario.setup()
+        gc.collect()
+        started = clock()
+        try:
+            scenario.run()
+        except Exception:
+            errors += 1
+            logger.exception(f"Benchmark {scenario.name} failed")  # noqa: G004
+            continue
+        elapsed = clock() - started
+        busy += elapsed
+        samples.append(elapsed)
+
+    return ScenarioResult(
+        name=scenario.name,
+        iterations=len(samples),
+        p50=percentile(samples, 50) if samples else 0.0,
+        p95=percentile(samples, 95) if samples else 0.0,
+        p99=percentile(samples, 99) if samples else 0.0,
+        throughput=len(samples) / busy if busy else 0.0,
+        peak_rss_mb=peak_rss_mb() if rss_reset else traced_peak_mb(scenario),
+        errors=errors,
+        samples=samples,
+    )
+
+
+def compare_with_baseline(results, baseline, tolerance=0.15):
+    """
+    Compares results against a stored baseline.
+
+    A scenario regresses when it has more failed iterations than the baseline,
+    or when its p95 latency grew, or its throughput dropped, by more than
+    `tolerance` (a fraction).
+
+    Args:
+        results (dict): The `as_dict` of each scenario result, by name.
+        baseline (dict): The results of the baseline run, by name.
+        tolerance (float): The allowed relative change.
+
+    Returns:
+        list[str]: A description of every regression.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if result["errors"] > reference.get("errors", 0):
+            regressions.append(
+                f"{name}: {result['errors']} errors vs {reference.get('errors', 0)}",
+            )
+        if reference["p95"] and result["p95"] > reference["p95"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {result['p95'] * 1000:.1f} ms vs "
+                f"{reference['p95'] * 1000:.1f} ms",
+            )
+        minimum_throughput = reference["throughput"] * (1 - tolerance)
+        if reference["throughput"] and result["throughput"] < minimum_throughput:
+            regressions.append(
+                f"{name}: throughput {result['throughput']:.2f}/s vs "
+                f"{reference['throughput']:.2f}/s",
+            )
+    return regressions
+
+
+class BenchmarkFixtures:
+    """
+    Builds the fixed inputs of the benchmark suite: the customer import folder
+    (PDF and CSV), the documents in the local bucket and the vector stores.
+    Everything is generated from a fixed seed so runs are comparable.
+    """
+
+    def __init__(self, csv_rows=5000, pdf_pages=20, dimensions=128, seed=FIXTURE_SEED):
+        self.csv_rows = csv_rows
+        self.pdf_pages = pdf_pages
+        self.dimensions = dimensions
+        self.seed = seed
+        self.customer_folder = f"{BENCH_CUSTOMER_NAME}_ID_{BENCH_CUSTOMER_ID}"
+        # PDFExtractor and the CSV task read their inputs from this relative path
+        self.import_folder = Path("app/media/import") / self.customer_folder
+        self.export_folder = Path("app/media/export") / self.customer_folder
+
+    def create(self):
+        generator = random.Random(self.seed)  # noqa: S311
+        self.import_folder.mkdir(parents=True, exist_ok=True)
+
+        pages = [
+            "\n".join(fixture_text(generator, 12) for _ in range(40))
+            for _ in range(self.pdf_pages)
+        ]
+        pdf = build_pdf(pages)
+        (self.import_folder / "Tupper_Tips_NORTE.pdf").write_bytes(pdf)
+
+        with (self.import_folder / "amazon_products.csv").open(
+            "w",
+            encoding="utf-8",
+            newline="",
+        ) as file:
+            writer = csv.writer(file)
+            writer.writerow(["sku", "name", "price", "stock"])
+            for index in range(self.csv_rows):
+                writer.writerow(
+                    [
+                        f"SKU{index:07d}",
+                        fixture_text(generator, 4),
+                        round(generator.uniform(10, 5000), 2),
+                        generator.randint(0, 500),
+                    ],
+                )
+
+        self.upload_documents(generator)
+
+    def upload_documents(self, generator):
+        from app.bot_ai.clients import make_storage_client
+
+        client = make_storage_client()
+        for uri in FIXTURE_DOCUMENTS:
+            bucket_name, _, blob_name = uri.removeprefix("gs://").partition("/")
+            blob = client.bucket(bucket_name).blob(blob_name)
+            if not blob.exists():
+                blob.upload_from_string(fixture_text(generator, 2000))
+
+    def vector_store(self, size):
+        """
+        Returns a vector store DataFrame with `size` random unit vectors.
+        """
+        import numpy as np
+        import pandas as pd
+
+        rng = np.random.default_rng(self.seed)
+        vectors = rng.standard_normal((size, self.dimensions), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return pd.DataFrame(
+            {
+                "id": np.arange(size).astype(str),
+                "text": [f"fragmento {index}" for index in range(size)],
+                "embedding": list(vectors),
+            },
+        )
+
+    def reset_ingestion(self):
+        """Removes what a previous ingestion run left in the local bucket."""
+        from app.bot_ai.clients import make_storage_client
+
+        client = make_storage_client()
+        prefix = f"{self.customer_folder}/temporary"
+        for blob in client.list_blobs(BENCH_BUCKET, prefix=prefix):
+            blob.delete()
+
+    def remove(self):
+        shutil.rmtree(self.import_folder, ignore_errors=True)
+        shutil.rmtree(self.export_folder, ignore_errors=True)
+
+
+def chat_turn_scenario(iterations):
+    from app.bot_ai.bot_multi_model import VertexAImultimodel
+    from app.bot_ai.chat_pool import ChatSessionPool
+
+    # Turns go through the session pool, like the messages of a conversation
+    pool = ChatSessionPool(vx_model=VertexAImultimodel())
+    turn = itertools.count()
+
+    def run():
+        pool.reply(
+            "bench-conversation",
+            CHAT_MESSAGES[next(turn) % len(CHAT_MESSAGES)],
+            messages=[],
+            instructions=CHAT_INSTRUCTIONS,
+        )
+
+    return Scenario("chat_turn", run, iterations=iterations)
+
+
+def chat_with_documents_scenario(iterations):
+    from app.bot_ai.bot_multi_model import VertexAImultimodel
+
+    vx_model = VertexAImultimodel()
+    chat, _ = vx_model.start_chat(
+        instructions=CHAT_INSTRUCTIONS,
+        company=BENCH_CUSTOMER_NAME,
+        document_list=FIXTURE_DOCUMENTS,
+    )
+    turn = itertools.count()
+
+    def run():
+        vx_model.generate_message_with_documents(
+            chat,
+            CHAT_MESSAGES[next(turn) % len(CHAT_MESSAGES)],
+            FIXTURE_DOCUMENTS,
+        )
+
+    return Scenario("chat_with_documents", run, iterations=iterations)
+
+
+def onboarding_scenario(iterations):
+    from app.bot_ai import utils
+
+    step = itertools.count()
+
+    def run():
+        index = next(step)
+        # Vary the inputs so the response cache does not short-circuit the flow
+        name = f"{ONBOARDING_NAMES[index % len(ONBOARDING_NAMES)]} {index}"
+        utils.onboarding_process_name(name)
+        utils.onboarding_process_name_confirmation(name)
+        utils.onboarding_process_city(f"{ONBOARDING_CITIES[index % len(ONBOARDING_CITIES)]} {index}")  # noqa: E501
+
+    return Scenario("onboarding_flow", run, iterations=iterations)
+
+
+def vector_search_scenario(fixtures, size, iterations):
+    from app.bot_ai.rag_txt import RAG_txt
+
+    rag = RAG_txt()
+    if hasattr(rag.embedding_model, "dimensions"):
+        rag.embedding_model.dimensions = fixtures.dimensions
+    vector_store = fixtures.vector_store(size)
+
+    def run():
+        rag.homemade_vector_search(
+            "¿Cuál es la política de devoluciones?",
+            vector_store,
+        )
+
+    return Scenario(f"vector_search_{size}", run, iterations=iterations)
+
+
+def pdf_extraction_scenario(iterations):
+    from app.bot_ai.file_extractor import PDFExtractor
+
+    def run():
+        extractor = PDFExtractor(BENCH_CUSTOMER_NAME, BENCH_CUSTOMER_ID)
+        extractor.extract_text_pdf()
+
+    return Scenario("pdf_extraction", run, iterations=iterations)
+
+
+def csv_ingestion_scenario(fixtures, iterations):
+    from app.bot_ai.tasks import from_csv_to_bigquery_table
+
+    def run():
+        from_csv_to_bigquery_table(BENCH_CUSTOMER_NAME, BENCH_CUSTOMER_ID)
+
+    return Scenario(
+        "csv_to_bigquery",
+        run,
+        setup=fixtures.reset_ingestion,
+        iterations=iterations,
+    )
+
+
+SCENARIOS = [
+    "chat_turn",
+    "chat_with_documents",
+    "onboarding_flow",
+    "vector_search",
+    "pdf_extraction",
+    "csv_to_bigquery",
+]
+
+
+def build_scenarios(fixtures, names, iterations, vector_sizes):
+    """
+    Builds the scenarios selected by name. The vector search and ingestion
+    scenarios use fewer iterations, since a single run is much longer.
+    """
+    builders = {
+        "chat_turn": lambda: [chat_turn_scenario(iterations)],
+        "chat_with_documents": lambda: [chat_with_documents_scenario(iterations)],
+        "onboarding_flow": lambda: [onboarding_scenario(iterations)],
+        # Built one at a time, so only one vector store is held in memory
+        "vector_search": lambda: (
+            vector_search_scenario(fixtures, size, max(3, iterations // 4))
+            for size in vector_sizes
+        ),
+        "pdf_extraction": lambda: [pdf_extraction_scenario(iterations)],
+        "csv_to_bigquery": lambda: [
+            csv_ingestion_scenario(fixtures, max(3, iterations // 4)),
+        ],
+    }
+    for name in names:
+        yield from builders[name]()
+
+
+def benchmark_settings():
+    """Returns the backend settings recorded next to the results."""
+    return {
+        "backend": getattr(settings, "BOT_AI_BACKEND", "vertex"),
+        "local": getattr(settings, "BOT_AI_LOCAL", {}),
+        "python": sys.version.split()[0],
+    }
@@ -1,11 +1,13 @@
 import logging
-import os
 
-from django.conf import settings
 from google.api_core.exceptions import Conflict
-from google.cloud import bigquery
-from google.oauth2 import service_account
 
+from app.bot_ai.clients import LOCATION
+from app.bot_ai.clients import PROJECT_ID
+from app.bot_ai.clients import get_credentials
+from app.bot_ai.clients import make_bigquery_client
+from app.bot_ai.instrumentation import current_record
+from app.bot_ai.instrumentation import instrumented
 from app.common.models import ErrorLogModel
 
 logger = logging.getLogger(__name__)
@@ -19,10 +21,10 @@ class GCPBigQuery:
 
     def __init__(self):
         """
-        Initializes the GCPBigQuery class with a BigQuery client and some default configurations for dataset, connection, and table IDs.
+        Initializes the GCPBigQuery class with a BigQuery client (or its local stand-in when `BOT_AI_BACKEND` is "local") and some default configurations for dataset, connection, and table IDs.
         """  # noqa: E501
         self.location = LOCATION
-        self.client = bigquery.Client()
+        self.client = make_bigquery_client()
 
         # Default dataset, connection, and table settings
         self.project_id = PROJECT_ID
@@ -30,6 +32,17 @@ class GCPBigQuery:
         self.model_type = "multimodalembedding"
         self.table_id = "store_embeddings"
 
+    def _query(self, query):
+        """
+        Runs a query and adds the bytes it processed to the current call metrics.
+        """
+        rows = self.client.query_and_wait(query)
+        record = current_record()
+        if record is not None:
+            record.bytes_in += getattr(rows, "total_bytes_processed", None) or 0
+        return rows
+
+    @instrumented("bigquery.create_a_dataset")
     def create_a_dataset(self, dataset_name):
         """
         Creates a BigQuery dataset with the specified dataset name.
@@ -40,6 +53,8 @@ class GCPBigQuery:
         Returns:
             bool or str: Returns True if the dataset was created successfully, 'exists' if it already exists, and False if an error occurred.
         """  # noqa: E501
+        from google.cloud import bigquery
+
         dataset_id = f"{self.client.project}.{dataset_name}"
         dataset = bigquery.Dataset(dataset_id)
         dataset.location = "US"
@@ -65,6 +80,7 @@ class GCPBigQuery:
             return False
         return True
 
+    @instrumented("bigquery.create_a_model_in_dataset")
     def create_a_model_in_dataset(self, dataset_name):
         """
         Creates or replaces a model within the dataset using a predefined connection. This model is of type 'multimodalembedding'.
@@ -74,8 +90,9 @@ class GCPBigQuery:
             REMOTE WITH CONNECTION `{self.connection_id}`
             OPTIONS(ENDPOINT = 'multimodalembedding@001');
         """
-        self.client.query_and_wait(query)  # Execute the query to create the model.
+        self._query(query)  # Execute the query to create the model.
 
+    @instrumented("bigquery.create_external_table")
     def create_external_table(self, dataset_name, files_list, files_table_name):
         """
         Creates or replaces an external table in BigQuery from a list of files.
@@ -93,12 +110,11 @@ class GCPBigQuery:
             uris = {files_list}
             );
         """  # noqa: E501
-        self.client.query_and_wait(
-            query,
-        )  # Execute the query to create the external table.
+        self._query(query)  # Execute the query to create the external table.
 
         return files_table_name
 
+    @instrumented("bigquery.generate_embeddings")
     def generate_embeddings(self, dataset_name, image_table_name, embb_table_name):
         """
         Generates embeddings from an external table using a machine learning model in BigQuery.
@@ -125,9 +141,10 @@ class GCPBigQuery:
             );
         """  # noqa: S608 , E501
 
-        self.client.query_and_wait(query)  # Execute the query to generate embeddings.
+        self._query(query)  # Execute the query to generate embeddings.
         return embb_table_name
 
+    @instrumented("bigquery.create_table_from_file")
     def create_table_from_file(self, folder_name, bucket_url, file_name):
         """
         Creates a BigQuery table by loading data from a file in Google Cloud Storage.
@@ -137,6 +154,8 @@ class GCPBigQuery:
             bucket_url (str): The URL of the file in Google Cloud Storage.
             file_name (str): The name of the file (table) in BigQuery.
         """
+        from google.cloud import bigquery
+
         table_id = f"{self.project_id}.{folder_name}.{file_name}"
 
         job_config = bigquery.LoadJobConfig(
@@ -151,7 +170,9 @@ class GCPBigQuery:
             job_config=job_config,
         )
         load_job.result()  # Wait for the job to complete.
+        current_record().bytes_in += load_job.input_file_bytes or 0
 
+    @instrumented("bigquery.delete_table")
     def delete_table(self, folder_name, file_name):
         """
         Deletes a table in BigQuery.
@@ -166,6 +187,7 @@ class GCPBigQuery:
             not_found_ok=True,
         )  # Delete the table if it exists.
 
+    @instrumented("bigquery.fuse_table_parts")
     def fuse_table_parts(self, fuse_query):
         """
         Executes a query to fuse (combine) multiple table parts into a single table in BigQuery.
@@ -176,11 +198,11 @@ class GCPBigQuery:
         query = rf"""
             {fuse_query}
         """
-        self.client.query_and_wait(query)  # Execute the query to fuse tables.
+        self._query(query)  # Execute the query to fuse tables.
 
 
-# Credentials and project configuration
-DIR_CREDENTIALS = settings.BASE_DIR / "clave.json"
-CREDENTIALS = service_account.Credentials.from_service_account_file(DIR_CREDENTIALS)
-PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT_ID")
-LOCATION = "us-central1"
+def __getattr__(name):
+    # Module-level CREDENTIALS is kept for callers, but read on first access
+    if name == "CREDENTIALS":
+        return get_credentials()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")  # noqa: EM102
@@ -1,23 +1,52 @@
+import asyncio
 import logging
 import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+
+from app.bot_ai.clients import LOCATION
+from app.bot_ai.clients import PROJECT_ID
+from app.bot_ai.clients import get_credentials
+from app.bot_ai.context_cache import document_context_cache
+from app.bot_ai.instrumentation import CallRecord
+from app.bot_ai.instrumentation import metrics
+from app.bot_ai.instrumentation import track
+from app.bot_ai.model_registry import model_registry
+from app.bot_ai.model_router import model_router
+from app.bot_ai.resilience import vertex_policy
+from app.bot_ai.response_cache import response_cache
+from app.bot_ai.token_budget import TokenBudget
+from app.bot_whatsapp.utils import render_message_txt
 
-import vertexai
-from django.conf import settings
+logger = logging.getLogger(__name__)
 
-# from google.auth2 import service_account  # noqa: ERA001
-from google.api_core.client_options import ClientOptions
-from google.cloud.speech_v2 import SpeechClient
-from google.cloud.speech_v2.types import cloud_speech
-from google.oauth2 import service_account
-from vertexai.generative_models import GenerativeModel
-from vertexai.generative_models import Part
-from vertexai.preview import generative_models
-from vertexai.preview.vision_models import Image
-from vertexai.preview.vision_models import ImageTextModel
+DEFAULT_CONCURRENCY = 10
 
-from app.bot_whatsapp.utils import render_message_txt
+# Documents already held in the cached context of each chat session
+CHAT_CACHED_DOCUMENTS = weakref.WeakKeyDictionary()
+# System instruction each chat session was started with
+CHAT_INSTRUCTIONS = weakref.WeakKeyDictionary()
 
-logger = logging.getLogger(__name__)
+
+@dataclass
+class StreamChunk:
+    """
+    A piece of a streamed reply.
+
+    Attributes:
+        text (str): The text delta received from the model.
+        usage (dict | None): The token usage of the whole reply. Only set on the
+            last chunk of the stream.
+    """
+
+    text: str = ""
+    usage: dict | None = None
+
+    @property
+    def done(self):
+        return self.usage is not None
 
 
 class VertexAImultimodel:
@@ -33,6 +62,8 @@ class VertexAImultimodel:
         prompt (str): The prompt to use for content generation.
         generation_config (dict): Configuration settings for content generation.
         safety_settings (dict): Safety settings to block harmful content.
+        token_budget (TokenBudget | None): Token budget of the chat prompts.
+        last_token_report (dict | None): Token numbers of the last request.
 
     Methods:
         read_instructions_from_file(file_name):
@@ -49,9 +80,17 @@ class VertexAImultimodel:
             Deletes the chat history.
         insert_chat_history(chat, posicion, message):
             Inserts a message at a specified position in the chat history.
+        trim_chat_history(chat, contents):
+            Drops the oldest turns so the next prompt fits in the token budget.
         generate_content():
             Generates content using the specified document and prompt.
-    """
+        agenerate_message(chat, message_text), agenerate_message_with_documents(...), ...:
+            Async counterparts of the generation methods.
+        agather(prompts, instruction, max_output_tokens, concurrency):
+            Generates responses for many prompts concurrently.
+        stream_message(chat, message_text), stream_message_with_documents(...):
+            Yields the reply as it is generated (`astream_*` for asyncio).
+    """  # noqa: E501
 
     def __init__(self, model_name: str | None = None):
         self.project_id = PROJECT_ID
@@ -68,6 +107,8 @@ class VertexAImultimodel:
             "top_p": self.top_p,
         }
 
+        from vertexai.preview import generative_models
+
         self.safety_settings = {
             generative_models.HarmCategory.HARM_CATEGORY_HATE_SPEECH: generative_models.HarmBlockThreshold.BLOCK_ONLY_HIGH,  # noqa: E501
             generative_models.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: generative_models.HarmBlockThreshold.BLOCK_ONLY_HIGH,  # noqa: E501
@@ -75,6 +116,28 @@ class VertexAImultimodel:
             generative_models.HarmCategory.HARM_CATEGORY_HARASSMENT: generative_models.HarmBlockThreshold.BLOCK_ONLY_HIGH,  # noqa: E501
         }
 
+        # Token budget for instruction + history + message, None disables trimming
+        self.token_budget = TokenBudget.from_settings()
+        self.last_token_report = None
+
+    @classmethod
+    def for_task(cls, task, input_chars=0, document_count=0, tenant=None):
+        """
+        Returns an instance whose model is picked by the model router.
+
+        Args:
+            task (str): The kind of request, e.g. "onboarding_validation",
+                "catalog_qa" or "video_description".
+            input_chars (int): The size of the text input.
+            document_count (int): The number of attached documents.
+            tenant (str, optional): The company the request belongs to.
+
+        Returns:
+            VertexAImultimodel: The instance bound to the routed model.
+        """
+        decision = model_router.route(task, input_chars, document_count, tenant)
+        return cls(model_name=decision.model_name)
+
     def read_instructions_from_file(self, file_name="instructions.txt"):
         """
         Reads instructions from a specified file.
@@ -88,8 +151,44 @@ class VertexAImultimodel:
         current_dir = os.path.dirname(os.path.abspath(__file__))  # noqa: PTH120, PTH100
         file_path = os.path.join(current_dir, file_name)  # noqa: PTH118
 
-        with open(file_path, encoding="utf-8") as file:  # noqa: PTH123
-            return file.read()
+        return model_registry.instructions.read(file_path)
+
+    def render_instructions(self, file_name="instruccion.txt"):
+        """
+        Renders an instruction template through `render_message_txt`, reusing the
+        rendered text until the template file changes on disk.
+
+        Args:
+            file_name (str): The name of the instruction template.
+
+        Returns:
+            str: The rendered instructions.
+        """
+        file_path = template_path(file_name)
+        if file_path is None:
+            return render_message_txt(file_name)
+
+        return model_registry.instructions.read(
+            file_path,
+            loader=lambda: render_message_txt(file_name),
+        )
+
+    def get_model(self, instructions, generation_config=None):
+        """
+        Returns the shared generative model for this instance's model name.
+
+        Args:
+            instructions (str | list): The system instruction of the model.
+            generation_config (dict, optional): The generation config of the model.
+
+        Returns:
+            GenerativeModel: The model from the process-wide registry.
+        """
+        return model_registry.get_model(
+            self.model_name,
+            system_instruction=instructions,
+            generation_config=generation_config,
+        )
 
     def file_type(self, file):  # noqa: PLR0911
         if file.endswith(".pdf"):
@@ -109,6 +208,8 @@ class VertexAImultimodel:
         return None
 
     def structure_files_url(self, files_url):
+        from vertexai.generative_models import Part
+
         structured_files_url = []
 
         for file in files_url:
@@ -130,35 +231,191 @@ class VertexAImultimodel:
         history: list | None = None,
         instructions=None,
         max_output_tokens=8192,
+        company=None,
+        document_list=None,
     ):
         """
         Starts a chat session with the specified model name.
 
         Args:
             model_name (str): The name of the model to use for the chat session.
+            company (str, optional): The company the documents belong to.
+            document_list (list[str], optional): gs:// URIs of documents to keep in a
+                Vertex cached context instead of attaching them on every turn.
 
         Returns:
             tuple: The chat session and the model.
         """
         if instructions is None:
-            instructions = render_message_txt("instruccion.txt")
+            instructions = self.render_instructions("instruccion.txt")
 
         if max_output_tokens is None:
             max_output_tokens = self.max_output_tokens
 
-        model = GenerativeModel(
-            self.model_name,
-            system_instruction=instructions,
-            generation_config={
-                "max_output_tokens": self.max_output_tokens,
-                "temperature": self.temperature,
-                "top_p": self.top_p,
-            },
-        )
+        if history and self.token_budget is not None:
+            history, self.last_token_report = self.token_budget.trim_history(
+                history,
+                system_instruction=instructions,
+            )
+
+        generation_config = {
+            "max_output_tokens": self.max_output_tokens,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+        }
+
+        if company and document_list:
+            model = self.get_cached_documents_model(
+                company,
+                document_list,
+                instructions,
+                generation_config=generation_config,
+            )
+            if model is not None:
+                chat = model.start_chat(history=history) if history else model.start_chat()
+                CHAT_CACHED_DOCUMENTS[chat] = frozenset(document_list)
+                CHAT_INSTRUCTIONS[chat] = instructions
+                return chat, self.model_name
+
+        model = self.get_model(instructions, generation_config=generation_config)
         chat = model.start_chat(history=history) if history else model.start_chat()
+        CHAT_INSTRUCTIONS[chat] = instructions
 
         return chat, self.model_name
 
+    def trim_chat_history(self, chat, contents=None):
+        """
+        Drops the oldest turns of a chat session so the next prompt fits in the
+        token budget. The newest turns are always kept.
+
+        Args:
+            chat (object): The chat session.
+            contents (list, optional): The contents about to be sent.
+
+        Returns:
+            dict | None: The token numbers of the prompt, or None if no budget is set.
+        """  # noqa: E501
+        if self.token_budget is None:
+            return None
+
+        history, report = self.token_budget.trim_history(
+            chat.history,
+            system_instruction=CHAT_INSTRUCTIONS.get(chat),
+            message=contents,
+        )
+        if report["dropped_turns"]:
+            chat.history[:] = history
+            logger.info(
+                f"Dropped {report['dropped_turns']} turns to fit {report['budget']} tokens",  # noqa: E501, G004
+            )
+
+        self.last_token_report = report
+        return report
+
+    def _send_message(self, chat, contents, stream=False):
+        """
+        Sends the contents of a turn, trimming the history to the token budget first.
+        """  # noqa: E501
+        self.trim_chat_history(chat, contents)
+        response = self._call(
+            chat.send_message,
+            contents,
+            safety_settings=self.safety_settings,
+            stream=stream,
+            idempotent=False,
+        )
+        if not stream:
+            self._record_usage(response.usage_metadata)
+        return response
+
+    async def _asend_message(self, chat, contents, stream=False):
+        """
+        Async counterpart of `_send_message`.
+        """
+        self.trim_chat_history(chat, contents)
+        response = await self._acall(
+            chat.send_message_async,
+            contents,
+            safety_settings=self.safety_settings,
+            stream=stream,
+            idempotent=False,
+        )
+        if not stream:
+            self._record_usage(response.usage_metadata)
+        return response
+
+    def _call(self, func, *args, **kwargs):
+        """
+        Runs a Vertex call under the resilience policy and records its latency
+        for the model router and the call metrics.
+        """
+        with track("vertex.generate", model=self.model_name) as record:
+            started = time.monotonic()
+            response = vertex_policy.call(func, *args, **kwargs)
+            if not kwargs.get("stream"):
+                model_router.observe(self.model_name, time.monotonic() - started)
+                record.add_usage(getattr(response, "usage_metadata", None))
+        return response
+
+    async def _acall(self, func, *args, **kwargs):
+        """
+        Async counterpart of `_call`.
+        """
+        with track("vertex.generate", model=self.model_name) as record:
+            started = time.monotonic()
+            response = await vertex_policy.acall(func, *args, **kwargs)
+            if not kwargs.get("stream"):
+                model_router.observe(self.model_name, time.monotonic() - started)
+                record.add_usage(getattr(response, "usage_metadata", None))
+        return response
+
+    def _record_usage(self, usage_metadata):
+        """
+        Adds the token usage reported by Vertex to the report of the last request.
+        """
+        if self.last_token_report is None:
+            self.last_token_report = {}
+        self.last_token_report["usage"] = self._usage_dict(usage_metadata)
+
+    def get_cached_documents_model(
+        self,
+        company,
+        document_list,
+        instructions,
+        generation_config=None,
+    ):
+        """
+        Returns a model bound to a Vertex cached context holding the documents.
+
+        Args:
+            company (str): The company the documents belong to.
+            document_list (list[str]): The gs:// URIs of the documents.
+            instructions (str | list): The system instruction of the model.
+            generation_config (dict, optional): The generation config of the model.
+
+        Returns:
+            GenerativeModel | None: The model, or None if the documents cannot be cached.
+        """  # noqa: E501
+        return document_context_cache.get_model(
+            company,
+            document_list,
+            self.model_name,
+            instructions,
+            self.structure_files_url(document_list),
+            generation_config=generation_config,
+        )
+
+    def _documents_and_message(self, chat, document_list, message_text):
+        """
+        Builds the contents of a turn, leaving out the documents that are already
+        held in the cached context of the chat session.
+        """
+        cached = CHAT_CACHED_DOCUMENTS.get(chat, frozenset())
+        documents = [
+            doc for doc in document_list if not (isinstance(doc, str) and doc in cached)
+        ]
+        return [*documents, message_text]
+
     def generate_message(self, chat, message_text):
         """
         Generates a message in a chat session.
@@ -170,9 +427,9 @@ class VertexAImultimodel:
         Returns:
             str: The generated message text.
         """
-        message = chat.send_message(
+        message = self._send_message(
+            chat,
             [message_text],
-            safety_settings=self.safety_settings,
         )
         return message.text
 
@@ -187,9 +444,9 @@ class VertexAImultimodel:
         Returns:
             str: The generated message text.
         """
-        generated_content = chat.send_message(
+        generated_content = self._send_message(
+            chat,
             [message_text],
-            safety_settings=self.safety_settings,
         )
         return generated_content.text
 
@@ -205,13 +462,146 @@ class VertexAImultimodel:
         Returns:
             str: The generated message text.
         """
-        documents_and_message = [*document_list, message_text]
-        message = chat.send_message(
+        documents_and_message = self._documents_and_message(
+            chat,
+            document_list,
+            message_text,
+        )
+        message = self._send_message(
+            chat,
             documents_and_message,
-            safety_settings=self.safety_settings,
         )
         return message.text
 
+    def stream_message(self, chat, message_text):
+        """
+        Sends a message in a chat session and yields the reply as it is generated.
+
+        Args:
+            chat (object): The chat session.
+            message_text (str): The message text to send.
+
+        Yields:
+            StreamChunk: The text deltas, followed by a last chunk with the usage.
+        """
+        responses = self._send_message(
+            chat,
+            [message_text],
+            stream=True,
+        )
+        yield from self._iter_stream(responses)
+
+    def stream_message_with_documents(self, chat, message_text, document_list):
+        """
+        Sends a message with documents in a chat session and yields the reply as
+        it is generated.
+
+        Args:
+            chat (object): The chat session.
+            message_text (str): The message text to send.
+            document_list (list): The list of documents to include.
+
+        Yields:
+            StreamChunk: The text deltas, followed by a last chunk with the usage.
+        """
+        responses = self._send_message(
+            chat,
+            self._documents_and_message(chat, document_list, message_text),
+            stream=True,
+        )
+        yield from self._iter_stream(responses)
+
+    async def astream_message(self, chat, message_text):
+        """
+        Async counterpart of `stream_message`.
+
+        Args:
+            chat (object): The chat session.
+            message_text (str): The message text to send.
+
+        Yields:
+            StreamChunk: The text deltas, followed by a last chunk with the usage.
+        """
+        responses = await self._asend_message(
+            chat,
+            [message_text],
+            stream=True,
+        )
+        async for chunk in self._aiter_stream(responses):
+            yield chunk
+
+    async def astream_message_with_documents(self, chat, message_text, document_list):
+        """
+        Async counterpart of `stream_message_with_documents`.
+
+        Args:
+            chat (object): The chat session.
+            message_text (str): The message text to send.
+            document_list (list): The list of documents to include.
+
+        Yields:
+            StreamChunk: The text deltas, followed by a last chunk with the usage.
+        """
+        responses = await self._asend_message(
+            chat,
+            self._documents_and_message(chat, document_list, message_text),
+            stream=True,
+        )
+        async for chunk in self._aiter_stream(responses):
+            yield chunk
+
+    def _iter_stream(self, responses):
+        # Streams are recorded when they finish, since the caller consumes them
+        # outside of the `_call` block
+        record = CallRecord("vertex.stream", labels={"model": self.model_name})
+        started = time.perf_counter()
+        usage = None
+        for response in responses:
+            usage = response.usage_metadata or usage
+            text = self._chunk_text(response)
+            if text:
+                yield StreamChunk(text=text)
+        self._record_usage(usage)
+        record.add_usage(usage)
+        record.seconds = time.perf_counter() - started
+        metrics.emit(record)
+        yield StreamChunk(usage=self._usage_dict(usage))
+
+    async def _aiter_stream(self, responses):
+        record = CallRecord("vertex.stream", labels={"model": self.model_name})
+        started = time.perf_counter()
+        usage = None
+        async for response in responses:
+            usage = response.usage_metadata or usage
+            text = self._chunk_text(response)
+            if text:
+                yield StreamChunk(text=text)
+        self._record_usage(usage)
+        record.add_usage(usage)
+        record.seconds = time.perf_counter() - started
+        metrics.emit(record)
+        yield StreamChunk(usage=self._usage_dict(usage))
+
+    def _chunk_text(self, response):
+        try:
+            return response.text
+        except ValueError:
+            # The chunk has no text part, e.g. it only carries the finish reason
+            return ""
+
+    def _usage_dict(self, usage_metadata):
+        if usage_metadata is None:
+            return {
+                "prompt_token_count": 0,
+                "candidates_token_count": 0,
+                "total_token_count": 0,
+            }
+        return {
+            "prompt_token_count": usage_metadata.prompt_token_count,
+            "candidates_token_count": usage_metadata.candidates_token_count,
+            "total_token_count": usage_metadata.total_token_count,
+        }
+
     def use_txt_in_bucket(self, uri):
         """
         Uses a text file from a specified URI.
@@ -222,6 +612,8 @@ class VertexAImultimodel:
         Returns:
             Part: The part object created from the URI.
         """
+        from vertexai.generative_models import Part
+
         return Part.from_uri(
             mime_type="text/plain",
             uri=uri,
@@ -244,12 +636,12 @@ class VertexAImultimodel:
         )
 
         video_part = self.use_video_in_bucket(video_uri)
-        message = chat.send_message(
+        responses = self._send_message(
+            chat,
             [prompt, video_part],
-            safety_settings=self.safety_settings,
             stream=True,
         )
-        return message.text
+        return "".join(chunk.text for chunk in self._iter_stream(responses))
 
     def use_video_in_bucket(self, uri):
         """
@@ -261,6 +653,8 @@ class VertexAImultimodel:
         Returns:
             Part: The part object created from the URI.
         """
+        from vertexai.generative_models import Part
+
         return Part.from_uri(
             mime_type="video/mp4",
             uri=uri,
@@ -286,18 +680,47 @@ class VertexAImultimodel:
         """
         chat.history.insert(posicion, message)
 
-    def generate_message_without_history(self, message_text, document_list: list[str]):
+    def generate_message_without_history(
+        self,
+        message_text,
+        document_list: list[str],
+        company=None,
+    ):
         """
         Generates a message in a chat session with documents.
 
         Args:
             message_text (str): The message text to send.
             document_list (list): The list of documents to include.
+            company (str, optional): The company the documents belong to. When given,
+                the documents are served from a Vertex cached context.
 
         Returns:
             str: The generated message text.
         """
 
+        model, contents = self._prepare_without_history(
+            message_text,
+            document_list,
+            company,
+        )
+
+        responses = self._call(
+            model.generate_content,
+            contents,
+            safety_settings=self.safety_settings,
+            hedge=True,
+        )
+
+        return self._response_text(responses)
+
+    def _prepare_without_history(self, message_text, document_list, company=None):
+        """
+        Builds the model and the request contents shared by the sync and async
+        variants of `generate_message_without_history`.
+        """
+        from vertexai.generative_models import Part
+
         if not message_text:
             error = "message_text must not be empty."
             raise ValueError(error)
@@ -319,27 +742,37 @@ class VertexAImultimodel:
             err = "document_list must contain at least one valid document URI."
             raise ValueError(err)
 
-        # Crear el modelo generativo
-        model = GenerativeModel(
-            self.model_name,
-            system_instruction=[instructions],
-        )
-
-        responses = model.generate_content(
-            [*files, message_text],
-            safety_settings=self.safety_settings,
-        )
-
+        # Usar el contexto en caché de los documentos de la empresa si existe
+        if company:
+            uris = [doc for doc in document_list if doc]
+            model = document_context_cache.get_model(
+                company,
+                uris,
+                self.model_name,
+                [instructions],
+                files,
+            )
+            if model is not None:
+                return model, [message_text]
+
+        # Obtener el modelo generativo compartido
+        model = self.get_model([instructions])
+
+        return model, [*files, message_text]
+
+    def _response_text(self, responses):
+        """
+        Joins the text of a response or of a list of responses.
+        """
         response_text = ""
         # Check if 'responses' is a single instance or a list
         if isinstance(responses, list):
-            # If it's a single object, append the text
+            # If it's a list, iterate over the elements
             for response in responses:
                 response_text += response.text
         else:
-            # If it's a list, iterate over the elements
+            # If it's a single object, append the text
             response_text += responses.text  # type: ignore  # noqa: PGH003
-        # Generar el contenido
 
         return response_text
 
@@ -348,6 +781,7 @@ class VertexAImultimodel:
         prompt,
         instruction=None,
         max_output_tokens=None,
+        use_cache=True,
     ):
         """
         Generates a response from a generative AI model without considering history or external files.
@@ -358,63 +792,522 @@ class VertexAImultimodel:
                 If not provided, it defaults to instructions loaded from "instruccion.txt".
             max_output_tokens (int, optional): The maximum number of tokens the response can have.
                 Defaults to the instance's `max_output_tokens` attribute.
+            use_cache (bool, optional): Whether to look up and store the response in the
+                exact-match response cache. Defaults to True.
 
         Returns:
             str: The generated response text.
 
         Process:
-            1. Loads the default or custom instructions using `render_message_txt`.
-            2. Configures the generative model with the given instructions and settings.
-            3. Generates content based on the provided prompt.
-            4. Returns the response text.
+            1. Loads the default or custom instructions using `render_message_txt`,
+               reusing the text until the template file changes.
+            2. Gets the generative model with the given instructions and settings.
+            3. Returns the cached response if the same request was answered before.
+            4. Generates content based on the provided prompt and caches it.
+            5. Returns the response text.
 
         Variables:
             instruction (str): The processed instruction text.
             max_output_tokens (int): The limit for response token length.
-            model (GenerativeModel): An instance of the generative AI model initialized with the system instructions.
+            model (GenerativeModel): The shared generative AI model for the system instructions.
             response (object): The model's response object containing the generated text.
 
         Raises:
             Exception: If the generative model fails or if the required components are not properly configured.
         """  # noqa: E501
+        model, contents, generation_config, cache_key = (
+            self._prepare_without_history_and_files(prompt, instruction, max_output_tokens)
+        )
+
+        if use_cache:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        response = self._call(
+            model.generate_content,
+            contents,
+            generation_config=generation_config,
+            safety_settings=self.safety_settings,
+            hedge=True,
+        )
+
+        if use_cache:
+            response_cache.set(cache_key, response.text)
+
+        return response.text
+
+    def _prepare_without_history_and_files(
+        self,
+        prompt,
+        instruction=None,
+        max_output_tokens=None,
+    ):
+        """
+        Builds the model, the request contents, the generation config and the
+        response cache key shared by the sync and async variants of
+        `generate_message_without_history_and_files`.
+        """
         if instruction is None:
-            instruction = render_message_txt("instruccion.txt")
+            instruction = self.render_instructions("instruccion.txt")
         else:
-            instruction = render_message_txt(instruction)
+            instruction = self.render_instructions(instruction)
 
         if max_output_tokens is None:
             max_output_tokens = self.max_output_tokens
 
-        model = GenerativeModel(
+        model = self.get_model([instruction])
+
+        generation_config = {
+            "max_output_tokens": self.max_output_tokens,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+        }
+
+        cache_key = response_cache.make_key(
             self.model_name,
-            system_instruction=[instruction],
+            instruction,
+            prompt,
+            generation_config,
+        )
+
+        return model, [f"""{prompt}"""], generation_config, cache_key
+
+    def generate_structured_message(
+        self,
+        prompt,
+        response_model,
+        instruction,
+        max_output_tokens=None,
+        use_cache=True,
+    ):
+        """
+        Generates an answer that follows the schema of a pydantic model, using
+        the JSON mode of Gemini (`response_schema`) instead of format
+        instructions in the prompt.
+
+        Args:
+            prompt (str): The main input message or query for the AI model.
+            response_model (type[BaseModel]): The schema of the answer.
+            instruction (str): The raw system instruction.
+            max_output_tokens (int, optional): The maximum number of tokens of the answer.
+            use_cache (bool, optional): Whether to use the exact-match response cache.
+
+        Returns:
+            BaseModel: The answer, validated by `response_model`.
+
+        Raises:
+            pydantic.ValidationError: If the answer does not follow the schema.
+        """  # noqa: E501
+        model, generation_config, cache_key = self._prepare_structured(
+            prompt,
+            response_model,
+            instruction,
+            max_output_tokens,
+        )
+
+        if use_cache:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return response_model.model_validate_json(cached)
+
+        response = self._call(
+            model.generate_content,
+            [prompt],
+            generation_config=generation_config,
+            safety_settings=self.safety_settings,
+            hedge=True,
+        )
+        result = response_model.model_validate_json(response.text)
+
+        if use_cache:
+            response_cache.set(cache_key, response.text)
+
+        return result
+
+    def _prepare_structured(self, prompt, response_model, instruction, max_output_tokens):
+        """
+        Builds the model, the JSON mode generation config and the response
+        cache key shared by the sync and async structured generation.
+        """
+        from vertexai.generative_models import GenerationConfig
+
+        schema = pydantic_response_schema(response_model)
+        config = {
+            "max_output_tokens": max_output_tokens or self.max_output_tokens,
+            "temperature": 0,
+            "top_p": self.top_p,
+            "response_mime_type": "application/json",
+            "response_schema": schema,
+        }
+        cache_key = response_cache.make_key(self.model_name, instruction, prompt, config)
+        return self.get_model([instruction]), GenerationConfig(**config), cache_key
+
+    async def agenerate_message(self, chat, message_text):
+        """
+        Async counterpart of `generate_message`.
+
+        Args:
+            chat (object): The chat session.
+            message_text (str): The message text to send.
+
+        Returns:
+            str: The generated message text.
+        """
+        message = await self._asend_message(
+            chat,
+            [message_text],
+        )
+        return message.text
+
+    async def agenerate_message_information(self, chat, message_text):
+        """
+        Async counterpart of `generate_message_information`.
+
+        Args:
+            chat (object): The chat session.
+            message_text (str): The message text to send.
+
+        Returns:
+            str: The generated message text.
+        """
+        generated_content = await self._asend_message(
+            chat,
+            [message_text],
+        )
+        return generated_content.text
+
+    async def agenerate_message_with_documents(self, chat, message_text, document_list):
+        """
+        Async counterpart of `generate_message_with_documents`.
+
+        Args:
+            chat (object): The chat session.
+            message_text (str): The message text to send.
+            document_list (list): The list of documents to include.
+
+        Returns:
+            str: The generated message text.
+        """
+        documents_and_message = self._documents_and_message(
+            chat,
+            document_list,
+            message_text,
+        )
+        message = await self._asend_message(
+            chat,
+            documents_and_message,
+        )
+        return message.text
+
+    async def agenerate_message_with_video(self, chat, video_uri):
+        """
+        Async counterpart of `generate_message_with_video`.
+
+        Args:
+            chat (object): The chat session.
+            video_uri (str): The URI of the video file.
+
+        Returns:
+            str: The generated message text.
+        """
+        prompt = (
+            "Provide a description of the video. And what kind of product do you see"
+        )
+
+        video_part = self.use_video_in_bucket(video_uri)
+        message = await self._asend_message(
+            chat,
+            [prompt, video_part],
+        )
+        return message.text
+
+    async def agenerate_message_without_history(
+        self,
+        message_text,
+        document_list: list[str],
+        company=None,
+    ):
+        """
+        Async counterpart of `generate_message_without_history`.
+
+        Args:
+            message_text (str): The message text to send.
+            document_list (list): The list of documents to include.
+            company (str, optional): The company the documents belong to.
+
+        Returns:
+            str: The generated message text.
+        """
+        model, contents = self._prepare_without_history(
+            message_text,
+            document_list,
+            company,
         )
 
-        response = model.generate_content(
-            [f"""{prompt}"""],
-            generation_config={
-                "max_output_tokens": self.max_output_tokens,
-                "temperature": self.temperature,
-                "top_p": self.top_p,
-            },
+        responses = await self._acall(
+            model.generate_content_async,
+            contents,
             safety_settings=self.safety_settings,
+            hedge=True,
         )
 
+        return self._response_text(responses)
+
+    async def agenerate_message_without_history_and_files(
+        self,
+        prompt,
+        instruction=None,
+        max_output_tokens=None,
+        use_cache=True,
+    ):
+        """
+        Async counterpart of `generate_message_without_history_and_files`.
+
+        Args:
+            prompt (str): The main input message or query for the AI model.
+            instruction (str, optional): A path to a custom instruction file or raw instructions.
+            max_output_tokens (int, optional): The maximum number of tokens the response can have.
+            use_cache (bool, optional): Whether to use the exact-match response cache.
+
+        Returns:
+            str: The generated response text.
+        """  # noqa: E501
+        model, contents, generation_config, cache_key = (
+            self._prepare_without_history_and_files(prompt, instruction, max_output_tokens)
+        )
+
+        if use_cache:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        response = await self._acall(
+            model.generate_content_async,
+            contents,
+            generation_config=generation_config,
+            safety_settings=self.safety_settings,
+            hedge=True,
+        )
+
+        if use_cache:
+            response_cache.set(cache_key, response.text)
+
         return response.text
 
+    async def agenerate_structured_message(
+        self,
+        prompt,
+        response_model,
+        instruction,
+        max_output_tokens=None,
+        use_cache=True,
+    ):
+        """
+        Async counterpart of `generate_structured_message`.
+        """
+        model, generation_config, cache_key = self._prepare_structured(
+            prompt,
+            response_model,
+            instruction,
+            max_output_tokens,
+        )
+
+        if use_cache:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return response_model.model_validate_json(cached)
+
+        response = await self._acall(
+            model.generate_content_async,
+            [prompt],
+            generation_config=generation_config,
+            safety_settings=self.safety_settings,
+            hedge=True,
+        )
+        result = response_model.model_validate_json(response.text)
+
+        if use_cache:
+            response_cache.set(cache_key, response.text)
+
+        return result
+
+    async def agather(
+        self,
+        prompts,
+        instruction=None,
+        max_output_tokens=None,
+        concurrency=DEFAULT_CONCURRENCY,
+    ):
+        """
+        Generates a response for every prompt concurrently, with at most
+        `concurrency` requests in flight at the same time.
+
+        Args:
+            prompts (list[str]): The prompts to send.
+            instruction (str, optional): A path to a custom instruction file or raw instructions.
+            max_output_tokens (int, optional): The maximum number of tokens of each response.
+            concurrency (int): The maximum number of simultaneous requests.
+
+        Returns:
+            list: The responses, in the same order as `prompts`. A failed prompt
+            returns its exception instead of a text.
+        """  # noqa: E501
+        return await agather(
+            (
+                self.agenerate_message_without_history_and_files(
+                    prompt,
+                    instruction,
+                    max_output_tokens,
+                )
+                for prompt in prompts
+            ),
+            concurrency=concurrency,
+        )
+
+
+async def agather(awaitables, concurrency=DEFAULT_CONCURRENCY, return_exceptions=True):
+    """
+    Awaits every awaitable with at most `concurrency` of them running at once.
+
+    Args:
+        awaitables (Iterable[Awaitable]): The awaitables to run.
+        concurrency (int): The maximum number of awaitables running at the same time.
+        return_exceptions (bool): Whether to return exceptions as results instead of
+            raising the first one.
+
+    Returns:
+        list: The results, in the same order as `awaitables`.
+    """
+    if concurrency < 1:
+        error = "concurrency must be at least one."
+        raise ValueError(error)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(awaitable):
+        async with semaphore:
+            return await awaitable
+
+    return await asyncio.gather(
+        *(run(awaitable) for awaitable in awaitables),
+        return_exceptions=return_exceptions,
+    )
+
+
+# JSON schema keywords that the Gemini response schema does not accept
+UNSUPPORTED_SCHEMA_KEYS = {"title", "default", "$defs", "additionalProperties", "format"}
+
+
+def pydantic_response_schema(response_model):
+    """
+    Converts the JSON schema of a pydantic model into the OpenAPI subset
+    accepted as `response_schema`: references are inlined and optional
+    fields become ``nullable``.
 
-DIR_CREDENTIALS = settings.BASE_DIR / "clave.json"
-CREDENTIALS = service_account.Credentials.from_service_account_file(DIR_CREDENTIALS)
+    Args:
+        response_model (type[BaseModel]): The pydantic model.
+
+    Returns:
+        dict: The response schema.
+    """
+    schema = response_model.model_json_schema()
+    definitions = schema.get("$defs", {})
+
+    def convert(node):
+        if "$ref" in node:
+            reference = definitions[node["$ref"].rsplit("/", 1)[-1]]
+            node = {**reference, **{k: v for k, v in node.items() if k != "$ref"}}
+
+        options = node.get("anyOf")
+        if options:
+            not_null = [option for option in options if option.get("type") != "null"]
+            if len(not_null) == 1:
+                rest = {k: v for k, v in node.items() if k != "anyOf"}
+                result = convert({**not_null[0], **rest})
+                if len(not_null) < len(options):
+                    result["nullable"] = True
+                return result
+
+        result = {}
+        if node.get("format") == "date":
+            # Without the format keyword the model needs the layout spelled out
+            description = node.get("description", "")
+            node = {**node, "description": f"{description} (YYYY-MM-DD)".strip()}
+        for key, value in node.items():
+            if key in UNSUPPORTED_SCHEMA_KEYS:
+                continue
+            if key == "properties":
+                result[key] = {name: convert(item) for name, item in value.items()}
+            elif key == "items":
+                result[key] = convert(value)
+            elif key == "anyOf":
+                result[key] = [convert(option) for option in value]
+            else:
+                result[key] = value
+        return result
 
-PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT_ID")
-LOCATION = "us-central1"
+    return convert(schema)
 
 
 GEMINI_MODEL_ID_1_5 = "gemini-1.5-flash-001"
 MODEL_META = ' "gemini-1.5-pro-001"'
 MODEL_VERTEX = "gemini-1.5-pro-001"
-# vertexai.init(project=PROJECT_ID, location=LOCATION, credentials=CREDENTIALS)  # noqa: ERA001,E501
-vertexai.init(project=PROJECT_ID, location=LOCATION)
+
+
+def __getattr__(name):
+    # Module-level CREDENTIALS is kept for callers, but read on first access
+    if name == "CREDENTIALS":
+        return get_credentials()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")  # noqa: EM102
+
+
+_template_paths = {}
+_template_paths_lock = threading.Lock()
+
+
+def template_path(file_name):
+    """
+    Returns the absolute path of an instruction template, or None when the
+    template engine cannot resolve it to a file.
+
+    The resolved path is reused while the file keeps its mtime, so the
+    template loaders only run again after the file changes or disappears.
+    """
+    with _template_paths_lock:
+        entry = _template_paths.get(file_name)
+    if entry is not None:
+        file_path, mtime = entry
+        try:
+            if os.stat(file_path).st_mtime_ns == mtime:  # noqa: PTH116
+                return file_path
+        except OSError:
+            pass
+
+    file_path = resolve_template_path(file_name)
+    with _template_paths_lock:
+        if file_path is None:
+            _template_paths.pop(file_name, None)
+        else:
+            mtime = os.stat(file_path).st_mtime_ns  # noqa: PTH116
+            _template_paths[file_name] = (file_path, mtime)
+    return file_path
+
+
+def resolve_template_path(file_name):
+    """Resolves an instruction template to a file with the template loaders."""
+    from django.template import TemplateDoesNotExist
+    from django.template.loader import get_template
+
+    try:
+        origin = get_template(file_name).origin
+    except TemplateDoesNotExist:
+        return None
+
+    file_path = getattr(origin, "name", None)
+    if file_path is None or not os.path.isfile(file_path):  # noqa: PTH113
+        return None
+    return file_path
 
 
 class VertexBot:
@@ -430,7 +1323,7 @@ class VertexBot:
     """
 
     def __init__(self, model_name=GEMINI_MODEL_ID_1_5):
-        self.model = GenerativeModel(model_name=model_name)
+        self.model = model_registry.get_model(model_name)
 
     def generate_response(self, prompt):
         """
@@ -442,7 +1335,7 @@ class VertexBot:
         Returns:
             str: The generated response.
         """
-        response = self.model.generate_content(prompt)
+        response = vertex_policy.call(self.model.generate_content, prompt, hedge=True)
         return response.text  # type: ignore  # noqa: PGH003
 
 
@@ -454,62 +1347,33 @@ def transcribe_chirp_auto_detect_language(
     """Transcribe an audio file and auto-detect spoken language using Chirp.
 
     Please see https://cloud.google.com/speech-to-text/v2/docs/encoding for more
-    information on which audio encodings are supported.
+    information on which audio encodings are supported. Audio longer than the
+    synchronous limit is split on silences and transcribed in parallel.
     """
-    # Instantiates a client
-    client = SpeechClient(
-        client_options=ClientOptions(
-            api_endpoint=f"{region}-speech.googleapis.com",
-        ),
-        credentials=CREDENTIALS,
-    )
-
-    # Reads a file as bytes
-    with open(audio_file, "rb") as f:  # noqa: PTH123
-        content = f.read()
-
-    config = cloud_speech.RecognitionConfig(
-        auto_decoding_config=cloud_speech.AutoDetectDecodingConfig(),
-        language_codes=["auto"],  # Set language code to auto to detect language.
-        model="chirp",
-    )
+    from app.bot_ai.transcription import get_transcription_service
 
-    request = cloud_speech.RecognizeRequest(
-        recognizer=f"projects/{project_id}/locations/{region}/recognizers/_",
-        config=config,
-        content=content,
-    )
-
-    # Transcribes the audio into text
-    response = client.recognize(request=request)
-    all_transcripts = ""
-
-    for result in response.results:
-        logger.info(f"Transcript: {result.alternatives[0].transcript}")  # noqa: G004
-        logger.info(f"Detected Language: {result.language_code}")  # noqa: G004
-        all_transcripts += result.alternatives[0].transcript
-
-    return all_transcripts
+    service = get_transcription_service(project_id=project_id, region=region)
+    return service.transcribe(audio_file).text
 
 
 def get_short_form_image_captions(
     input_file: str,
-    project_id: str = PROJECT_ID,  # type: ignore  # noqa: PGH003
-    location: str = "us-central1",
+    project_id: str = PROJECT_ID,  # type: ignore  # noqa: ARG001, PGH003
+    location: str = "us-central1",  # noqa: ARG001
 ) -> list:
     """Get short-form captions for a local image.
     Args:
-      project_id: Google Cloud project ID, used to initialize Vertex AI.
-      location: Google Cloud region, used to initialize Vertex AI.
-      input_file: Local path to the input image file."""
-
-    vertexai.init(project=project_id, location=location, credentials=CREDENTIALS)
+      project_id: Unused, kept for compatibility. Vertex AI is initialized once
+        per process with the project settings.
+      location: Unused, kept for compatibility.
+      input_file: Local path to the input image file.
 
-    model = ImageTextModel.from_pretrained("imagetext@001")
-    source_img = Image.load_from_file(location=input_file)
+    The model is shared through the captioning service, which also caches the
+    captions of duplicate images."""
+    from app.bot_ai.captioning import get_captioning_service
 
-    return model.get_captions(
-        image=source_img,
+    return get_captioning_service().caption(
+        input_file,
         # Optional parameters
         language="en",
         number_of_results=1,
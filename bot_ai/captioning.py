@@ -0,0 +1,211 @@
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from app.bot_ai.clients import init_vertexai
+from app.bot_ai.disk_cache import build_disk_cache
+from app.bot_ai.resilience import vertex_policy
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "imagetext@001"
+DEFAULT_MAX_SIDE = 1024
+DEFAULT_MAX_BYTES = 1024 * 1024
+DEFAULT_CONCURRENCY = 4
+DEFAULT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+
+def load_image_bytes(image):
+    """
+    Returns the bytes of an image given as a path or as bytes.
+    """
+    if isinstance(image, bytes | bytearray):
+        return bytes(image)
+    with open(image, "rb") as file:  # noqa: PTH123
+        return file.read()
+
+
+class ImageCaptioningService:
+    """
+    Captions images with the Vertex image-text model.
+
+    The model is loaded once per process. Images larger than `max_side` pixels
+    or `max_bytes` bytes are downscaled and re-encoded as JPEG before upload,
+    and captions are cached by the SHA-256 digest of the uploaded bytes, so
+    duplicate catalog photos are only sent once. A perceptual hash is not
+    used: color variants of the same shot share it, and would get each
+    other's captions.
+
+    Methods:
+        caption(image, language="en", number_of_results=1):
+            Returns the captions of one image.
+        caption_batch(images, language="en", number_of_results=1):
+            Returns the captions of several images, in input order.
+        prepare(image):
+            Returns the upload bytes and the digest of an image.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        model_name=DEFAULT_MODEL,
+        max_side=DEFAULT_MAX_SIDE,
+        max_bytes=DEFAULT_MAX_BYTES,
+        concurrency=DEFAULT_CONCURRENCY,
+        cache=None,
+        policy=vertex_policy,
+    ):
+        self.model_name = model_name
+        self.max_side = max_side
+        self.max_bytes = max_bytes
+        self.concurrency = concurrency
+        self.cache = cache
+        self.policy = policy
+        self._model = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Builds the service from the `BOT_AI_CAPTIONING` setting. Supported keys:
+        ``MODEL``, ``MAX_SIDE``, ``MAX_BYTES``, ``CONCURRENCY``, ``CACHE``
+        (defaults to True) and ``CACHE_MAX_BYTES``.
+        """
+        config = getattr(settings, "BOT_AI_CAPTIONING", {})
+        cache = None
+        if config.get("CACHE", True):
+            cache = build_disk_cache(
+                "captions",
+                max_bytes=config.get("CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES),
+            )
+        return cls(
+            model_name=config.get("MODEL", DEFAULT_MODEL),
+            max_side=config.get("MAX_SIDE", DEFAULT_MAX_SIDE),
+            max_bytes=config.get("MAX_BYTES", DEFAULT_MAX_BYTES),
+            concurrency=config.get("CONCURRENCY", DEFAULT_CONCURRENCY),
+            cache=cache,
+        )
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    init_vertexai()
+                    from vertexai.preview.vision_models import ImageTextModel
+
+                    self._model = ImageTextModel.from_pretrained(self.model_name)
+                    logger.info(f"Loaded image captioning model {self.model_name}")  # noqa: G004
+        return self._model
+
+    def prepare(self, image):
+        """
+        Returns the bytes to upload for an image and their SHA-256 digest.
+
+        Args:
+            image (str | bytes): Path of the image, or its bytes.
+
+        Returns:
+            tuple[bytes, str]: The (possibly downscaled) image bytes and the
+            hex digest of those bytes.
+        """
+        from PIL import Image as PILImage
+
+        content = load_image_bytes(image)
+        pil_image = PILImage.open(io.BytesIO(content))
+
+        if max(pil_image.size) > self.max_side or len(content) > self.max_bytes:
+            pil_image = pil_image.convert("RGB")
+            pil_image.thumbnail((self.max_side, self.max_side))
+            buffer = io.BytesIO()
+            pil_image.save(buffer, format="JPEG", quality=85, optimize=True)
+            content = buffer.getvalue()
+        return content, hashlib.sha256(content).hexdigest()
+
+    def caption(self, image, language="en", number_of_results=1):
+        """
+        Returns the captions of one image.
+
+        Args:
+            image (str | bytes): Path of the image, or its bytes.
+            language (str): Language of the captions.
+            number_of_results (int): Number of captions to return.
+
+        Returns:
+            list[str]: The captions.
+        """
+        content, digest = self.prepare(image)
+        return self._caption(content, digest, language, number_of_results)
+
+    def _caption(self, content, digest, language, number_of_results):
+        key = f"{digest}:{self.model_name}:{language}:{number_of_results}"
+
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        from vertexai.preview.vision_models import Image
+
+        captions = self.policy.call(
+            self.model.get_captions,
+            image=Image(image_bytes=content),
+            language=language,
+            number_of_results=number_of_results,
+        )
+
+        if self.cache is not None:
+            self.cache.set(key, list(captions))
+        return captions
+
+    def caption_batch(self, images, language="en", number_of_results=1):
+        """
+        Returns the captions of several images, captioning at most
+        `concurrency` of them at a time. Identical images are captioned once.
+
+        Args:
+            images (list[str | bytes]): Paths of the images, or their bytes.
+            language (str): Language of the captions.
+            number_of_results (int): Number of captions per image.
+
+        Returns:
+            list[list[str]]: The captions of every image, in input order.
+        """
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            prepared = list(executor.map(self.prepare, images))
+            unique = {digest: content for content, digest in prepared}
+            captions = dict(
+                zip(
+                    unique,
+                    executor.map(
+                        lambda digest: self._caption(
+                            unique[digest],
+                            digest,
+                            language,
+                            number_of_results,
+                        ),
+                        unique,
+                    ),
+                    strict=True,
+                ),
+            )
+        return [captions[digest] for _, digest in prepared]
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_captioning_service():
+    """
+    Returns the process-wide captioning service, built from the settings.
+    """
+    global _service  # noqa: PLW0603
+
+    with _service_lock:
+        if _service is None:
+            _service = ImageCaptioningService.from_settings()
+        return _service
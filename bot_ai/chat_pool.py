@@ -0,0 +1,287 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from app.bot_ai.conversation_summary import message_content
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SESSIONS = 256
+DEFAULT_IDLE_SECONDS = 15 * 60
+
+
+def build_history(messages):
+    """
+    Builds the Content list of a conversation from its stored messages in a
+    single pass.
+
+    Args:
+        messages (Iterable): The stored WhatsApp messages, oldest first.
+
+    Returns:
+        list[Content]: The chat history.
+    """
+    return [message_content(message) for message in messages]
+
+
+def load_conversation_messages(conversation_id):
+    """Returns the stored messages of a WhatsApp conversation, oldest first."""
+    from app.bot_whatsapp.models import MessageWhatsappModel
+
+    return MessageWhatsappModel.objects.filter(
+        conversation_id=conversation_id,
+    ).order_by("id")
+
+
+class ChatSessionPool:
+    """
+    Bounded LRU pool of live chat sessions keyed by conversation id.
+
+    Active conversations reuse their `ChatSession` across messages, so the
+    history is not rebuilt from the database on every turn. Sessions idle for
+    longer than `idle_seconds` are evicted, and a miss rehydrates the session
+    from the stored messages in one pass.
+
+    A `ChatSession` must not be used by two requests at once, so a session is
+    only handed out through `checkout` (or `reply`), which holds a lock of the
+    conversation until the turn is answered.
+
+    The pool is per process: route the messages of a conversation to the same
+    worker, or keep `idle_seconds` short, so a session does not miss messages
+    answered by another worker.
+
+    Attributes:
+        max_sessions (int): Maximum number of live sessions.
+        idle_seconds (float): Seconds after which an unused session is evicted.
+        hits (int): Number of lookups served by a live session.
+        misses (int): Number of lookups that rehydrated a session.
+        evictions (int): Number of sessions dropped by size or idle time.
+
+    Methods:
+        reply(conversation_id, message_text, document_list=None, messages=None,
+              instructions=None):
+            Answers a message of a conversation with its pooled session.
+        checkout(conversation_id, messages=None, instructions=None):
+            Context manager that lends the session of a conversation exclusively.
+        get(conversation_id, instructions=None):
+            Returns the live session of a conversation or None.
+        put(conversation_id, chat, instructions=None):
+            Stores a live session.
+        get_or_rehydrate(conversation_id, messages=None, instructions=None):
+            Returns the live session, rebuilding it on a miss. It does not
+            lock the conversation, use `checkout` to send turns.
+        discard(conversation_id):
+            Drops the session of a conversation.
+        stats():
+            Returns the occupancy and hit metrics of the pool.
+    """
+
+    def __init__(
+        self,
+        vx_model=None,
+        max_sessions=DEFAULT_MAX_SESSIONS,
+        idle_seconds=DEFAULT_IDLE_SECONDS,
+        summarizer=None,
+    ):
+        self._vx_model = vx_model
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.summarizer = summarizer
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._conversation_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Builds the pool from the `BOT_AI_CHAT_POOL` setting. Supported keys:
+        ``MAX_SESSIONS``, ``IDLE_SECONDS`` and ``SUMMARIZE`` (replay long
+        conversations through the rolling summary).
+        """
+        config = getattr(settings, "BOT_AI_CHAT_POOL", {})
+
+        summarizer = None
+        if config.get("SUMMARIZE"):
+            from app.bot_ai.conversation_summary import ConversationSummarizer
+
+            summarizer = ConversationSummarizer.from_settings()
+
+        return cls(
+            max_sessions=config.get("MAX_SESSIONS", DEFAULT_MAX_SESSIONS),
+            idle_seconds=config.get("IDLE_SECONDS", DEFAULT_IDLE_SECONDS),
+            summarizer=summarizer,
+        )
+
+    @property
+    def vx_model(self):
+        if self._vx_model is None:
+            from app.bot_ai.bot_multi_model import VertexAImultimodel
+
+            self._vx_model = VertexAImultimodel()
+        return self._vx_model
+
+    def get(self, conversation_id, instructions=None):
+        """
+        Returns the live session of a conversation, or None if it is not pooled,
+        has been idle for too long or was started with other instructions.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._sessions.get(conversation_id)
+            if entry is None:
+                return None
+            if instructions is not None and entry[2] != instructions:
+                del self._sessions[conversation_id]
+                return None
+            self._sessions.move_to_end(conversation_id)
+            entry[0] = now
+            return entry[1]
+
+    def put(self, conversation_id, chat, instructions=None):
+        """Stores a live session, evicting the least recently used ones if full."""
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[conversation_id] = [now, chat, instructions]
+            self._sessions.move_to_end(conversation_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    @contextmanager
+    def checkout(self, conversation_id, messages=None, instructions=None):
+        """
+        Lends the session of a conversation to one request at a time. Other
+        requests of the same conversation wait until the block ends.
+
+        Args:
+            conversation_id (str | int): The id of the conversation.
+            messages (Iterable, optional): The stored messages, oldest first. Only
+                read on a miss; loaded from the database when not given.
+            instructions (str, optional): The system instruction of the session.
+
+        Yields:
+            ChatSession: The live chat session.
+        """
+        # [lock, number of requests using or waiting for it]
+        with self._lock:
+            entry = self._conversation_locks.setdefault(
+                conversation_id,
+                [threading.Lock(), 0],
+            )
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield self.get_or_rehydrate(conversation_id, messages, instructions)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._conversation_locks[conversation_id]
+
+    def reply(  # noqa: PLR0913
+        self,
+        conversation_id,
+        message_text,
+        document_list=None,
+        messages=None,
+        instructions=None,
+    ):
+        """
+        Answers a message of a conversation with its pooled session.
+
+        Args:
+            conversation_id (str | int): The id of the conversation.
+            message_text (str): The message of the user.
+            document_list (list[str], optional): Documents to attach to the turn.
+            messages (Iterable, optional): The stored messages, oldest first,
+                without the message being answered. Only read on a miss.
+            instructions (str, optional): The system instruction of the session.
+
+        Returns:
+            str: The reply of the model.
+        """
+        with self.checkout(conversation_id, messages, instructions) as chat:
+            if document_list:
+                return self.vx_model.generate_message_with_documents(
+                    chat,
+                    message_text,
+                    document_list,
+                )
+            return self.vx_model.generate_message(chat, message_text)
+
+    def get_or_rehydrate(self, conversation_id, messages=None, instructions=None):
+        """
+        Returns the live session of a conversation, rebuilding it on a miss.
+
+        Args:
+            conversation_id (str | int): The id of the conversation.
+            messages (Iterable, optional): The stored messages, oldest first. Only
+                read on a miss; loaded from the database when not given.
+            instructions (str, optional): The system instruction of the session.
+                A pooled session started with other instructions is rebuilt.
+
+        Returns:
+            ChatSession: The live chat session.
+        """
+        chat = self.get(conversation_id, instructions)
+        if chat is not None:
+            self.hits += 1
+            return chat
+
+        self.misses += 1
+        if messages is None:
+            messages = load_conversation_messages(conversation_id)
+
+        if self.summarizer is not None:
+            history = self.summarizer.compact_history(conversation_id, messages)
+        else:
+            history = build_history(messages)
+
+        chat, _ = self.vx_model.start_chat(history=history, instructions=instructions)
+        self.put(conversation_id, chat, instructions)
+        return chat
+
+    def discard(self, conversation_id):
+        """Drops the session of a conversation, e.g. when it is closed."""
+        with self._lock:
+            self._sessions.pop(conversation_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self):
+        """
+        Returns the occupancy and hit metrics of the pool.
+
+        Returns:
+            dict: Live sessions, capacity, hits, misses, hit rate and evictions.
+        """
+        total = self.hits + self.misses
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def _evict_idle(self, now):
+        while self._sessions:
+            conversation_id, (last_used, *_) = next(iter(self._sessions.items()))
+            if now - last_used < self.idle_seconds:
+                break
+            del self._sessions[conversation_id]
+            self.evictions += 1
+
+
+chat_pool = ChatSessionPool.from_settings()
@@ -0,0 +1,190 @@
+import logging
+import re
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENCODING = "cl100k_base"
+DEFAULT_MAX_TOKENS = 512
+DEFAULT_OVERLAP = 64
+DEFAULT_THREADS = 8
+
+PARAGRAPH_BOUNDARY = re.compile(r"\n\s*\n")
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…])\s+|\n\s*\n")
+SNAP_PATTERNS = {
+    "paragraph": PARAGRAPH_BOUNDARY,
+    "sentence": SENTENCE_BOUNDARY,
+    "none": None,
+}
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name=DEFAULT_ENCODING):
+    """Returns the tiktoken encoding, loaded once per process."""
+    import tiktoken
+
+    return tiktoken.get_encoding(encoding_name)
+
+
+def split_segments(text, pattern):
+    """
+    Splits a text after every boundary matched by `pattern`. Each segment keeps
+    its trailing whitespace, so joining the segments gives back the text.
+    """
+    if pattern is None:
+        return [text] if text else []
+
+    segments = []
+    start = 0
+    for match in pattern.finditer(text):
+        if match.end() > start:
+            segments.append(text[start : match.end()])
+            start = match.end()
+    if start < len(text):
+        segments.append(text[start:])
+    return segments
+
+
+@dataclass(frozen=True)
+class TokenChunker:
+    """
+    Splits documents into chunks of at most `max_tokens` tokens that end on
+    sentence or paragraph boundaries, with `overlap` tokens of context repeated
+    at the start of the next chunk.
+
+    Documents are read page by page, so memory depends on the size of a page
+    and not of the document. A sentence longer than a chunk is cut by tokens.
+
+    Attributes:
+        max_tokens (int): The maximum number of tokens of a chunk.
+        overlap (int): Tokens of the previous chunk repeated in the next one.
+        snap (str): ``sentence``, ``paragraph`` or ``none`` (plain token cuts).
+        encoding_name (str): The tiktoken encoding used to count tokens.
+        num_threads (int): Threads used to encode the segments of a page.
+
+    Methods:
+        chunk_pages(pages):
+            Yields the chunks of a document given as an iterable of page texts.
+        chunk_text(text):
+            Yields the chunks of a text.
+        encode_batch(texts):
+            Encodes many texts with several threads.
+    """
+
+    max_tokens: int = DEFAULT_MAX_TOKENS
+    overlap: int = DEFAULT_OVERLAP
+    snap: str = "sentence"
+    encoding_name: str = DEFAULT_ENCODING
+    num_threads: int = DEFAULT_THREADS
+
+    def __post_init__(self):
+        if not 0 <= self.overlap < self.max_tokens:
+            raise ValueError("overlap must be smaller than max_tokens")  # noqa: EM101, TRY003
+        if self.snap not in SNAP_PATTERNS:
+            raise ValueError(f"Unknown snap mode: {self.snap}")  # noqa: EM102, TRY003
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Builds the chunker from the `BOT_AI_CHUNKER` setting. Supported keys:
+        ``MAX_TOKENS``, ``OVERLAP``, ``SNAP``, ``ENCODING`` and ``THREADS``.
+        """
+        config = getattr(settings, "BOT_AI_CHUNKER", {})
+        return cls(
+            max_tokens=config.get("MAX_TOKENS", DEFAULT_MAX_TOKENS),
+            overlap=config.get("OVERLAP", DEFAULT_OVERLAP),
+            snap=config.get("SNAP", "sentence"),
+            encoding_name=config.get("ENCODING", DEFAULT_ENCODING),
+            num_threads=config.get("THREADS", DEFAULT_THREADS),
+        )
+
+    @property
+    def encoding(self):
+        return get_encoding(self.encoding_name)
+
+    def encode_batch(self, texts):
+        """Encodes the texts in parallel; tiktoken releases the GIL."""
+        return self.encoding.encode_batch(
+            list(texts),
+            num_threads=self.num_threads,
+            disallowed_special=(),
+        )
+
+    def _segments(self, pages):
+        pattern = SNAP_PATTERNS[self.snap]
+        for page in pages:
+            # The end of a page is a paragraph boundary
+            segments = split_segments(f"{page or ''}\n\n", pattern)
+            yield from zip(segments, self.encode_batch(segments), strict=True)
+
+    def _overlap_tail(self, window):
+        tail = deque()
+        size = 0
+        for text, tokens in reversed(window):
+            if size + len(tokens) > self.overlap:
+                break
+            tail.appendleft((text, tokens))
+            size += len(tokens)
+        return tail, size
+
+    def _split_long(self, tokens):
+        stride = self.max_tokens - self.overlap
+        starts = range(0, len(tokens) - self.overlap, stride)
+        return [tokens[start : start + self.max_tokens] for start in starts]
+
+    def chunk_pages(self, pages):
+        """
+        Yields the chunks of a document, reading one page at a time.
+
+        Args:
+            pages (Iterable[str]): The text of every page.
+
+        Yields:
+            str: The text of each chunk, stripped of surrounding whitespace.
+        """
+        window = deque()
+        size = 0
+        fresh = False
+
+        for text, tokens in self._segments(pages):
+            if not text.strip():
+                continue
+
+            if len(tokens) > self.max_tokens:
+                if fresh:
+                    yield "".join(segment for segment, _ in window).strip()
+                pieces = self._split_long(tokens)
+                for piece in pieces[:-1]:
+                    yield self.encoding.decode(piece).strip()
+                # The last piece stays open, so the next sentences can join it
+                last = pieces[-1]
+                window = deque([(self.encoding.decode(last), last)])
+                size = len(last)
+                fresh = True
+                continue
+
+            if size + len(tokens) > self.max_tokens:
+                if fresh:
+                    yield "".join(segment for segment, _ in window).strip()
+                window, size = self._overlap_tail(window)
+                while window and size + len(tokens) > self.max_tokens:
+                    size -= len(window.popleft()[1])
+                fresh = False
+
+            window.append((text, tokens))
+            size += len(tokens)
+            fresh = True
+
+        if fresh:
+            yield "".join(segment for segment, _ in window).strip()
+
+    def chunk_text(self, text):
+        """Yields the chunks of a single text."""
+        return self.chunk_pages([text])
+
+
+chunker = TokenChunker.from_settings()
@@ -0,0 +1,136 @@
+import logging
+import os
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT_ID")
+LOCATION = "us-central1"
+
+_vertexai_lock = threading.Lock()
+_vertexai_initialized = False
+
+
+@lru_cache(maxsize=1)
+def get_credentials():
+    """
+    Returns the service-account credentials, reading `clave.json` on first use.
+    """
+    from google.oauth2 import service_account
+
+    dir_credentials = settings.BASE_DIR / "clave.json"
+    return service_account.Credentials.from_service_account_file(dir_credentials)
+
+
+def init_vertexai():
+    """
+    Initializes the Vertex AI SDK once per process, on the first call that needs
+    a model instead of at import time.
+    """
+    global _vertexai_initialized  # noqa: PLW0603
+
+    if _vertexai_initialized:
+        return
+
+    with _vertexai_lock:
+        if _vertexai_initialized:
+            return
+
+        import vertexai
+
+        # vertexai.init(project=PROJECT_ID, location=LOCATION, credentials=get_credentials())  # noqa: ERA001,E501
+        vertexai.init(project=PROJECT_ID, location=LOCATION)
+        _vertexai_initialized = True
+        logger.info("Vertex AI initialized")
+
+
+def use_local_backends():
+    """
+    Returns True when `BOT_AI_BACKEND` selects the local stand-ins of the
+    Google services instead of the real ones.
+    """
+    return getattr(settings, "BOT_AI_BACKEND", "vertex") == "local"
+
+
+def make_generative_model(model_name, system_instruction=None, generation_config=None):
+    """
+    Builds a generative model for the configured backend.
+    """
+    if use_local_backends():
+        from app.bot_ai.local_backends import FakeGenerativeModel
+
+        return FakeGenerativeModel.from_settings(
+            model_name,
+            system_instruction=system_instruction,
+            generation_config=generation_config,
+        )
+
+    init_vertexai()
+    from vertexai.generative_models import GenerativeModel
+
+    return GenerativeModel(
+        model_name,
+        system_instruction=system_instruction,
+        generation_config=generation_config,
+    )
+
+
+def make_embedding_model(model_name="text-multilingual-embedding-002"):
+    """
+    Builds a text embedding model for the configured backend.
+    """
+    if use_local_backends():
+        from app.bot_ai.local_backends import FakeTextEmbeddingModel
+
+        return FakeTextEmbeddingModel.from_settings(model_name)
+
+    init_vertexai()
+    from vertexai.language_models import TextEmbeddingModel
+
+    return TextEmbeddingModel.from_pretrained(model_name)
+
+
+def make_storage_client():
+    """
+    Builds a Cloud Storage client for the configured backend.
+    """
+    if use_local_backends():
+        from app.bot_ai.local_backends import LocalStorageClient
+
+        return LocalStorageClient()
+
+    from google.cloud import storage
+
+    return storage.Client()
+
+
+def make_storage_control_client():
+    """
+    Builds a Cloud Storage control client (folder operations) for the
+    configured backend.
+    """
+    if use_local_backends():
+        from app.bot_ai.local_backends import LocalStorageControlClient
+
+        return LocalStorageControlClient()
+
+    from google.cloud import storage_control_v2
+
+    return storage_control_v2.StorageControlClient()
+
+
+def make_bigquery_client():
+    """
+    Builds a BigQuery client for the configured backend.
+    """
+    if use_local_backends():
+        from app.bot_ai.local_backends import LocalBigQueryClient
+
+        return LocalBigQueryClient(project=PROJECT_ID or "local")
+
+    from google.cloud import bigquery
+
+    return bigquery.Client()
@@ -0,0 +1,388 @@
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+from datetime import UTC
+from datetime import datetime
+from datetime import timedelta
+
+from django.conf import settings
+from django.dispatch import receiver
+
+from app.bot_ai.clients import init_vertexai
+from app.bot_ai.clients import make_generative_model
+from app.bot_ai.clients import use_local_backends
+from app.bot_ai.signals import blob_generation_changed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = timedelta(hours=1)
+DEFAULT_REFRESH_MARGIN = timedelta(minutes=5)
+DEFAULT_REVALIDATE_INTERVAL = timedelta(minutes=1)
+
+
+class VertexCachedContentBackend:
+    """
+    Creates and maintains Vertex AI cached-content handles.
+    """
+
+    def create(self, model_name, contents, system_instruction, ttl):
+        init_vertexai()
+        from vertexai.preview.caching import CachedContent
+
+        return CachedContent.create(
+            model_name=model_name,
+            system_instruction=system_instruction,
+            contents=contents,
+            ttl=ttl,
+        )
+
+    def refresh(self, handle, ttl):
+        handle.update(ttl=ttl)
+
+    def delete(self, handle):
+        handle.delete()
+
+    def expire_time(self, handle):
+        return handle.expire_time
+
+    def model_for(self, handle, generation_config=None):
+        from vertexai.preview.generative_models import GenerativeModel
+
+        return GenerativeModel.from_cached_content(
+            cached_content=handle,
+            generation_config=generation_config,
+        )
+
+
+class FakeCachedContent:
+    """In-memory stand-in of a Vertex cached-content handle."""
+
+    def __init__(self, name, model_name, contents, system_instruction, ttl):
+        self.name = name
+        self.model_name = model_name
+        self.contents = contents
+        self.system_instruction = system_instruction
+        self.expire_time = datetime.now(UTC) + ttl
+        self.deleted = False
+
+
+class FakeCachedContentBackend:
+    """
+    Local stand-in of the Vertex cached-content service, used in tests and
+    offline runs. It records every call so the reuse of handles can be checked.
+
+    Attributes:
+        created (list): The handles created so far.
+        refreshed (int): Number of TTL refreshes.
+        deleted (int): Number of deleted handles.
+    """
+
+    def __init__(self, model_factory=None):
+        self.model_factory = model_factory
+        self.created = []
+        self.refreshed = 0
+        self.deleted = 0
+
+    def create(self, model_name, contents, system_instruction, ttl):
+        handle = FakeCachedContent(
+            f"cachedContents/fake-{len(self.created) + 1}",
+            model_name,
+            contents,
+            system_instruction,
+            ttl,
+        )
+        self.created.append(handle)
+        return handle
+
+    def refresh(self, handle, ttl):
+        handle.expire_time = datetime.now(UTC) + ttl
+        self.refreshed += 1
+
+    def delete(self, handle):
+        handle.deleted = True
+        self.deleted += 1
+
+    def expire_time(self, handle):
+        return handle.expire_time
+
+    def model_for(self, handle, generation_config=None):
+        if self.model_factory is None:
+            return handle
+        return self.model_factory(handle, generation_config)
+
+
+class DocumentContextCache:
+    """
+    Keeps one Vertex cached-content handle per (company, document set, model)
+    so the company documents are not sent and billed as input tokens on every
+    turn.
+
+    A handle is reused until it is close to its expiry, when its TTL is
+    extended. Concurrent misses on the same key wait for a single creation,
+    so only one billed handle exists per key. It is dropped when GCSManager reports a change in one of its
+    blobs, or when a periodic check finds a blob generation that no longer
+    matches the one the handle was built from.
+
+    Methods:
+        get_model(company, document_list, model_name, system_instruction, parts,
+                  generation_config=None):
+            Returns a model bound to the cached documents, or None.
+        invalidate(company=None):
+            Drops the handles of a company, or every handle.
+        on_blob_changed(bucket_name, blob_name):
+            Drops the handles that include the given blob.
+        stats():
+            Returns the hit/miss counters of the cache.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        ttl=DEFAULT_TTL,
+        refresh_margin=DEFAULT_REFRESH_MARGIN,
+        revalidate_interval=DEFAULT_REVALIDATE_INTERVAL,
+        gcs_manager=None,
+    ):
+        self.backend = backend if backend is not None else VertexCachedContentBackend()
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.revalidate_interval = revalidate_interval
+        self._gcs_manager = gcs_manager
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._creating = {}
+        self._uncacheable = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def gcs_manager(self):
+        if self._gcs_manager is None:
+            from app.bot_ai.gc_storage import GCSManager
+
+            self._gcs_manager = GCSManager()
+        return self._gcs_manager
+
+    @staticmethod
+    def make_key(company, document_list, model_name, system_instruction):
+        instruction_hash = hashlib.sha256(
+            str(system_instruction).encode("utf-8"),
+        ).hexdigest()
+        return (company, tuple(sorted(document_list)), model_name, instruction_hash)
+
+    def get_model(  # noqa: PLR0913
+        self,
+        company,
+        document_list,
+        model_name,
+        system_instruction,
+        parts,
+        generation_config=None,
+    ):
+        """
+        Returns a generative model bound to the cached documents.
+
+        Args:
+            company (str): The company the documents belong to.
+            document_list (list[str]): The gs:// URIs of the documents.
+            model_name (str): The name of the generative model.
+            system_instruction (str | list): The system instruction stored in the cache.
+            parts (list): The document parts to cache when no handle exists yet.
+            generation_config (dict, optional): The generation config of the model.
+
+        Returns:
+            GenerativeModel | None: The model, or None when the documents cannot be
+            cached (e.g. they are below the minimum cacheable size).
+        """  # noqa: E501
+        key = self.make_key(company, document_list, model_name, system_instruction)
+        now = datetime.now(UTC)
+
+        with self._lock:
+            if self._uncacheable.get(key, now) > now:
+                return None
+            entry = self._entries.get(key)
+
+        if entry is not None and self._is_valid(entry, now):
+            self.hits += 1
+            return self._model(entry, generation_config)
+
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and current is not entry:
+                # Another request built the handle in the meantime
+                self.hits += 1
+                return self._model(current, generation_config)
+            creating = self._creating.get(key)
+            owner = creating is None
+            if owner:
+                creating = self._creating[key] = Future()
+
+        if not owner:
+            entry = creating.result()
+            self.hits += 1
+            return None if entry is None else self._model(entry, generation_config)
+
+        self.misses += 1
+        entry = None
+        try:
+            entry = self._create(
+                key,
+                company,
+                document_list,
+                model_name,
+                system_instruction,
+                parts,
+            )
+        finally:
+            with self._lock:
+                del self._creating[key]
+            creating.set_result(entry)
+        return None if entry is None else self._model(entry, generation_config)
+
+    def _create(  # noqa: PLR0913
+        self,
+        key,
+        company,
+        document_list,
+        model_name,
+        system_instruction,
+        parts,
+    ):
+        now = datetime.now(UTC)
+        self._drop(key)
+
+        try:
+            generations = self.gcs_manager.get_blob_generations(list(document_list))
+            handle = self.backend.create(model_name, parts, system_instruction, self.ttl)
+        except Exception as e:  # noqa: BLE001
+            logger.warning(f"Documents of {company} could not be cached: {e}")  # noqa: G004
+            with self._lock:
+                self._uncacheable[key] = now + self.ttl
+            return None
+
+        entry = {
+            "handle": handle,
+            "models": {},
+            "generations": generations,
+            "checked_at": now,
+        }
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def _model(self, entry, generation_config):
+        # One model per generation config, all bound to the same handle
+        config_key = repr(sorted((generation_config or {}).items()))
+        model = entry["models"].get(config_key)
+        if model is None:
+            model = self.backend.model_for(entry["handle"], generation_config)
+            entry["models"][config_key] = model
+        return model
+
+    def _is_valid(self, entry, now):
+        expire_time = self.backend.expire_time(entry["handle"])
+        if expire_time is not None and expire_time <= now:
+            return False
+
+        if now - entry["checked_at"] >= self.revalidate_interval:
+            current = self.gcs_manager.get_blob_generations(list(entry["generations"]))
+            if current != entry["generations"]:
+                return False
+            entry["checked_at"] = now
+
+        if expire_time is not None and expire_time - now <= self.refresh_margin:
+            try:
+                self.backend.refresh(entry["handle"], self.ttl)
+            except Exception as e:  # noqa: BLE001
+                logger.warning(f"Cached content could not be refreshed: {e}")  # noqa: G004
+                return False
+
+        return True
+
+    def _drop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        try:
+            self.backend.delete(entry["handle"])
+        except Exception as e:  # noqa: BLE001
+            logger.warning(f"Cached content could not be deleted: {e}")  # noqa: G004
+
+    def invalidate(self, company=None):
+        """
+        Drops the handles of a company, or every handle if no company is given.
+        """
+        with self._lock:
+            keys = [key for key in self._entries if company in (None, key[0])]
+            self._uncacheable.clear()
+        for key in keys:
+            self._drop(key)
+
+    def on_blob_changed(self, bucket_name, blob_name):
+        """
+        Drops every handle that includes the given blob.
+        """
+        uri = f"gs://{bucket_name}/{blob_name}"
+        with self._lock:
+            keys = [key for key in self._entries if uri in key[1]]
+            for key in [key for key in self._uncacheable if uri in key[1]]:
+                del self._uncacheable[key]
+        for key in keys:
+            self._drop(key)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "handles": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def build_document_context_cache():
+    """
+    Builds the document context cache from the `BOT_AI_CONTEXT_CACHE` setting.
+
+    Supported keys: ``TTL_SECONDS``, ``REFRESH_MARGIN_SECONDS``,
+    ``REVALIDATE_SECONDS`` and ``FAKE`` (use the local stand-in backend, also
+    selected by ``BOT_AI_BACKEND = "local"``).
+    """
+    config = getattr(settings, "BOT_AI_CONTEXT_CACHE", {})
+
+    backend = None
+    if config.get("FAKE") or use_local_backends():
+        backend = FakeCachedContentBackend(
+            model_factory=lambda handle, generation_config: make_generative_model(
+                handle.model_name,
+                system_instruction=handle.system_instruction,
+                generation_config=generation_config,
+            ),
+        )
+
+    return DocumentContextCache(
+        backend=backend,
+        ttl=timedelta(seconds=config.get("TTL_SECONDS", DEFAULT_TTL.total_seconds())),
+        refresh_margin=timedelta(
+            seconds=config.get(
+                "REFRESH_MARGIN_SECONDS",
+                DEFAULT_REFRESH_MARGIN.total_seconds(),
+            ),
+        ),
+        revalidate_interval=timedelta(
+            seconds=config.get(
+                "REVALIDATE_SECONDS",
+                DEFAULT_REVALIDATE_INTERVAL.total_seconds(),
+            ),
+        ),
+    )
+
+
+document_context_cache = build_document_context_cache()
+
+
+@receiver(blob_generation_changed)
+def invalidate_changed_documents(sender, bucket_name, blob_name, **kwargs):
+    document_context_cache.on_blob_changed(bucket_name, blob_name)
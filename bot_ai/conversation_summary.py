@@ -0,0 +1,227 @@
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+
+from app.bot_ai.models import ConversationSummary
+from app.bot_ai.utils import generate_bot_response_class
+from app.bot_ai.utils import generate_user_response_class
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SUMMARY_EVERY_N_TURNS = 10
+DEFAULT_KEEP_LAST_TURNS = 6
+
+SUMMARY_INSTRUCTION = """
+    Eres un asistente que resume conversaciones entre un usuario y un bot.
+    Conserva los datos del usuario, sus preferencias, los productos mencionados,
+    las preguntas pendientes y los acuerdos. Responde solo con el resumen,
+    en español y en menos de 250 palabras.
+"""
+
+SUMMARY_PROMPT = """
+Resumen anterior:
+{summary}
+
+Mensajes nuevos:
+{messages}
+
+Escribe el resumen actualizado de toda la conversación.
+"""
+
+
+def message_role(message_model):
+    """Returns the Vertex role of a stored WhatsApp message."""
+    if message_model.send_by == message_model.OPTION_SEND_BY_BOT:
+        return "model"
+    return "user"
+
+
+def message_content(message_model):
+    """Builds the Content of a stored WhatsApp message."""
+    if message_role(message_model) == "model":
+        return generate_bot_response_class(message_model.text)
+    return generate_user_response_class(message_model.text)
+
+
+def summary_contents(summary):
+    """
+    Returns the Content blocks that carry a running summary at the start of the
+    history, as a user turn followed by the model acknowledgement.
+    """
+    from vertexai.generative_models import Part
+    from vertexai.generative_models._generative_models import Content
+
+    return [
+        Content(
+            role="user",
+            parts=[Part.from_text(f"Resumen de la conversación anterior: {summary}")],
+        ),
+        Content(
+            role="model",
+            parts=[Part.from_text("Entendido, continúo con ese contexto.")],
+        ),
+    ]
+
+
+class ConversationSummarizer:
+    """
+    Folds the older messages of a conversation into a running summary so the
+    prompt of a turn stays bounded however long the conversation gets.
+
+    The summary is stored in `ConversationSummary` together with the number of
+    messages it covers, and it is recomputed incrementally: only the messages
+    folded since the last update are sent to the model, with the previous summary.
+
+    Attributes:
+        every_n_turns (int): Number of new turns that triggers a summary update.
+        keep_last_turns (int): Number of newest turns always sent verbatim.
+        model_name (str): The model used to write the summaries.
+
+    Methods:
+        compact_history(conversation_id, messages):
+            Returns the summary blocks followed by the messages not yet summarized.
+        needs_update(total_messages, summarized_messages):
+            Tells whether enough new messages exist to fold them into the summary.
+        update_summary(conversation_id, messages):
+            Folds the pending older messages into the stored summary.
+    """
+
+    def __init__(
+        self,
+        every_n_turns=DEFAULT_SUMMARY_EVERY_N_TURNS,
+        keep_last_turns=DEFAULT_KEEP_LAST_TURNS,
+        model_name=None,
+    ):
+        from app.bot_ai.bot_multi_model import GEMINI_MODEL_ID_1_5
+
+        self.every_n_turns = every_n_turns
+        self.keep_last_turns = keep_last_turns
+        self.model_name = model_name if model_name else GEMINI_MODEL_ID_1_5
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Builds the summarizer from the `BOT_AI_CONVERSATION_SUMMARY` setting.
+        Supported keys: ``EVERY_N_TURNS``, ``KEEP_LAST_TURNS`` and ``MODEL``.
+        """
+        config = getattr(settings, "BOT_AI_CONVERSATION_SUMMARY", {})
+        return cls(
+            every_n_turns=config.get("EVERY_N_TURNS", DEFAULT_SUMMARY_EVERY_N_TURNS),
+            keep_last_turns=config.get("KEEP_LAST_TURNS", DEFAULT_KEEP_LAST_TURNS),
+            model_name=config.get("MODEL"),
+        )
+
+    def needs_update(self, total_messages, summarized_messages):
+        """
+        Tells whether at least `every_n_turns` turns older than the kept window
+        are not yet in the summary.
+        """
+        foldable = total_messages - 2 * self.keep_last_turns - summarized_messages
+        return foldable >= 2 * self.every_n_turns
+
+    def compact_history(self, conversation_id, messages, schedule_update=True):
+        """
+        Returns the history to replay for a conversation: the stored summary
+        blocks followed by the messages that are not summarized yet.
+
+        Args:
+            conversation_id (str | int): The id of the conversation.
+            messages (list): The stored messages of the conversation, oldest first.
+            schedule_update (bool): Whether to queue a background summary update
+                when enough new turns have accumulated.
+
+        Returns:
+            list[Content]: The compacted history.
+        """
+        messages = list(messages)
+        record = ConversationSummary.objects.filter(
+            conversation_id=str(conversation_id),
+        ).first()
+        summarized = record.summarized_messages if record else 0
+        summarized = min(summarized, len(messages))
+
+        history = []
+        if record and record.summary:
+            history.extend(summary_contents(record.summary))
+
+        pending = messages[summarized:]
+        # The history must start with a user turn after the summary blocks
+        while pending and message_role(pending[0]) == "model":
+            pending = pending[1:]
+        history.extend(message_content(message) for message in pending)
+
+        if schedule_update and self.needs_update(len(messages), summarized):
+            from app.bot_ai.tasks import update_conversation_summary
+
+            update_conversation_summary.delay(str(conversation_id))
+
+        return history
+
+    def update_summary(self, conversation_id, messages):
+        """
+        Folds the pending older messages of a conversation into its summary.
+
+        Args:
+            conversation_id (str | int): The id of the conversation.
+            messages (list): The stored messages of the conversation, oldest first.
+
+        Returns:
+            ConversationSummary: The updated summary record.
+        """
+        from app.bot_ai.model_registry import model_registry
+        from app.bot_ai.resilience import vertex_policy
+
+        messages = list(messages)
+        record, _ = ConversationSummary.objects.get_or_create(
+            conversation_id=str(conversation_id),
+        )
+        summarized = record.summarized_messages
+
+        end = len(messages) - 2 * self.keep_last_turns
+        # Never split a turn: the kept window starts with a user message
+        while (
+            summarized < end < len(messages)
+            and message_role(messages[end]) == "model"
+        ):
+            end -= 1
+        if end <= summarized:
+            return record
+
+        new_messages = "\n".join(
+            f"{'Bot' if message_role(message) == 'model' else 'Usuario'}: "
+            f"{message.text}"
+            for message in messages[summarized:end]
+        )
+        prompt = SUMMARY_PROMPT.format(
+            summary=record.summary or "(sin resumen)",
+            messages=new_messages,
+        )
+
+        model = model_registry.get_model(
+            self.model_name,
+            system_instruction=[SUMMARY_INSTRUCTION],
+        )
+        response = vertex_policy.call(model.generate_content, [prompt], hedge=True)
+
+        # The model is called without a lock; the summary is only saved if no
+        # other task folded messages in the meantime (compare-and-set)
+        updated = ConversationSummary.objects.filter(
+            pk=record.pk,
+            summarized_messages=summarized,
+        ).update(
+            summary=response.text.strip(),
+            summarized_messages=end,
+            updated_at=timezone.now(),
+        )
+        record.refresh_from_db()
+        if not updated:
+            logger.info(
+                f"Conversation {conversation_id} was summarized by another task, dropping this summary",  # noqa: E501, G004
+            )
+            return record
+
+        logger.info(
+            f"Conversation {conversation_id} summarized up to message {end}",  # noqa: G004
+        )
+        return record
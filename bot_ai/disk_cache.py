@@ -0,0 +1,210 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class DiskCache:
+    """
+    Content-addressed cache of JSON values stored in a local SQLite file.
+
+    Entries of every namespace share the file; each namespace is bounded by
+    `max_bytes` and the least recently read entries are evicted first. The
+    cache survives process restarts and is shared by the workers of a host.
+
+    The size of the namespace is kept as a running total, so a write only
+    sums the table when the total goes over the limit; entries written by
+    other workers are counted then.
+
+    Attributes:
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups not found in the cache.
+
+    Methods:
+        get(key):
+            Returns the cached value, or None.
+        set(key, value):
+            Stores a value and evicts old entries past the size limit.
+        delete(key):
+            Drops an entry.
+        clear():
+            Drops every entry of the namespace.
+        stats():
+            Returns the hit rate and the size of the namespace.
+    """
+
+    def __init__(self, path, namespace, max_bytes=DEFAULT_MAX_BYTES, clock=time.time):
+        self.path = str(path)
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._connection = None
+        self._total = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(
+                self.path,
+                timeout=30,
+                check_same_thread=False,
+                isolation_level=None,
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "namespace TEXT NOT NULL, "
+                "key TEXT NOT NULL, "
+                "value TEXT NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "accessed_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))",
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS cache_entries_accessed "
+                "ON cache_entries (namespace, accessed_at)",
+            )
+        return self._connection
+
+    def get(self, key):
+        """
+        Returns the cached value of a key, or None if it is not cached.
+        """
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT value FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",  # noqa: E501
+                (self.clock(), self.namespace, key),
+            )
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """
+        Stores a JSON-serializable value, evicting the least recently read
+        entries while the namespace is over its size limit.
+        """
+        payload = json.dumps(value, ensure_ascii=False)
+        size = len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            replaced = self._entry_size(key)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cache_entries "
+                "(namespace, key, value, size, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, payload, size, self.clock()),
+            )
+            if self._total is None:
+                self._total = self._size()
+            else:
+                self._total += size - replaced
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Other workers write to the same file, so the total is recounted
+        total = self._size()
+        if total <= self.max_bytes:
+            self._total = total
+            return
+
+        rows = self.connection.execute(
+            "SELECT key, size FROM cache_entries WHERE namespace = ? "
+            "ORDER BY accessed_at",
+            (self.namespace,),
+        )
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((self.namespace, key))
+            total -= size
+        self.connection.executemany(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+            evicted,
+        )
+        self._total = total
+        logger.info(f"Evicted {len(evicted)} entries from {self.namespace} cache")  # noqa: G004
+
+    def _entry_size(self, key):
+        row = self.connection.execute(
+            "SELECT size FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _size(self):
+        row = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?",
+            (self.namespace,),
+        ).fetchone()
+        return row[0]
+
+    def delete(self, key):
+        """Drops an entry."""
+        with self._lock:
+            if self._total is not None:
+                self._total -= self._entry_size(key)
+            self.connection.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            )
+
+    def clear(self):
+        """Drops every entry of the namespace."""
+        with self._lock:
+            self.connection.execute(
+                "DELETE FROM cache_entries WHERE namespace = ?",
+                (self.namespace,),
+            )
+            self._total = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            size, entries = self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM cache_entries WHERE namespace = ?",  # noqa: E501
+                (self.namespace,),
+            ).fetchone()
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def build_disk_cache(namespace, max_bytes=None):
+    """
+    Builds a disk cache from the `BOT_AI_DISK_CACHE` setting.
+
+    Supported keys: ``PATH`` (defaults to ``BASE_DIR / "bot_ai_cache.sqlite3"``)
+    and ``MAX_BYTES`` (per namespace, unless `max_bytes` is given).
+    """
+    config = getattr(settings, "BOT_AI_DISK_CACHE", {})
+    path = config.get("PATH") or settings.BASE_DIR / "bot_ai_cache.sqlite3"
+    if max_bytes is None:
+        max_bytes = config.get("MAX_BYTES", DEFAULT_MAX_BYTES)
+    return DiskCache(path, namespace, max_bytes=max_bytes)
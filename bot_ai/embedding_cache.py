@@ -0,0 +1,171 @@
+import base64
+import hashlib
+import logging
+from array import array
+
+from django.conf import settings
+
+from app.bot_ai.disk_cache import build_disk_cache
+from app.bot_ai.embedding_executor import embedding_model_name
+from app.bot_ai.response_cache import DjangoCacheTier
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARED_TTL = 30 * 24 * 60 * 60
+
+
+def encode_vector(values):
+    """Packs an embedding as base64 float32, a quarter of its JSON size."""
+    return base64.b64encode(array("f", values).tobytes()).decode("ascii")
+
+
+def decode_vector(payload):
+    values = array("f")
+    values.frombytes(base64.b64decode(payload))
+    return values.tolist()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of embeddings, keyed by the model name and the
+    hash of the text, so unchanged chunks are never embedded twice.
+
+    Lookups go to the local disk tier first and then to the optional shared
+    tier, which also refills the disk tier. Vectors are stored as float32.
+
+    Attributes:
+        hits (int): Number of texts served from the cache.
+        misses (int): Number of texts that needed an embedding call.
+
+    Methods:
+        key(model_name, text):
+            Builds the cache key of a text.
+        embed(texts, model, compute):
+            Returns the embeddings of the texts, computing only the missing ones.
+        stats():
+            Returns the hit-rate metrics.
+    """
+
+    def __init__(self, local_tier, shared_tier=None, shared_ttl=DEFAULT_SHARED_TTL):
+        self.local_tier = local_tier
+        self.shared_tier = shared_tier
+        self.shared_ttl = shared_ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model_name, text):
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model_name}:{digest}"
+
+    def get(self, key):
+        payload = self.local_tier.get(key)
+
+        if payload is None and self.shared_tier is not None:
+            try:
+                payload = self.shared_tier.get(key)
+            except Exception as e:  # noqa: BLE001
+                logger.warning(f"Shared embedding cache unavailable: {e}")  # noqa: G004
+                payload = None
+            if payload is not None:
+                self.local_tier.set(key, payload)
+
+        return None if payload is None else decode_vector(payload)
+
+    def set(self, key, values):
+        payload = encode_vector(values)
+        self.local_tier.set(key, payload)
+
+        if self.shared_tier is not None:
+            try:
+                self.shared_tier.set(key, payload, self.shared_ttl)
+            except Exception as e:  # noqa: BLE001
+                logger.warning(f"Shared embedding cache unavailable: {e}")  # noqa: G004
+
+    def embed(self, texts, model, compute):
+        """
+        Returns the embeddings of the texts. Only the texts missing from the
+        cache are sent to `compute`, once each, and their vectors are stored.
+
+        Args:
+            texts (list[str]): The texts to embed.
+            model (TextEmbeddingModel): The embedding model.
+            compute (callable): ``compute(texts, model)`` returns the vectors
+                of the texts, in order.
+
+        Returns:
+            list[list[float]]: The embedding values, in the same order as `texts`.
+        """
+        model_name = embedding_model_name(model)
+        keys = [self.key(model_name, text) for text in texts]
+
+        vectors = {}
+        missing = {}
+        for key, text in zip(keys, texts, strict=True):
+            if key in vectors or key in missing:
+                continue
+            cached = self.get(key)
+            if cached is None:
+                missing[key] = text
+            else:
+                vectors[key] = cached
+
+        if missing:
+            computed = compute(list(missing.values()), model)
+            for key, values in zip(missing, computed, strict=True):
+                self.set(key, values)
+                vectors[key] = values
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return [vectors[key] for key in keys]
+
+    def clear(self):
+        self.local_tier.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """
+        Returns the hit-rate metrics of the cache.
+
+        Returns:
+            dict: Hits, misses and hit rate, plus the size of the disk tier.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "disk": self.local_tier.stats(),
+        }
+
+
+def build_embedding_cache():
+    """
+    Builds the embedding cache from the `BOT_AI_EMBEDDING_CACHE` setting, or
+    returns None when ``ENABLED`` is False.
+
+    Supported keys: ``ENABLED`` (defaults to True), ``MAX_BYTES`` (size of the
+    disk tier), ``DJANGO_CACHE`` (the alias of a Django cache to use as the
+    shared tier) and ``SHARED_TTL``.
+    """
+    config = getattr(settings, "BOT_AI_EMBEDDING_CACHE", {})
+    if not config.get("ENABLED", True):
+        return None
+
+    shared_tier = None
+    if config.get("DJANGO_CACHE"):
+        shared_tier = DjangoCacheTier(
+            config["DJANGO_CACHE"],
+            key_prefix="bot_ai:embedding:",
+        )
+
+    return EmbeddingCache(
+        local_tier=build_disk_cache("embeddings", max_bytes=config.get("MAX_BYTES")),
+        shared_tier=shared_tier,
+        shared_ttl=config.get("SHARED_TTL", DEFAULT_SHARED_TTL),
+    )
+
+
+embedding_cache = build_embedding_cache()
@@ -0,0 +1,319 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from google.api_core import exceptions as google_exceptions
+
+from app.bot_ai.instrumentation import note_retry
+from app.bot_ai.instrumentation import track
+from app.bot_ai.resilience import RETRYABLE_EXCEPTIONS
+from app.bot_ai.token_budget import estimate_text_tokens
+
+logger = logging.getLogger(__name__)
+
+# Default quota and request limits of text-multilingual-embedding-002
+DEFAULT_REQUESTS_PER_MINUTE = 600
+DEFAULT_MAX_BATCH_INSTANCES = 250
+DEFAULT_MAX_BATCH_TOKENS = 20000
+DEFAULT_MAX_IN_FLIGHT = 4
+# Token counts are estimated with tiktoken, which differs from the Vertex
+# tokenizer; batches are planned below the limit by this fraction
+DEFAULT_TOKEN_MARGIN = 0.15
+
+
+def embedding_model_name(model):
+    """Returns the name of a Vertex or local embedding model."""
+    return (
+        getattr(model, "model_name", None)
+        or getattr(model, "_model_id", None)
+        or type(model).__name__
+    )
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter shared by threads.
+
+    The bucket refills at `rate` tokens per second up to `capacity`. `acquire`
+    blocks until the requested amount is available.
+
+    Methods:
+        acquire(amount=1):
+            Takes tokens from the bucket, waiting for them if needed.
+        set_rate(rate):
+            Changes the refill rate, e.g. after a 429.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(
+            self.capacity,
+            self._tokens + (now - self._updated_at) * self.rate,
+        )
+        self._updated_at = now
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+    def acquire(self, amount=1):
+        # Requests larger than the bucket would wait forever, they drain it instead
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            self.sleep(wait)
+
+
+class EmbeddingExecutor:
+    """
+    Computes embeddings for many texts with several batches in flight, under
+    the request (and optionally token) quota of the embedding model.
+
+    Texts are packed into batches in input order, up to the instance and token
+    limits of one request; the token limit is planned with a safety margin,
+    and a batch the model still rejects for its tokens is split in half and
+    retried. On a 429 the request rate is halved and the batch is
+    retried after a jittered backoff; every successful batch then gives back
+    a share of the configured rate.
+
+    Attributes:
+        requests_per_minute (float): The request quota.
+        tokens_per_minute (float | None): The token quota, if any.
+        max_in_flight (int): Maximum number of batches sent at the same time.
+        max_batch_instances (int): Maximum number of texts per request.
+        max_batch_tokens (int): Maximum number of tokens per request.
+        token_margin (float): Fraction of `max_batch_tokens` left unused
+            when planning batches, to absorb token estimation errors.
+        max_retries (int): Retries of a batch after the first attempt.
+
+    Methods:
+        plan_batches(texts):
+            Splits the texts into batches that fit in one request.
+        embed(texts, model):
+            Returns the embedding values of every text, in input order.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute=None,
+        max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+        max_batch_instances=DEFAULT_MAX_BATCH_INSTANCES,
+        max_batch_tokens=DEFAULT_MAX_BATCH_TOKENS,
+        token_margin=DEFAULT_TOKEN_MARGIN,
+        max_retries=5,
+        backoff_base=1.0,
+        backoff_max=30.0,
+        min_rate_fraction=0.05,
+        recovery_fraction=0.05,
+        token_counter=estimate_text_tokens,
+        sleep=time.sleep,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_in_flight = max_in_flight
+        self.max_batch_instances = max_batch_instances
+        self.max_batch_tokens = max_batch_tokens
+        self.token_margin = token_margin
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.min_rate_fraction = min_rate_fraction
+        self.recovery_fraction = recovery_fraction
+        self.token_counter = token_counter
+        self.sleep = sleep
+
+        self.requests = TokenBucket(requests_per_minute / 60, sleep=sleep)
+        self.tokens = None
+        if tokens_per_minute:
+            self.tokens = TokenBucket(
+                tokens_per_minute / 60,
+                capacity=max(tokens_per_minute / 60, max_batch_tokens),
+                sleep=sleep,
+            )
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._rate_lock = threading.Lock()
+        self._throttled_at = float("-inf")
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Builds the executor from the `BOT_AI_EMBEDDINGS` setting. Supported keys:
+        ``REQUESTS_PER_MINUTE``, ``TOKENS_PER_MINUTE``, ``MAX_IN_FLIGHT``,
+        ``MAX_BATCH_INSTANCES``, ``MAX_BATCH_TOKENS``, ``TOKEN_MARGIN`` and
+        ``MAX_RETRIES``.
+        """
+        config = getattr(settings, "BOT_AI_EMBEDDINGS", {})
+        return cls(
+            requests_per_minute=config.get(
+                "REQUESTS_PER_MINUTE",
+                DEFAULT_REQUESTS_PER_MINUTE,
+            ),
+            tokens_per_minute=config.get("TOKENS_PER_MINUTE"),
+            max_in_flight=config.get("MAX_IN_FLIGHT", DEFAULT_MAX_IN_FLIGHT),
+            max_batch_instances=config.get(
+                "MAX_BATCH_INSTANCES",
+                DEFAULT_MAX_BATCH_INSTANCES,
+            ),
+            max_batch_tokens=config.get("MAX_BATCH_TOKENS", DEFAULT_MAX_BATCH_TOKENS),
+            token_margin=config.get("TOKEN_MARGIN", DEFAULT_TOKEN_MARGIN),
+            max_retries=config.get("MAX_RETRIES", 5),
+        )
+
+    @property
+    def executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_in_flight,
+                    thread_name_prefix="vertex-embed",
+                )
+            return self._executor
+
+    @property
+    def batch_token_budget(self):
+        """The estimated tokens a planned batch may hold."""
+        return int(self.max_batch_tokens * (1 - self.token_margin))
+
+    def plan_batches(self, texts):
+        """
+        Splits the texts into consecutive batches that respect the instance and
+        token limits of one request, keeping `token_margin` of the token limit
+        free. A text above the token budget goes alone.
+
+        Returns:
+            list[tuple[list[str], int]]: The texts and the tokens of each batch.
+        """
+        batches = []
+        batch, batch_tokens = [], 0
+        for text in texts:
+            tokens = self.token_counter(text)
+            if batch and (
+                len(batch) >= self.max_batch_instances
+                or batch_tokens + tokens > self.batch_token_budget
+            ):
+                batches.append((batch, batch_tokens))
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append((batch, batch_tokens))
+        return batches
+
+    def backoff(self, attempt):
+        """Returns the jittered delay before a retry (full jitter)."""
+        return random.uniform(  # noqa: S311
+            0,
+            min(self.backoff_max, self.backoff_base * 2**attempt),
+        )
+
+    def _throttle(self):
+        base = self.requests_per_minute / 60
+        with self._rate_lock:
+            # Batches in flight often hit the same 429, the rate is halved once
+            now = time.monotonic()
+            if now - self._throttled_at < self.backoff_base:
+                return
+            self._throttled_at = now
+            rate = max(base * self.min_rate_fraction, self.requests.rate / 2)
+            self.requests.set_rate(rate)
+        logger.warning(f"Embedding quota exceeded, rate lowered to {rate * 60:.0f}/min")  # noqa: G004
+
+    def _recover(self):
+        base = self.requests_per_minute / 60
+        with self._rate_lock:
+            if self.requests.rate >= base:
+                return
+            rate = min(base, self.requests.rate + base * self.recovery_fraction)
+            self.requests.set_rate(rate)
+
+    def _embed_batch(self, texts, tokens, model):
+        try:
+            return self._send_batch(texts, tokens, model)
+        except google_exceptions.InvalidArgument as e:
+            # The estimate fell short of the Vertex tokenizer, the halves fit
+            if len(texts) == 1 or "token" not in str(e).lower():
+                raise
+            logger.warning(f"Embedding batch of {len(texts)} texts over the token limit, splitting it")  # noqa: E501, G004
+            middle = len(texts) // 2
+            halves = [texts[:middle], texts[middle:]]
+            return [
+                values
+                for half in halves
+                for values in self._embed_batch(
+                    half,
+                    sum(self.token_counter(text) for text in half),
+                    model,
+                )
+            ]
+
+    def _send_batch(self, texts, tokens, model):
+        with track("vertex.embed", model=embedding_model_name(model)) as record:
+            attempt = 0
+            while True:
+                self.requests.acquire()
+                if self.tokens is not None:
+                    self.tokens.acquire(tokens)
+                try:
+                    result = model.get_embeddings(texts)
+                except google_exceptions.TooManyRequests:
+                    self._throttle()
+                    if attempt >= self.max_retries:
+                        raise
+                except RETRYABLE_EXCEPTIONS as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    logger.warning(f"Embedding call failed ({e!r})")  # noqa: G004
+                else:
+                    self._recover()
+                    record.input_tokens += tokens
+                    return [embedding.values for embedding in result]  # noqa: PD011
+                note_retry()
+                self.sleep(self.backoff(attempt))
+                attempt += 1
+
+    def embed(self, texts, model):
+        """
+        Computes the embeddings of the texts with concurrent batches.
+
+        Args:
+            texts (list[str]): The texts to embed.
+            model (TextEmbeddingModel): The embedding model.
+
+        Returns:
+            list[list[float]]: The embedding values, in the same order as `texts`.
+        """
+        batches = self.plan_batches(texts)
+        if len(batches) == 1:
+            return self._embed_batch(*batches[0], model)
+
+        futures = [
+            self.executor.submit(self._embed_batch, batch, tokens, model)
+            for batch, tokens in batches
+        ]
+        embeddings = []
+        for future in futures:
+            embeddings.extend(future.result())
+        return embeddings
+
+
+embedding_executor = EmbeddingExecutor.from_settings()
@@ -1,11 +1,7 @@
 from pathlib import Path
 
-import pandas as pd
 from django.conf import settings
 from django.utils import timezone
-from docx import Document
-from langchain_community.document_loaders import PyPDFLoader
-from pptx import Presentation
 
 from app.bot_ai.utils import get_file_divition
 
@@ -72,6 +68,8 @@ class PDFExtractor:
         """
         Extracts text from a PDF file and stores it in the `file_text` attribute.
         """
+        from langchain_community.document_loaders import PyPDFLoader
+
         self.create_export_folder()
         customer_folder = self.customer_folder()
         scrape_file = "Tupper_Tips_NORTE.pdf"
@@ -87,6 +85,8 @@ class PDFExtractor:
         """
         Extracts text from a PowerPoint (.pptx) file and stores it in the `file_text` attribute.
         """  # noqa: E501
+        from pptx import Presentation
+
         self.create_export_folder()
         customer_folder = self.customer_folder()
         scrape_file = "Seaborn-Scikitlearn.pptx"
@@ -104,6 +104,8 @@ class PDFExtractor:
         """
         Extracts text from a Word document (.docx) and stores it in the `file_text` attribute.
         """  # noqa: E501
+        from docx import Document
+
         self.create_export_folder()
         customer_folder = self.customer_folder()
         scrape_file = "MEMORIA-DE-PP-2024.docx"
@@ -119,6 +121,8 @@ class PDFExtractor:
         """
         Converts an Excel (.xlsx) file to a CSV file and saves it in the export folder.
         """
+        import pandas as pd
+
         self.create_export_folder()
         customer_folder = self.customer_folder()
         scrape_file = "Lista de asistencia del club.xlsx"
@@ -140,6 +144,8 @@ class PDFExtractor:
             list: A list of file paths for the split CSV files.
             list: A list of names for the split CSV files.
         """  # noqa: E501
+        import pandas as pd
+
         self.create_export_folder()
         files_list = []
         files_name_list = []
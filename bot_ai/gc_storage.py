@@ -6,12 +6,18 @@ from google.api_core.exceptions import BadRequest
 from google.api_core.exceptions import Conflict
 from google.api_core.exceptions import FailedPrecondition
 from google.api_core.exceptions import NotFound
-from google.cloud import storage
 from google.cloud import storage_control_v2
 
+from app.bot_ai.clients import make_storage_client
+from app.bot_ai.clients import make_storage_control_client
+from app.bot_ai.instrumentation import current_record
+from app.bot_ai.instrumentation import instrumented
+from app.bot_ai.signals import blob_generation_changed
 from app.bot_ai.utils import extract_text_after_folders
 from app.common.models import ErrorLogModel
 
+logger = logging.getLogger(__name__)
+
 
 class GCSManager:
     """
@@ -45,12 +51,17 @@ class GCSManager:
             Deletes a specified file (blob) from a bucket.
         delete_all_files(bucket_name):
             Deletes all files inside a bucket.
+        get_blob_generations(uris):
+            Retrieves the current generation of a list of blobs.
     """  # noqa: E501
 
     def __init__(self):
-        """Initializes the GCSManager with Google Cloud Storage clients."""
-        self.storage_client = storage.Client()
-        self.storage_control_client = storage_control_v2.StorageControlClient()
+        """
+        Initializes the GCSManager with Google Cloud Storage clients, or their
+        local stand-ins when `BOT_AI_BACKEND` is "local".
+        """
+        self.storage_client = make_storage_client()
+        self.storage_control_client = make_storage_control_client()
         self.project_id = PROJECT_ID
 
     def create_bucket_hierarchical_namespace(self, bucket_name: str) -> None:
@@ -92,7 +103,7 @@ class GCSManager:
             bucket_name (str): The name of the GCS bucket.
             folder_name (str): The name of the folder to create.
         """
-        storage_control_client = storage_control_v2.StorageControlClient()
+        storage_control_client = self.storage_control_client
         project_path = storage_control_client.common_project_path("_")
         bucket_path = f"{project_path}/buckets/{bucket_name}"
 
@@ -127,7 +138,7 @@ class GCSManager:
             company_folder (str): The name of the company's folder.
             bucket_path (str): The path to the bucket.
         """
-        storage_control_client = storage_control_v2.StorageControlClient()
+        storage_control_client = self.storage_control_client
 
         # Create "temporary" folder
         request = storage_control_v2.CreateFolderRequest(
@@ -153,7 +164,7 @@ class GCSManager:
         Returns:
             list: A list of folder names in the bucket.
         """
-        storage_control_client = storage_control_v2.StorageControlClient()
+        storage_control_client = self.storage_control_client
         project_path = storage_control_client.common_project_path("_")
         bucket_path = f"{project_path}/buckets/{bucket_name}"
 
@@ -177,7 +188,7 @@ class GCSManager:
             bucket_name (str): The name of the GCS bucket.
             folder_name (str): The name of the folder to delete.
         """
-        storage_control_client = storage_control_v2.StorageControlClient()
+        storage_control_client = self.storage_control_client
         folder_path = storage_control_client.folder_path(
             project="_",
             bucket=bucket_name,
@@ -216,6 +227,7 @@ class GCSManager:
         for folder in reversed_folders:
             self.delete_folder(bucket_name, folder)
 
+    @instrumented("gcs.upload_file")
     def upload_file(
         self,
         bucket_name: str,
@@ -236,11 +248,21 @@ class GCSManager:
         # Set generation-match precondition to avoid potential race condition
         generation_match_precondition = 0
 
-        return blob.upload_from_filename(
+        result = blob.upload_from_filename(
             source_file_name,
             if_generation_match=generation_match_precondition,
         )
+        current_record().bytes_out += blob.size or 0
+
+        blob_generation_changed.send(
+            sender=self.__class__,
+            bucket_name=bucket_name,
+            blob_name=destination_blob_name,
+            generation=blob.generation,
+        )
+        return result
 
+    @instrumented("gcs.list_files_in_folder")
     def list_files_in_folder(self, bucket_name: str) -> list:
         """
         Lists all the files inside the folders of a bucket.
@@ -285,6 +307,7 @@ class GCSManager:
         prefix = f"gs://{self.project_id}/"
         return [prefix + file for file in files_list]
 
+    @instrumented("gcs.delete_file")
     def delete_file(self, bucket_name: str, file_url: str) -> None:
         """
         Deletes a blob (file) from the specified GCS bucket.
@@ -306,6 +329,32 @@ class GCSManager:
         # Delete the file from the bucket, using generation match to avoid race conditions  # noqa: E501
         blob.delete(if_generation_match=generation_match_precondition)
 
+        blob_generation_changed.send(
+            sender=self.__class__,
+            bucket_name=bucket_name,
+            blob_name=file_url,
+            generation=None,
+        )
+
+    @instrumented("gcs.get_blob_generations")
+    def get_blob_generations(self, uris: list) -> dict:
+        """
+        Retrieves the current generation of each blob in a list of gs:// URIs.
+
+        Args:
+            uris (list): The gs://bucket/name URIs of the blobs.
+
+        Returns:
+            dict: The generation of each URI, None for blobs that do not exist.
+        """
+        generations = {}
+        for uri in uris:
+            bucket_name, _, blob_name = uri.removeprefix("gs://").partition("/")
+            blob = self.storage_client.bucket(bucket_name).get_blob(blob_name)
+            generations[uri] = blob.generation if blob is not None else None
+
+        return generations
+
     def delete_all_files(self, bucket_name: str) -> None:
         """
         Deletes all files inside the specified GCS bucket.
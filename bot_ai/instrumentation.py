@@ -0,0 +1,380 @@
+import asyncio
+import contextvars
+import copy
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import field
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+metrics_logger = logging.getLogger("app.bot_ai.metrics")
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+
+_current_record = contextvars.ContextVar("bot_ai_call_record", default=None)
+
+
+@dataclass
+class CallRecord:
+    """
+    What a single instrumented call did.
+
+    Attributes:
+        name (str): The name of the call, e.g. ``vertex.generate``.
+        labels (dict): Extra labels, e.g. the model name.
+        seconds (float): Wall time of the call.
+        outcome (str): ``ok`` or ``error``.
+        error (str | None): The exception type when the call failed.
+        bytes_in (int): Bytes read (downloads, scanned data).
+        bytes_out (int): Bytes sent (uploads).
+        input_tokens (int): Prompt tokens reported by the model.
+        output_tokens (int): Completion tokens reported by the model.
+        retries (int): Retries made by the resilience policy.
+    """
+
+    name: str
+    labels: dict = field(default_factory=dict)
+    seconds: float = 0.0
+    outcome: str = "ok"
+    error: str | None = None
+    bytes_in: int = 0
+    bytes_out: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    retries: int = 0
+
+    def add_usage(self, usage_metadata):
+        """
+        Adds the token usage reported by Vertex (object or dict) to the record.
+        """
+        if usage_metadata is None:
+            return
+        if isinstance(usage_metadata, dict):
+            self.input_tokens += usage_metadata.get("prompt_token_count", 0) or 0
+            self.output_tokens += usage_metadata.get("candidates_token_count", 0) or 0
+            return
+        self.input_tokens += getattr(usage_metadata, "prompt_token_count", 0) or 0
+        self.output_tokens += getattr(usage_metadata, "candidates_token_count", 0) or 0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class HistogramSink:
+    """
+    Aggregates the records in process as latency histograms plus counters of
+    bytes, tokens, retries and outcomes, and renders them in the Prometheus
+    text format. Each worker process keeps its own numbers.
+
+    Methods:
+        emit(record):
+            Adds a record to the aggregates.
+        snapshot():
+            Returns the aggregates of every call name.
+        prometheus_text():
+            Renders the aggregates in the Prometheus exposition format.
+        clear():
+            Drops every aggregate.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}
+
+    @staticmethod
+    def series_key(record):
+        return (record.name, tuple(sorted(record.labels.items())))
+
+    def emit(self, record):
+        key = self.series_key(record)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {
+                    "bucket_counts": [0] * len(self.buckets),
+                    "count": 0,
+                    "sum": 0.0,
+                    "outcomes": {},
+                    "bytes_in": 0,
+                    "bytes_out": 0,
+                    "input_tokens": 0,
+                    "output_tokens": 0,
+                    "retries": 0,
+                }
+                self._series[key] = series
+
+            for index, bound in enumerate(self.buckets):
+                if record.seconds <= bound:
+                    series["bucket_counts"][index] += 1
+            series["count"] += 1
+            series["sum"] += record.seconds
+            series["outcomes"][record.outcome] = (
+                series["outcomes"].get(record.outcome, 0) + 1
+            )
+            series["bytes_in"] += record.bytes_in
+            series["bytes_out"] += record.bytes_out
+            series["input_tokens"] += record.input_tokens
+            series["output_tokens"] += record.output_tokens
+            series["retries"] += record.retries
+
+    def percentile(self, series, q):
+        """
+        Returns the upper bucket bound under which `q` percent of the calls fell.
+        """
+        if not series["count"]:
+            return 0.0
+        target = series["count"] * q / 100
+        for bound, count in zip(self.buckets, series["bucket_counts"], strict=True):
+            if count >= target:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        with self._lock:
+            series = copy.deepcopy(self._series)
+        result = []
+        for (name, labels), value in series.items():
+            result.append(
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": value["count"],
+                    "total_seconds": value["sum"],
+                    "p50": self.percentile(value, 50),
+                    "p95": self.percentile(value, 95),
+                    "outcomes": dict(value["outcomes"]),
+                    "bytes_in": value["bytes_in"],
+                    "bytes_out": value["bytes_out"],
+                    "input_tokens": value["input_tokens"],
+                    "output_tokens": value["output_tokens"],
+                    "retries": value["retries"],
+                },
+            )
+        return sorted(result, key=lambda item: item["total_seconds"], reverse=True)
+
+    @staticmethod
+    def _labels(name, labels, **extra):
+        pairs = [("call", name), *labels, *extra.items()]
+        text = ",".join(f'{key}="{_escape_label(value)}"' for key, value in pairs)
+        return "{" + text + "}"
+
+    def prometheus_text(self):
+        with self._lock:
+            series = copy.deepcopy(self._series)
+
+        duration = [
+            "# HELP bot_ai_call_duration_seconds Wall time of bot_ai calls.",
+            "# TYPE bot_ai_call_duration_seconds histogram",
+        ]
+        calls = [
+            "# HELP bot_ai_calls_total Calls by outcome.",
+            "# TYPE bot_ai_calls_total counter",
+        ]
+        moved = [
+            "# HELP bot_ai_call_bytes_total Bytes moved by bot_ai calls.",
+            "# TYPE bot_ai_call_bytes_total counter",
+        ]
+        tokens = [
+            "# HELP bot_ai_call_tokens_total Tokens reported by the model.",
+            "# TYPE bot_ai_call_tokens_total counter",
+        ]
+        retries = [
+            "# HELP bot_ai_call_retries_total Retries made by the resilience policy.",
+            "# TYPE bot_ai_call_retries_total counter",
+        ]
+
+        for (name, labels), value in sorted(series.items()):
+            for bound, count in zip(self.buckets, value["bucket_counts"], strict=True):
+                duration.append(
+                    f"bot_ai_call_duration_seconds_bucket{self._labels(name, labels, le=bound)} {count}",  # noqa: E501
+                )
+            duration.append(
+                f"bot_ai_call_duration_seconds_bucket{self._labels(name, labels, le='+Inf')} {value['count']}",  # noqa: E501
+            )
+            duration.append(
+                f"bot_ai_call_duration_seconds_sum{self._labels(name, labels)} {value['sum']}",  # noqa: E501
+            )
+            duration.append(
+                f"bot_ai_call_duration_seconds_count{self._labels(name, labels)} {value['count']}",  # noqa: E501
+            )
+            for outcome, count in sorted(value["outcomes"].items()):
+                calls.append(
+                    f"bot_ai_calls_total{self._labels(name, labels, outcome=outcome)} {count}",  # noqa: E501
+                )
+            for direction in ("in", "out"):
+                moved.append(
+                    f"bot_ai_call_bytes_total{self._labels(name, labels, direction=direction)} {value['bytes_' + direction]}",  # noqa: E501
+                )
+            for kind in ("input", "output"):
+                tokens.append(
+                    f"bot_ai_call_tokens_total{self._labels(name, labels, kind=kind)} {value[kind + '_tokens']}",  # noqa: E501
+                )
+            retries.append(
+                f"bot_ai_call_retries_total{self._labels(name, labels)} {value['retries']}",  # noqa: E501
+            )
+
+        return "\n".join([*duration, *calls, *moved, *tokens, *retries]) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class JsonLogSink:
+    """
+    Writes every record as one JSON line to the ``app.bot_ai.metrics`` logger.
+    """
+
+    def __init__(self, log=metrics_logger):
+        self.log = log
+
+    def emit(self, record):
+        self.log.info(json.dumps(record.as_dict(), default=str))
+
+
+class Instrumentation:
+    """
+    Times calls and hands a `CallRecord` of each one to the configured sinks.
+
+    Methods:
+        track(name, **labels):
+            Context manager that records the call it wraps.
+        instrumented(name=None, **labels):
+            Decorator that records every call of a function or coroutine.
+        emit(record):
+            Sends a record to every sink.
+    """
+
+    def __init__(self, sinks=None, clock=time.perf_counter):
+        self.sinks = list(sinks or [])
+        self.clock = clock
+
+    @property
+    def histogram(self):
+        """Returns the first histogram sink, or None."""
+        for sink in self.sinks:
+            if isinstance(sink, HistogramSink):
+                return sink
+        return None
+
+    def emit(self, record):
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception as e:  # noqa: BLE001
+                logger.warning(f"Metrics sink {sink!r} failed: {e}")  # noqa: G004
+
+    @contextmanager
+    def track(self, name, **labels):
+        """
+        Records the wall time and outcome of the wrapped block. The yielded
+        record can be filled with bytes and token usage by the caller.
+        """
+        record = CallRecord(name=name, labels=labels)
+        token = _current_record.set(record)
+        started = self.clock()
+        try:
+            yield record
+        except BaseException as e:
+            record.outcome = "error"
+            record.error = type(e).__name__
+            raise
+        finally:
+            record.seconds = self.clock() - started
+            _current_record.reset(token)
+            self.emit(record)
+
+    def instrumented(self, name=None, **labels):
+        """
+        Decorator version of `track`. The call name defaults to the qualified
+        name of the function.
+        """
+
+        def decorator(func):
+            call_name = name or f"{func.__module__}.{func.__qualname__}"
+
+            if asyncio.iscoroutinefunction(func):
+
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.track(call_name, **labels):
+                        return await func(*args, **kwargs)
+
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.track(call_name, **labels):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+def current_record():
+    """
+    Returns the record of the innermost instrumented call, or None.
+    """
+    return _current_record.get()
+
+
+def note_retry():
+    """
+    Counts a retry against the innermost instrumented call.
+    """
+    record = _current_record.get()
+    if record is not None:
+        record.retries += 1
+
+
+def build_instrumentation():
+    """
+    Builds the instrumentation from the `BOT_AI_METRICS` setting.
+
+    Supported keys: ``SINKS`` (any of ``"histogram"`` and ``"json"``, defaults
+    to ``["histogram"]``) and ``BUCKETS`` (histogram bounds in seconds).
+    """
+    config = getattr(settings, "BOT_AI_METRICS", {})
+
+    sinks = []
+    for sink_name in config.get("SINKS", ["histogram"]):
+        if sink_name == "histogram":
+            sinks.append(HistogramSink(buckets=config.get("BUCKETS", DEFAULT_BUCKETS)))
+        elif sink_name == "json":
+            sinks.append(JsonLogSink())
+        else:
+            logger.warning(f"Unknown metrics sink {sink_name}")  # noqa: G004
+
+    return Instrumentation(sinks=sinks)
+
+
+metrics = build_instrumentation()
+track = metrics.track
+instrumented = metrics.instrumented
@@ -1,11 +1,7 @@
 import logging
-import os
 from collections.abc import Sequence
 from typing import Annotated
 
-import vertexai
-from django.conf import settings
-from google.oauth2 import service_account
 from langchain_core.messages import AIMessage
 from langchain_core.messages import BaseMessage
 from langchain_core.messages import HumanMessage
@@ -16,6 +12,8 @@ from langgraph.graph import StateGraph
 from langgraph.graph.message import add_messages
 from typing_extensions import TypedDict
 
+from app.bot_ai.clients import get_credentials
+from app.bot_ai.clients import init_vertexai
 from app.bot_whatsapp.utils import render_message_txt
 
 logger = logging.getLogger(__name__)
@@ -40,6 +38,7 @@ class AIWorkflow:
         self.app = self.workflow.compile(checkpointer=self.memory)
 
         # Initialize the LLM model
+        init_vertexai()
         self.llm = ChatVertexAI(
             model=MODEL_VERTEX,
         )  # Replace MODEL_VERTEX with your model identifier
@@ -91,12 +90,11 @@ class AIWorkflow:
         return self.app.invoke(initial_state, config=config)
 
 
-DIR_CREDENTIALS = settings.BASE_DIR / "clave.json"
-CREDENTIALS = service_account.Credentials.from_service_account_file(DIR_CREDENTIALS)
+MODEL_VERTEX = "gemini-1.5-pro-002"
 
-PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT_ID")
-LOCATION = "us-central1"
 
-MODEL_VERTEX = "gemini-1.5-pro-002"
-# vertexai.init(project=PROJECT_ID, location=LOCATION, credentials=CREDENTIALS)  # noqa: ERA001,E501
-vertexai.init(project=PROJECT_ID, location=LOCATION)
+def __getattr__(name):
+    # Module-level CREDENTIALS is kept for callers, but read on first access
+    if name == "CREDENTIALS":
+        return get_credentials()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")  # noqa: EM102
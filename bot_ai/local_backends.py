@@ -0,0 +1,830 @@
+import asyncio
+import base64
+import csv
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from types import SimpleNamespace
+
+from django.conf import settings
+from google.api_core.exceptions import AlreadyExists
+from google.api_core.exceptions import Conflict
+from google.api_core.exceptions import NotFound
+from google.api_core.exceptions import PreconditionFailed
+
+from app.bot_ai.token_budget import content_parts
+from app.bot_ai.token_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Local stand-ins of the Google services used by bot_ai, selected with
+# BOT_AI_BACKEND = "local". Only the subset of each API that bot_ai calls is
+# implemented.
+
+DEFAULT_LATENCY_MS = 300
+DEFAULT_LATENCY_JITTER_MS = 100
+DEFAULT_OUTPUT_TOKENS = (40, 400)
+DEFAULT_EMBEDDING_DIMENSIONS = 768
+DEFAULT_EMBEDDING_LATENCY_MS = 50
+STREAM_CHUNK_TOKENS = 20
+
+WORDS = (
+    "hola gracias producto pedido envío precio tienda cliente ayuda información "
+    "disponible tamaño color garantía pago tarjeta entrega semana catálogo marca"
+).split()
+
+
+def local_config():
+    """Returns the `BOT_AI_LOCAL` setting."""
+    return getattr(settings, "BOT_AI_LOCAL", {})
+
+
+def local_root():
+    """Returns the directory that holds the local GCS objects and BigQuery tables."""
+    root = local_config().get("ROOT") or settings.BASE_DIR / ".bot_ai_local"
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    return root
+
+
+@dataclass
+class FakeUsageMetadata:
+    prompt_token_count: int = 0
+    candidates_token_count: int = 0
+    total_token_count: int = 0
+
+
+class FakeResponse:
+    """Stand-in of a `GenerationResponse` holding text and usage."""
+
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+        self.candidates = [
+            SimpleNamespace(
+                content=SimpleNamespace(
+                    role="model",
+                    parts=[SimpleNamespace(text=text)],
+                ),
+                finish_reason=1,
+            ),
+        ]
+
+
+class FakeGenerativeModel:
+    """
+    Stand-in of `GenerativeModel` that answers with generated text after a
+    simulated latency, drawn from a normal distribution, and a number of output
+    tokens drawn uniformly from a range. Prompt tokens are estimated locally.
+
+    Args:
+        model_name (str): The name reported by the model.
+        system_instruction (str | list, optional): Counted as prompt tokens.
+        latency_ms (float): Mean latency of a call.
+        latency_jitter_ms (float): Standard deviation of the latency.
+        output_tokens (tuple[int, int]): Range of the number of output tokens.
+        seed (int | None): Seed of the random generator, for reproducible runs.
+        sleep (callable): Blocking sleep, replaceable to skip the latency.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        model_name,
+        system_instruction=None,
+        generation_config=None,
+        latency_ms=DEFAULT_LATENCY_MS,
+        latency_jitter_ms=DEFAULT_LATENCY_JITTER_MS,
+        output_tokens=DEFAULT_OUTPUT_TOKENS,
+        seed=None,
+        sleep=time.sleep,
+    ):
+        self._model_name = model_name
+        self.system_instruction = system_instruction
+        self.generation_config = generation_config
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.output_tokens = tuple(output_tokens)
+        self.sleep = sleep
+        self._random = random.Random(seed)  # noqa: S311
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    @classmethod
+    def from_settings(cls, model_name, system_instruction=None, generation_config=None):
+        """
+        Builds the model from the `BOT_AI_LOCAL` setting. Supported keys:
+        ``LATENCY_MS``, ``LATENCY_JITTER_MS``, ``OUTPUT_TOKENS`` and ``SEED``.
+        """
+        config = local_config()
+        return cls(
+            model_name,
+            system_instruction=system_instruction,
+            generation_config=generation_config,
+            latency_ms=config.get("LATENCY_MS", DEFAULT_LATENCY_MS),
+            latency_jitter_ms=config.get(
+                "LATENCY_JITTER_MS",
+                DEFAULT_LATENCY_JITTER_MS,
+            ),
+            output_tokens=config.get("OUTPUT_TOKENS", DEFAULT_OUTPUT_TOKENS),
+            seed=config.get("SEED"),
+        )
+
+    @property
+    def model_name(self):
+        return self._model_name
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            latency = max(
+                0.0,
+                self._random.gauss(self.latency_ms, self.latency_jitter_ms),
+            )
+            tokens = self._random.randint(*self.output_tokens)
+            words = [self._random.choice(WORDS) for _ in range(max(1, tokens * 3 // 4))]
+        return latency / 1000, tokens, " ".join(words)
+
+    def _prompt_tokens(self, contents):
+        if not isinstance(contents, list | tuple):
+            contents = [contents]
+        system = self.system_instruction or []
+        if isinstance(system, str):
+            system = [system]
+        return estimate_tokens(list(system)) + estimate_tokens(list(contents))
+
+    def _usage(self, prompt_tokens, output_tokens):
+        return FakeUsageMetadata(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        )
+
+    def _chunks(self, text, usage):
+        words = text.split(" ")
+        step = max(1, STREAM_CHUNK_TOKENS * 3 // 4)
+        pieces = [" ".join(words[i : i + step]) for i in range(0, len(words), step)]
+        for index, piece in enumerate(pieces):
+            last = index == len(pieces) - 1
+            yield FakeResponse(
+                piece if index == 0 else f" {piece}",
+                usage if last else None,
+            )
+
+    def _json_mode(self, generation_config):
+        config = generation_config or self.generation_config or {}
+        if hasattr(config, "to_dict"):
+            config = config.to_dict()
+        return config.get("response_mime_type") == "application/json"
+
+    def generate_content(self, contents, *args, stream=False, **kwargs):
+        latency, tokens, text = self._draw()
+        if self._json_mode(kwargs.get("generation_config")):
+            # Response schemas are not followed locally, every field comes back empty
+            text = "{}"
+        usage = self._usage(self._prompt_tokens(contents), tokens)
+        if stream:
+            return self._stream(latency, text, usage)
+        self.sleep(latency)
+        return FakeResponse(text, usage)
+
+    def _stream(self, latency, text, usage):
+        chunks = list(self._chunks(text, usage))
+        for chunk in chunks:
+            self.sleep(latency / len(chunks))
+            yield chunk
+
+    async def generate_content_async(self, contents, *args, stream=False, **kwargs):
+        latency, tokens, text = self._draw()
+        if self._json_mode(kwargs.get("generation_config")):
+            text = "{}"
+        usage = self._usage(self._prompt_tokens(contents), tokens)
+        if stream:
+            return self._astream(latency, text, usage)
+        await asyncio.sleep(latency)
+        return FakeResponse(text, usage)
+
+    async def _astream(self, latency, text, usage):
+        chunks = list(self._chunks(text, usage))
+        for chunk in chunks:
+            await asyncio.sleep(latency / len(chunks))
+            yield chunk
+
+    def count_tokens(self, contents):
+        return SimpleNamespace(total_tokens=self._prompt_tokens(contents))
+
+    def start_chat(self, history=None, **kwargs):
+        return FakeChatSession(self, history)
+
+
+class FakeChatSession:
+    """Stand-in of `ChatSession` that keeps the history of its turns."""
+
+    def __init__(self, model, history=None):
+        self._model = model
+        self.history = list(history or [])
+
+    @staticmethod
+    def _user_content(contents):
+        if not isinstance(contents, list | tuple):
+            contents = [contents]
+        parts = []
+        for content in contents:
+            parts.extend(
+                SimpleNamespace(text=part) if isinstance(part, str) else part
+                for part in content_parts(content)
+            )
+        return SimpleNamespace(role="user", parts=parts)
+
+    def _model_content(self, text):
+        return SimpleNamespace(role="model", parts=[SimpleNamespace(text=text)])
+
+    def send_message(self, contents, *args, stream=False, **kwargs):
+        response = self._model.generate_content(
+            [*self.history, contents],
+            stream=stream,
+        )
+        self.history.append(self._user_content(contents))
+        if stream:
+            return self._record_stream(response)
+        self.history.append(self._model_content(response.text))
+        return response
+
+    def _record_stream(self, responses):
+        text = ""
+        for response in responses:
+            text += response.text
+            yield response
+        self.history.append(self._model_content(text))
+
+    async def send_message_async(self, contents, *args, stream=False, **kwargs):
+        response = await self._model.generate_content_async(
+            [*self.history, contents],
+            stream=stream,
+        )
+        self.history.append(self._user_content(contents))
+        if stream:
+            return self._arecord_stream(response)
+        self.history.append(self._model_content(response.text))
+        return response
+
+    async def _arecord_stream(self, responses):
+        text = ""
+        async for response in responses:
+            text += response.text
+            yield response
+        self.history.append(self._model_content(text))
+
+
+@dataclass
+class FakeTextEmbedding:
+    values: list
+
+
+class FakeTextEmbeddingModel:
+    """
+    Stand-in of `TextEmbeddingModel`. A text always gets the same unit vector,
+    derived from its hash, so similarity searches are reproducible.
+
+    Args:
+        dimensions (int): Length of the vectors.
+        latency_ms (float): Latency of a `get_embeddings` call.
+        sleep (callable): Blocking sleep, replaceable to skip the latency.
+    """
+
+    def __init__(
+        self,
+        model_name="text-multilingual-embedding-002",
+        dimensions=DEFAULT_EMBEDDING_DIMENSIONS,
+        latency_ms=DEFAULT_EMBEDDING_LATENCY_MS,
+        sleep=time.sleep,
+    ):
+        self.model_name = model_name
+        self.dimensions = dimensions
+        self.latency_ms = latency_ms
+        self.sleep = sleep
+        self.calls = 0
+
+    @classmethod
+    def from_settings(cls, model_name="text-multilingual-embedding-002"):
+        """
+        Builds the model from the `BOT_AI_LOCAL` setting. Supported keys:
+        ``EMBEDDING_DIMENSIONS`` and ``EMBEDDING_LATENCY_MS``.
+        """
+        config = local_config()
+        return cls(
+            model_name,
+            dimensions=config.get("EMBEDDING_DIMENSIONS", DEFAULT_EMBEDDING_DIMENSIONS),
+            latency_ms=config.get("EMBEDDING_LATENCY_MS", DEFAULT_EMBEDDING_LATENCY_MS),
+        )
+
+    def embed(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        generator = random.Random(seed)  # noqa: S311
+        values = [generator.gauss(0, 1) for _ in range(self.dimensions)]
+        norm = math.sqrt(sum(value * value for value in values)) or 1.0
+        return [value / norm for value in values]
+
+    def get_embeddings(self, texts, *args, **kwargs):
+        self.calls += 1
+        self.sleep(self.latency_ms / 1000)
+        return [FakeTextEmbedding(self.embed(text)) for text in texts]
+
+
+class LocalBlob:
+    """Filesystem-backed stand-in of `storage.Blob`."""
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def path(self):
+        return self.bucket.path / self.name
+
+    def exists(self, *args, **kwargs):
+        return self.path.is_file()
+
+    @property
+    def generation(self):
+        if not self.exists():
+            return None
+        return self.path.stat().st_mtime_ns
+
+    @property
+    def size(self):
+        if not self.exists():
+            return None
+        return self.path.stat().st_size
+
+    @property
+    def md5_hash(self):
+        if not self.exists():
+            return None
+        digest = hashlib.md5(self.path.read_bytes()).digest()  # noqa: S324
+        return base64.b64encode(digest).decode("ascii")
+
+    def reload(self, *args, **kwargs):
+        if not self.exists():
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")  # noqa: EM102, TRY003
+
+    def _check_generation(self, if_generation_match):
+        if if_generation_match is None:
+            return
+        if (self.generation or 0) != if_generation_match:
+            raise PreconditionFailed(  # noqa: TRY003
+                f"Generation mismatch for {self.bucket.name}/{self.name}",  # noqa: EM102
+            )
+
+    def upload_from_filename(self, filename, *args, if_generation_match=None, **kwargs):
+        self._check_generation(if_generation_match)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(filename, self.path)
+
+    def upload_from_string(self, data, *args, if_generation_match=None, **kwargs):
+        self._check_generation(if_generation_match)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.path.write_bytes(data)
+
+    def download_as_bytes(self, *args, **kwargs):
+        self.reload()
+        return self.path.read_bytes()
+
+    def download_as_text(self, *args, encoding="utf-8", **kwargs):
+        return self.download_as_bytes().decode(encoding)
+
+    def download_to_filename(self, filename, *args, **kwargs):
+        self.reload()
+        shutil.copyfile(self.path, filename)
+
+    def delete(self, *args, if_generation_match=None, **kwargs):
+        self.reload()
+        self._check_generation(if_generation_match)
+        self.path.unlink()
+
+
+class LocalBucket:
+    """Filesystem-backed stand-in of `storage.Bucket`."""
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.iam_configuration = SimpleNamespace(
+            uniform_bucket_level_access_enabled=False,
+        )
+        self.hierarchical_namespace_enabled = False
+
+    @property
+    def path(self):
+        return self.client.root / self.name
+
+    def exists(self, *args, **kwargs):
+        return self.path.is_dir()
+
+    def create(self, *args, **kwargs):
+        if self.exists():
+            raise Conflict(f"Bucket {self.name} already exists")  # noqa: EM102, TRY003
+        self.path.mkdir(parents=True)
+
+    def blob(self, name, *args, **kwargs):
+        return LocalBlob(self, name)
+
+    def get_blob(self, name, *args, **kwargs):
+        blob = LocalBlob(self, name)
+        return blob if blob.exists() else None
+
+    def list_blobs(self, prefix=None, *args, **kwargs):
+        if not self.exists():
+            return []
+        names = sorted(
+            path.relative_to(self.path).as_posix()
+            for path in self.path.rglob("*")
+            if path.is_file()
+        )
+        return [
+            LocalBlob(self, name)
+            for name in names
+            if prefix is None or name.startswith(prefix)
+        ]
+
+
+class LocalStorageClient:
+    """
+    Filesystem-backed stand-in of `storage.Client`. Every bucket is a directory
+    under `root` and every blob a file, and the generation of a blob is the
+    modification time of its file.
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root is not None else local_root() / "gcs"
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def bucket(self, bucket_name, *args, **kwargs):
+        return LocalBucket(self, bucket_name)
+
+    def get_bucket(self, bucket_name, *args, **kwargs):
+        bucket = LocalBucket(self, bucket_name)
+        if not bucket.exists():
+            raise NotFound(f"Bucket {bucket_name} not found")  # noqa: EM102, TRY003
+        return bucket
+
+    def create_bucket(self, bucket_name, *args, **kwargs):
+        bucket = LocalBucket(self, getattr(bucket_name, "name", bucket_name))
+        bucket.create()
+        return bucket
+
+    def list_blobs(self, bucket_or_name, prefix=None, *args, **kwargs):
+        name = getattr(bucket_or_name, "name", bucket_or_name)
+        return LocalBucket(self, name).list_blobs(prefix=prefix)
+
+
+class LocalStorageControlClient:
+    """
+    Filesystem-backed stand-in of `storage_control_v2.StorageControlClient`
+    for the folder operations. Folders are directories under the bucket.
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root is not None else local_root() / "gcs"
+
+    @staticmethod
+    def common_project_path(project):
+        return f"projects/{project}"
+
+    @staticmethod
+    def folder_path(project, bucket, folder):
+        return f"projects/{project}/buckets/{bucket}/folders/{folder}"
+
+    def _bucket_path(self, parent):
+        return self.root / parent.split("/buckets/", 1)[1].strip("/")
+
+    def create_folder(self, request=None, **kwargs):
+        path = self._bucket_path(request.parent) / request.folder_id
+        if path.is_dir():
+            raise AlreadyExists(f"Folder {request.folder_id} already exists")  # noqa: EM102, TRY003
+        path.mkdir(parents=True)
+        return SimpleNamespace(name=f"{request.parent}/folders/{request.folder_id}/")
+
+    def list_folders(self, request=None, **kwargs):
+        bucket_path = self._bucket_path(request.parent)
+        if not bucket_path.is_dir():
+            return []
+        return [
+            SimpleNamespace(
+                name=f"{request.parent}/folders/{path.relative_to(bucket_path).as_posix()}/",
+            )
+            for path in sorted(bucket_path.rglob("*"))
+            if path.is_dir()
+        ]
+
+    def delete_folder(self, request=None, **kwargs):
+        bucket, folder = request.name.split("/buckets/", 1)[1].split("/folders/", 1)
+        path = self.root / bucket / folder.strip("/")
+        if not path.is_dir():
+            raise NotFound(f"Folder {folder} not found")  # noqa: EM102, TRY003
+        path.rmdir()
+
+
+TABLE_REFERENCE = re.compile(r"`?[\w-]+\.(\w+)\.(\w+)`?")
+UNSUPPORTED_STATEMENTS = ("CREATE OR REPLACE MODEL", "CREATE OR REPLACE EXTERNAL TABLE")
+CREATE_TABLE_AS = re.compile(r"CREATE OR REPLACE TABLE (\S+) AS", re.IGNORECASE)
+# Columns of the table `BigQueryManager.generate_embeddings` creates
+EMBEDDING_TABLE_COLUMNS = (
+    "uri",
+    "ml_generate_embedding_result",
+    "ml_generate_embedding_status",
+    "obj_name",
+    "sku_id",
+    "product_name",
+)
+
+
+def decode_value(value):
+    """Decodes the JSON arrays stored for REPEATED columns."""
+    if isinstance(value, str) and value.startswith("["):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def encode_value(value):
+    """Stores lists and arrays as JSON, since SQLite has no REPEATED columns."""
+    if hasattr(value, "tolist"):
+        value = value.tolist()
+    if isinstance(value, list | tuple):
+        return json.dumps(list(value))
+    return value
+
+
+class LocalRowIterator:
+    """Stand-in of the `RowIterator` returned by queries and `list_rows`."""
+
+    def __init__(self, columns=(), rows=()):
+        self.columns = list(columns)
+        self.rows = [dict(zip(self.columns, row, strict=True)) for row in rows]
+        self.total_rows = len(self.rows)
+        self.total_bytes_processed = 0
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def to_dataframe(self, *args, **kwargs):
+        import pandas as pd
+
+        return pd.DataFrame(
+            [
+                {key: decode_value(value) for key, value in row.items()}
+                for row in self.rows
+            ],
+            columns=self.columns,
+        )
+
+
+class LocalJob:
+    """Stand-in of a finished BigQuery job."""
+
+    def __init__(self, rows=None, input_file_bytes=0, output_rows=0):
+        self._rows = rows if rows is not None else LocalRowIterator()
+        self.input_file_bytes = input_file_bytes
+        self.output_rows = output_rows
+        self.total_bytes_processed = 0
+
+    def result(self, *args, **kwargs):
+        return self._rows
+
+
+class LocalBigQueryClient:
+    """
+    SQLite-backed stand-in of `bigquery.Client` for the subset of statements
+    `bot_ai` runs: dataset and table management, CSV and dataframe loads, and
+    plain SQL queries. A table ``project.dataset.table`` is stored as the SQLite
+    table ``dataset__table``. Statements that need BigQuery ML or external
+    tables are accepted and ignored. There is no embedding model locally, so
+    a table created from ``ML.GENERATE_EMBEDDING`` is created empty and a
+    query over it returns no rows.
+    """
+
+    def __init__(self, path=None, project="local", storage_root=None):
+        self.project = project
+        if path is None:
+            path = local_root() / "bigquery.sqlite3"
+        self.path = str(path)
+        self.storage_root = (
+            Path(storage_root) if storage_root is not None else local_root() / "gcs"
+        )
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS _datasets (name TEXT PRIMARY KEY)",
+        )
+
+    @staticmethod
+    def table_name(table_id):
+        if not isinstance(table_id, str):
+            table_id = getattr(table_id, "table_id", str(table_id))
+        parts = table_id.strip("`").split(".")
+        return "__".join(parts[-2:]) if len(parts) > 1 else parts[0]
+
+    def translate(self, query):
+        """Rewrites the BigQuery table references of a query for SQLite."""
+        return TABLE_REFERENCE.sub(lambda m: f'"{m.group(1)}__{m.group(2)}"', query)
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            cursor = self._connection.execute(sql, params)
+            columns = [column[0] for column in cursor.description or []]
+            return LocalRowIterator(columns, cursor.fetchall())
+
+    def create_dataset(self, dataset, *args, exists_ok=False, **kwargs):
+        name = getattr(dataset, "dataset_id", str(dataset).split(".")[-1])
+        with self._lock:
+            exists = self._connection.execute(
+                "SELECT 1 FROM _datasets WHERE name = ?",
+                (name,),
+            ).fetchone()
+            if exists and not exists_ok:
+                raise Conflict(f"Already Exists: Dataset {self.project}:{name}")  # noqa: EM102, TRY003
+            self._connection.execute(
+                "INSERT OR IGNORE INTO _datasets (name) VALUES (?)",
+                (name,),
+            )
+        return dataset
+
+    def query_and_wait(self, query, *args, **kwargs):
+        statement = " ".join(query.split()).rstrip(";").strip()
+        upper = statement.upper()
+
+        if upper.startswith(UNSUPPORTED_STATEMENTS):
+            logger.info(f"Ignoring statement in local BigQuery: {statement[:80]}")  # noqa: G004
+            return LocalRowIterator()
+
+        statement = self.translate(statement)
+        match = CREATE_TABLE_AS.match(statement)
+        if "ML.GENERATE_EMBEDDING" in upper:
+            logger.warning("ML.GENERATE_EMBEDDING is not available locally, no embeddings are generated")  # noqa: E501
+            if match:
+                columns = ", ".join(f'"{column}"' for column in EMBEDDING_TABLE_COLUMNS)
+                self._execute(f"DROP TABLE IF EXISTS {match.group(1)}")
+                self._execute(f"CREATE TABLE {match.group(1)} ({columns})")
+            return LocalRowIterator()
+        if match:
+            self._execute(f"DROP TABLE IF EXISTS {match.group(1)}")
+            statement = "CREATE TABLE" + statement[len("CREATE OR REPLACE TABLE") :]
+        return self._execute(*self.bind(statement, kwargs.get("job_config")))
+
+    @staticmethod
+    def bind(statement, job_config):
+        """
+        Replaces the named query parameters (``@name``) of a statement with
+        SQLite placeholders. Array parameters used as ``IN UNNEST(@name)`` are
+        expanded with ``json_each``.
+        """
+        parameters = {
+            parameter.name: parameter
+            for parameter in getattr(job_config, "query_parameters", None) or []
+        }
+        if not parameters:
+            return statement, ()
+
+        values = []
+
+        def replace(match):
+            parameter = parameters[match.group(1) or match.group(2)]
+            if match.group(1):
+                values.append(json.dumps(list(parameter.values)))
+                return "(SELECT value FROM json_each(?))"
+            values.append(parameter.value)
+            return "?"
+
+        statement = re.sub(r"UNNEST\(@(\w+)\)|@(\w+)", replace, statement)
+        return statement, tuple(values)
+
+    def query(self, query, *args, **kwargs):
+        return LocalJob(self.query_and_wait(query))
+
+    def get_table(self, table, *args, **kwargs):
+        name = self.table_name(table)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (name,),
+            ).fetchone()
+            if row is None:
+                raise NotFound(f"Not found: Table {table}")  # noqa: EM102, TRY003
+            count = self._connection.execute(
+                f'SELECT COUNT(*) FROM "{name}"',  # noqa: S608
+            ).fetchone()
+        return SimpleNamespace(table_id=name, num_rows=count[0], reference=table)
+
+    def create_table(self, table, *args, exists_ok=False, **kwargs):
+        name = self.table_name(table)
+        clause = "IF NOT EXISTS " if exists_ok else ""
+        self._execute(f'CREATE TABLE {clause}"{name}" (_placeholder TEXT)')
+        return SimpleNamespace(table_id=name, reference=table)
+
+    def delete_table(self, table, *args, not_found_ok=False, **kwargs):
+        name = self.table_name(table)
+        if not not_found_ok:
+            self.get_table(table)
+        self._execute(f'DROP TABLE IF EXISTS "{name}"')
+
+    def list_rows(self, table, *args, **kwargs):
+        name = self.table_name(getattr(table, "reference", table))
+        return self._execute(f'SELECT * FROM "{name}"')  # noqa: S608
+
+    def _write_rows(self, name, columns, rows, truncate):
+        quoted = ", ".join(f'"{column}"' for column in columns)
+        with self._lock:
+            if truncate:
+                self._connection.execute(f'DROP TABLE IF EXISTS "{name}"')
+            self._connection.execute(f'CREATE TABLE IF NOT EXISTS "{name}" ({quoted})')
+            placeholders = ", ".join("?" * len(columns))
+            self._connection.executemany(
+                f'INSERT INTO "{name}" ({quoted}) VALUES ({placeholders})',  # noqa: S608
+                [[encode_value(value) for value in row] for row in rows],
+            )
+
+    @staticmethod
+    def _truncate(job_config):
+        return getattr(job_config, "write_disposition", None) == "WRITE_TRUNCATE"
+
+    def load_table_from_uri(self, source_uris, destination, *args, job_config=None, **kwargs):  # noqa: E501
+        if isinstance(source_uris, str):
+            source_uris = [source_uris]
+
+        columns = None
+        rows = []
+        input_bytes = 0
+        skip = getattr(job_config, "skip_leading_rows", 0) or 0
+        for uri in source_uris:
+            path = self.storage_root / uri.removeprefix("gs://")
+            input_bytes += path.stat().st_size
+            with path.open(encoding="utf-8", newline="") as file:
+                reader = csv.reader(file)
+                header = [next(reader) for _ in range(skip)]
+                if columns is None:
+                    columns = header[0] if header else None
+                rows.extend(reader)
+
+        if columns is None:
+            columns = [f"string_field_{index}" for index in range(len(rows[0]))]
+        columns = [re.sub(r"\W", "_", column) or "_" for column in columns]
+
+        self._write_rows(
+            self.table_name(destination),
+            columns,
+            rows,
+            self._truncate(job_config),
+        )
+        return LocalJob(input_file_bytes=input_bytes, output_rows=len(rows))
+
+    def load_table_from_dataframe(self, dataframe, destination, *args, job_config=None, **kwargs):  # noqa: E501
+        columns = [str(column) for column in dataframe.columns]
+        rows = dataframe.itertuples(index=False, name=None)
+        self._write_rows(
+            self.table_name(destination),
+            columns,
+            rows,
+            self._truncate(job_config),
+        )
+        return LocalJob(output_rows=len(dataframe))
+
+    def load_table_from_file(self, file_obj, destination, *args, job_config=None, **kwargs):  # noqa: E501
+        import pyarrow.parquet as pq
+
+        if getattr(job_config, "source_format", None) != "PARQUET":
+            raise NotImplementedError("Only Parquet files can be loaded locally")  # noqa: EM101
+
+        table = pq.read_table(file_obj)
+        rows = zip(*(column.to_pylist() for column in table.columns), strict=True)
+        self._write_rows(
+            self.table_name(destination),
+            table.column_names,
+            rows,
+            self._truncate(job_config),
+        )
+        return LocalJob(input_file_bytes=table.nbytes, output_rows=table.num_rows)
+
+    def insert_rows_json(self, table, json_rows, *args, **kwargs):
+        json_rows = list(json_rows)
+        if json_rows:
+            columns = list(json_rows[0])
+            rows = [[row.get(column) for column in columns] for row in json_rows]
+            self._write_rows(self.table_name(table), columns, rows, truncate=False)
+        return []
@@ -0,0 +1,109 @@
+import json
+
+from django.core.management import BaseCommand
+from django.core.management import CommandError
+
+from app.bot_ai.benchmarks import SCENARIOS
+from app.bot_ai.benchmarks import BenchmarkFixtures
+from app.bot_ai.benchmarks import benchmark_settings
+from app.bot_ai.benchmarks import build_scenarios
+from app.bot_ai.benchmarks import compare_with_baseline
+from app.bot_ai.benchmarks import run_scenario
+from app.bot_ai.clients import use_local_backends
+
+
+class Command(BaseCommand):
+    """
+    Runs the end-to-end benchmark suite of `app.bot_ai` (chat turns, chat with
+    documents, onboarding, vector search, PDF extraction and CSV ingestion)
+    against the local stand-ins, and compares the results with a baseline.
+    """
+
+    help = "Ejecuta los benchmarks de bot_ai contra los backends locales"
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenarios", nargs="*", default=SCENARIOS)
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument(
+            "--vector-sizes",
+            default="10000,100000,1000000",
+            help="Tamaños de los vector stores, separados por comas",
+        )
+        parser.add_argument("--dimensions", type=int, default=128)
+        parser.add_argument("--csv-rows", type=int, default=5000)
+        parser.add_argument("--pdf-pages", type=int, default=20)
+        parser.add_argument("--baseline", default=None)
+        parser.add_argument("--save-baseline", default=None)
+        parser.add_argument("--tolerance", type=float, default=0.15)
+        parser.add_argument("--fail-on-regression", action="store_true")
+        parser.add_argument("--json", dest="json_output", default=None)
+        parser.add_argument(
+            "--allow-remote",
+            action="store_true",
+            help="Permite ejecutar contra los servicios reales de Google",
+        )
+
+    def handle(self, *args, **options):
+        if not use_local_backends() and not options["allow_remote"]:
+            raise CommandError(
+                'Set BOT_AI_BACKEND = "local" or pass --allow-remote',  # noqa: EM101
+            )
+
+        unknown = set(options["scenarios"]) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")  # noqa: EM102
+
+        fixtures = BenchmarkFixtures(
+            csv_rows=options["csv_rows"],
+            pdf_pages=options["pdf_pages"],
+            dimensions=options["dimensions"],
+        )
+        vector_sizes = [int(size) for size in options["vector_sizes"].split(",") if size]
+
+        results = {}
+        fixtures.create()
+        try:
+            for scenario in build_scenarios(
+                fixtures,
+                options["scenarios"],
+                options["iterations"],
+                vector_sizes,
+            ):
+                result = run_scenario(scenario)
+                results[result.name] = result.as_dict()
+                self.report(result)
+        finally:
+            fixtures.remove()
+
+        output = {"settings": benchmark_settings(), "scenarios": results}
+
+        if options["json_output"]:
+            self.write_json(options["json_output"], output)
+        if options["save_baseline"]:
+            self.write_json(options["save_baseline"], output)
+
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as file:  # noqa: PTH123
+                baseline = json.load(file)["scenarios"]
+            regressions = compare_with_baseline(results, baseline, options["tolerance"])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(f"Regression: {regression}"))
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
+            elif options["fail_on_regression"]:
+                raise CommandError(f"{len(regressions)} regressions against the baseline")  # noqa: EM102
+
+    def report(self, result):
+        line = (
+            f"{result.name}: p50 {result.p50 * 1000:.1f} ms, "
+            f"p95 {result.p95 * 1000:.1f} ms, p99 {result.p99 * 1000:.1f} ms, "
+            f"{result.throughput:.2f} ops/s, peak RSS {result.peak_rss_mb:.0f} MB"
+        )
+        if result.errors:
+            self.stdout.write(self.style.WARNING(f"{line}, {result.errors} errors"))
+        else:
+            self.stdout.write(self.style.SUCCESS(line))
+
+    def write_json(self, path, data):
+        with open(path, "w", encoding="utf-8") as file:  # noqa: PTH123
+            json.dump(data, file, indent=2)
@@ -0,0 +1,108 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.core.management import BaseCommand
+
+MODULES = [
+    "app.bot_ai.bot_multi_model",
+    "app.bot_ai.utils",
+    "app.bot_ai.bigquery",
+    "app.bot_ai.gc_storage",
+    "app.bot_ai.file_extractor",
+    "app.bot_ai.rag_txt",
+    "app.bot_ai.tasks",
+    "app.bot_ai.langchain_gc_model",
+]
+
+# SDKs that must not be loaded by a plain import of the modules above
+HEAVY_MODULES = [
+    "vertexai",
+    "langchain_core",
+    "langchain_google_vertexai",
+    "langchain_community",
+    "pdfplumber",
+    "tiktoken",
+    "pandas",
+    "google.cloud.speech_v2",
+    "google.cloud.bigquery",
+]
+
+PROBE = """
+import importlib, json, sys, time
+import django
+django.setup()
+started = time.perf_counter()
+importlib.import_module({module!r})
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "seconds": elapsed,
+    "heavy": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+class Command(BaseCommand):
+    """
+    Measures the cold-start cost of importing each `app.bot_ai` module in a
+    fresh interpreter, and reports which heavy SDKs the import pulls in.
+    """
+
+    help = "Mide el tiempo de importación en frío de los módulos de bot_ai"
+
+    def add_arguments(self, parser):
+        parser.add_argument("modules", nargs="*", default=MODULES)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--json", dest="json_output", default=None)
+
+    def handle(self, *args, **options):
+        results = {}
+
+        for module in options["modules"]:
+            timings = []
+            heavy = []
+            for _ in range(options["repeat"]):
+                sample = self.probe(module)
+                if sample is None:
+                    break
+                timings.append(sample["seconds"])
+                heavy = sample["heavy"]
+
+            if not timings:
+                results[module] = {"error": "import failed"}
+                self.stdout.write(self.style.ERROR(f"{module}: import failed"))
+                continue
+
+            results[module] = {
+                "median_ms": statistics.median(timings) * 1000,
+                "max_ms": max(timings) * 1000,
+                "heavy_modules": heavy,
+            }
+            line = (
+                f"{module}: median {results[module]['median_ms']:.1f} ms, "
+                f"max {results[module]['max_ms']:.1f} ms"
+            )
+            if heavy:
+                self.stdout.write(self.style.WARNING(f"{line}, loads {', '.join(heavy)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(line))
+
+        if options["json_output"]:
+            with open(options["json_output"], "w", encoding="utf-8") as file:  # noqa: PTH123
+                json.dump(results, file, indent=2)
+
+    def probe(self, module):
+        """Imports a module in a new interpreter and returns its timing."""
+        completed = subprocess.run(  # noqa: S603
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            capture_output=True,
+            text=True,
+            env=os.environ.copy(),
+            check=False,
+        )
+        if completed.returncode != 0:
+            self.stderr.write(completed.stderr)
+            return None
+        return json.loads(completed.stdout.strip().splitlines()[-1])
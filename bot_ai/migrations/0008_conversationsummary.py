@@ -0,0 +1,24 @@
+# Written by hand for the ConversationSummary model, in the format of
+# makemigrations; check it with `python manage.py makemigrations --check`.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot_ai', '0007_productdata_company'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conversation_id', models.CharField(max_length=64, unique=True)),
+                ('summary', models.TextField(blank=True, default='')),
+                ('summarized_messages', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
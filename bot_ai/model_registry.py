@@ -0,0 +1,192 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from app.bot_ai.clients import make_generative_model
+
+logger = logging.getLogger(__name__)
+
+
+class InstructionStore:
+    """
+    Keeps the text of the instruction files in memory and reloads a file only
+    when its modification time changes.
+
+    Attributes:
+        hits (int): Number of reads served from memory.
+        misses (int): Number of reads that went to disk.
+
+    Methods:
+        read(file_path, loader=None):
+            Returns the text of the file, reloading it only if it changed.
+        clear():
+            Drops every cached instruction.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def read(self, file_path, loader=None):
+        """
+        Returns the text of an instruction file.
+
+        Args:
+            file_path (str): Absolute path of the file, used for the mtime check.
+            loader (callable, optional): Function that produces the text. Defaults
+                to reading the file as utf-8.
+
+        Returns:
+            str: The instruction text.
+        """
+        mtime = os.stat(file_path).st_mtime_ns  # noqa: PTH116
+
+        with self._lock:
+            entry = self._entries.get(file_path)
+            if entry is not None and entry[0] == mtime:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        if loader is None:
+            with open(file_path, encoding="utf-8") as file:  # noqa: PTH123
+                text = file.read()
+        else:
+            text = loader()
+
+        with self._lock:
+            self._entries[file_path] = (mtime, text)
+        return text
+
+    def clear(self):
+        """Drops every cached instruction."""
+        with self._lock:
+            self._entries.clear()
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of `GenerativeModel` objects.
+
+    A model is identified by its name, the hash of its system instruction and
+    its generation config, so callers that use the same settings share the
+    same object instead of building a new one per message.
+
+    Attributes:
+        hits (int): Number of lookups that returned an existing model.
+        misses (int): Number of lookups that had to build a new model.
+
+    Methods:
+        get_model(model_name, system_instruction=None, generation_config=None):
+            Returns the shared model for the given settings.
+        stats():
+            Returns the hit/miss counters of the registry and the instruction store.
+        clear():
+            Drops every registered model and instruction.
+    """
+
+    def __init__(self, max_models=64):
+        self._lock = threading.Lock()
+        self._models = {}
+        self.max_models = max_models
+        self.instructions = InstructionStore()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def instruction_hash(system_instruction):
+        """
+        Returns a stable hash for a system instruction (str or list of str).
+        """
+        if system_instruction is None:
+            return None
+        if isinstance(system_instruction, str):
+            system_instruction = [system_instruction]
+        digest = hashlib.sha256()
+        for part in system_instruction:
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    @staticmethod
+    def config_key(generation_config):
+        """
+        Returns a hashable representation of a generation config dict.
+        """
+        if generation_config is None:
+            return None
+        return json.dumps(generation_config, sort_keys=True, default=str)
+
+    def get_model(
+        self,
+        model_name,
+        system_instruction=None,
+        generation_config=None,
+    ):
+        """
+        Returns the shared model for the given settings, building it on first use.
+
+        Args:
+            model_name (str): The name of the generative model.
+            system_instruction (str | list, optional): The system instruction.
+            generation_config (dict, optional): The generation config of the model.
+
+        Returns:
+            GenerativeModel: The shared model object.
+        """
+        key = (
+            model_name,
+            self.instruction_hash(system_instruction),
+            self.config_key(generation_config),
+        )
+
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self.hits += 1
+                return model
+            self.misses += 1
+
+            if len(self._models) >= self.max_models:
+                # Drop the oldest registered model
+                self._models.pop(next(iter(self._models)))
+
+            model = make_generative_model(
+                model_name,
+                system_instruction=system_instruction,
+                generation_config=generation_config,
+            )
+            self._models[key] = model
+            logger.info(f"Registered generative model {model_name}")  # noqa: G004
+            return model
+
+    def stats(self):
+        """
+        Returns the hit/miss counters of the registry and the instruction store.
+
+        Returns:
+            dict: The counters and the number of registered models.
+        """
+        with self._lock:
+            return {
+                "models": len(self._models),
+                "model_hits": self.hits,
+                "model_misses": self.misses,
+                "instruction_hits": self.instructions.hits,
+                "instruction_misses": self.instructions.misses,
+            }
+
+    def clear(self):
+        """Drops every registered model and instruction."""
+        with self._lock:
+            self._models.clear()
+            self.hits = 0
+            self.misses = 0
+        self.instructions.clear()
+
+
+model_registry = ModelRegistry()
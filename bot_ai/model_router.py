@@ -0,0 +1,181 @@
+import logging
+import threading
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from app.bot_ai.resilience import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+FAST = "fast"
+QUALITY = "quality"
+
+DEFAULT_MODELS = {
+    FAST: "gemini-1.5-flash-001",
+    QUALITY: "gemini-1.5-pro-001",
+}
+
+# Default tier of each kind of request
+DEFAULT_TASK_TIERS = {
+    "onboarding_validation": FAST,
+    "extraction": FAST,
+    "summary": FAST,
+    "chat": FAST,
+    "catalog_qa": FAST,
+    "video_description": QUALITY,
+}
+
+# Latency objective (p95 seconds) above which a task falls back to the fast tier
+DEFAULT_LATENCY_SLO = {
+    "chat": 8.0,
+    "catalog_qa": 12.0,
+}
+
+# Seconds after which an observed latency is forgotten, so a model that left
+# the rotation because it was slow is tried again
+DEFAULT_LATENCY_MAX_AGE = 300
+
+# Inputs above these sizes are sent to the quality tier
+LARGE_INPUT_CHARS = 60000
+MANY_DOCUMENTS = 5
+
+
+@dataclass
+class RoutingDecision:
+    """
+    The model chosen for a request and why.
+
+    Attributes:
+        model_name (str): The name of the generative model.
+        tier (str): "fast", "quality" or "override".
+        reason (str): A short explanation, written to the log.
+    """
+
+    model_name: str
+    tier: str
+    reason: str
+
+
+class ModelRouter:
+    """
+    Picks the generative model of each request from the task type, the input
+    size, the number of attached documents, the observed latency of each model
+    and per-tenant overrides.
+
+    Cheap tasks (onboarding validation, extraction, summaries, short chats) go
+    to the fast model. Large inputs, many documents or video descriptions go to
+    the quality model, unless its observed p95 latency is above the objective
+    of the task. Latencies are only kept for `latency_max_age` seconds: once
+    the slow samples age out the quality model is used again, and the new
+    calls tell whether it has recovered.
+
+    Methods:
+        route(task, input_chars=0, document_count=0, tenant=None):
+            Returns the routing decision for a request.
+        observe(model_name, seconds):
+            Records the latency of a call to a model.
+        latency_percentile(model_name, q):
+            Returns the observed latency percentile of a model.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        models=None,
+        task_tiers=None,
+        latency_slo=None,
+        tenant_overrides=None,
+        large_input_chars=LARGE_INPUT_CHARS,
+        many_documents=MANY_DOCUMENTS,
+        latency_max_age=DEFAULT_LATENCY_MAX_AGE,
+    ):
+        self.models = {**DEFAULT_MODELS, **(models or {})}
+        self.task_tiers = {**DEFAULT_TASK_TIERS, **(task_tiers or {})}
+        self.latency_slo = {**DEFAULT_LATENCY_SLO, **(latency_slo or {})}
+        self.tenant_overrides = tenant_overrides or {}
+        self.large_input_chars = large_input_chars
+        self.many_documents = many_documents
+        self.latency_max_age = latency_max_age
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Builds the router from the `BOT_AI_MODEL_ROUTING` setting. Supported
+        keys: ``MODELS`` ({"fast": ..., "quality": ...}), ``TASK_TIERS``,
+        ``LATENCY_SLO``, ``LATENCY_MAX_AGE``, ``LARGE_INPUT_CHARS``,
+        ``MANY_DOCUMENTS`` and ``TENANTS`` ({tenant: {task or "*": model_name}}).
+        """
+        config = getattr(settings, "BOT_AI_MODEL_ROUTING", {})
+        return cls(
+            models=config.get("MODELS"),
+            task_tiers=config.get("TASK_TIERS"),
+            latency_slo=config.get("LATENCY_SLO"),
+            tenant_overrides=config.get("TENANTS"),
+            large_input_chars=config.get("LARGE_INPUT_CHARS", LARGE_INPUT_CHARS),
+            many_documents=config.get("MANY_DOCUMENTS", MANY_DOCUMENTS),
+            latency_max_age=config.get("LATENCY_MAX_AGE", DEFAULT_LATENCY_MAX_AGE),
+        )
+
+    def route(self, task, input_chars=0, document_count=0, tenant=None):
+        """
+        Returns the routing decision for a request.
+
+        Args:
+            task (str): The kind of request, e.g. "onboarding_validation",
+                "catalog_qa" or "video_description".
+            input_chars (int): The size of the text input.
+            document_count (int): The number of attached documents.
+            tenant (str, optional): The company the request belongs to.
+
+        Returns:
+            RoutingDecision: The chosen model and the reason.
+        """
+        decision = self._decide(task, input_chars, document_count, tenant)
+        logger.info(
+            f"Model routing task={task} tenant={tenant} chars={input_chars} "  # noqa: G004
+            f"documents={document_count} -> {decision.model_name} ({decision.reason})",
+        )
+        return decision
+
+    def _decide(self, task, input_chars, document_count, tenant):
+        overrides = self.tenant_overrides.get(tenant, {}) if tenant else {}
+        override = overrides.get(task, overrides.get("*"))
+        if override:
+            return RoutingDecision(override, "override", f"tenant {tenant} override")
+
+        tier = self.task_tiers.get(task, FAST)
+        reason = f"default tier of {task}"
+        if tier == FAST and input_chars >= self.large_input_chars:
+            tier, reason = QUALITY, "large input"
+        elif tier == FAST and document_count >= self.many_documents:
+            tier, reason = QUALITY, "many documents"
+
+        slo = self.latency_slo.get(task)
+        if tier == QUALITY and slo is not None:
+            p95 = self.latency_percentile(self.models[QUALITY], 95)
+            if p95 is not None and p95 > slo:
+                tier, reason = FAST, f"quality p95 {p95:.1f}s above {slo}s objective"
+
+        return RoutingDecision(self.models[tier], tier, reason)
+
+    def observe(self, model_name, seconds):
+        """Records the latency of a call to a model."""
+        with self._lock:
+            tracker = self._latencies.get(model_name)
+            if tracker is None:
+                tracker = self._latencies[model_name] = LatencyTracker(
+                    max_age=self.latency_max_age,
+                )
+        tracker.observe(seconds)
+
+    def latency_percentile(self, model_name, q):
+        """Returns the observed q-th latency percentile of a model, or None."""
+        tracker = self._latencies.get(model_name)
+        if tracker is None:
+            return None
+        return tracker.percentile(q)
+
+
+model_router = ModelRouter.from_settings()
@@ -217,3 +217,16 @@ class ProductData(models.Model):
 
     def __str__(self):
         return self.name
+
+
+#### Coleccion Conversaciones
+class ConversationSummary(models.Model):
+    """Resumen acumulado de los mensajes antiguos de una conversación"""
+
+    conversation_id = models.CharField(max_length=64, unique=True)
+    summary = models.TextField(blank=True, default="")
+    summarized_messages = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.conversation_id} - {self.summarized_messages}"
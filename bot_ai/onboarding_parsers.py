@@ -0,0 +1,787 @@
+import logging
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass
+from datetime import date
+
+from django.conf import settings
+
+from app.bot_ai.instrumentation import CallRecord
+from app.bot_ai.instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+ACCEPT = "accept"
+REJECT = "reject"
+AMBIGUOUS = "ambiguous"
+
+MONTHS = {
+    "enero": 1,
+    "ene": 1,
+    "febrero": 2,
+    "feb": 2,
+    "marzo": 3,
+    "mar": 3,
+    "abril": 4,
+    "abr": 4,
+    "mayo": 5,
+    "may": 5,
+    "junio": 6,
+    "jun": 6,
+    "julio": 7,
+    "jul": 7,
+    "agosto": 8,
+    "ago": 8,
+    "septiembre": 9,
+    "setiembre": 9,
+    "sept": 9,
+    "sep": 9,
+    "set": 9,
+    "octubre": 10,
+    "oct": 10,
+    "noviembre": 11,
+    "nov": 11,
+    "diciembre": 12,
+    "dic": 12,
+}
+_MONTH_PATTERN = "|".join(sorted(MONTHS, key=len, reverse=True))
+
+NUMERIC_DATE = re.compile(r"\b(\d{1,2})\s*[-/.]\s*(\d{1,2})\s*[-/.]\s*(\d{2,4})\b")
+ISO_DATE = re.compile(r"\b(\d{4})\s*[-/.]\s*(\d{1,2})\s*[-/.]\s*(\d{1,2})\b")
+TEXT_DATE = re.compile(
+    rf"\b(\d{{1,2}})\s*(?:de\s+)?({_MONTH_PATTERN})\.?\s*(?:,\s*|del?\s+)?(\d{{4}})\b",
+)
+TEXT_DATE_MONTH_FIRST = re.compile(
+    rf"\b({_MONTH_PATTERN})\.?\s+(\d{{1,2}})\s*(?:,\s*|del?\s+)?(\d{{4}})\b",
+)
+ORDINAL_DAY = re.compile(r"\b(\d{1,2})\s*(?:ro|ero|°|º)\b")
+
+NAME_PREFIX = re.compile(
+    r"^(?:hola[\s,.!]*)?(?:mi\s+nombre\s+(?:completo\s+)?es|me\s+llamo|yo\s+soy|soy|nombre:?)\s+",  # noqa: E501
+    re.IGNORECASE,
+)
+NAME_TOKEN = re.compile(r"^[^\W\d_]+(?:['’-][^\W\d_]+)*\.?$")
+NAME_PARTICLES = {"de", "del", "la", "las", "los", "y", "van", "von", "da", "di"}
+# Words of everyday messages that are never part of a name. They are compared
+# without accents.
+NAME_STOPWORDS = {
+    "a",
+    "adios",
+    "al",
+    "apoyo",
+    "ayuda",
+    "ayudame",
+    "bien",
+    "buen",
+    "buena",
+    "buenas",
+    "bueno",
+    "buenos",
+    "ciudad",
+    "como",
+    "con",
+    "cual",
+    "dia",
+    "dias",
+    "dije",
+    "dime",
+    "donde",
+    "el",
+    "ella",
+    "en",
+    "es",
+    "esta",
+    "esto",
+    "favor",
+    "gracias",
+    "hola",
+    "lo",
+    "me",
+    "mi",
+    "mucho",
+    "muchas",
+    "nada",
+    "necesito",
+    "no",
+    "noche",
+    "noches",
+    "nombre",
+    "ok",
+    "para",
+    "pero",
+    "por",
+    "porfa",
+    "pues",
+    "que",
+    "quien",
+    "quiero",
+    "se",
+    "si",
+    "soy",
+    "tal",
+    "tarde",
+    "tardes",
+    "te",
+    "todo",
+    "tu",
+    "un",
+    "una",
+    "usted",
+    "vivo",
+    "ya",
+    "yo",
+}
+LAUGHTER = re.compile(r"^(?:[jh][aeiou]){2,}h?$")
+
+# Common first names; a name is only accepted when it starts with one of them.
+# More can be added with the ``FIRST_NAMES`` key of `BOT_AI_ONBOARDING`.
+DEFAULT_FIRST_NAMES = [
+    "Abel",
+    "Abigail",
+    "Abraham",
+    "Adolfo",
+    "Adrián",
+    "Adriana",
+    "Agustín",
+    "Aída",
+    "Alan",
+    "Alberto",
+    "Alejandra",
+    "Alejandro",
+    "Alexis",
+    "Alfonso",
+    "Alfredo",
+    "Alicia",
+    "Alma",
+    "Álvaro",
+    "Amalia",
+    "Ana",
+    "Andrea",
+    "Andrés",
+    "Ángel",
+    "Ángela",
+    "Angélica",
+    "Antonio",
+    "Araceli",
+    "Ariana",
+    "Armando",
+    "Arturo",
+    "Aurora",
+    "Axel",
+    "Beatriz",
+    "Benjamín",
+    "Bernardo",
+    "Blanca",
+    "Brenda",
+    "Bruno",
+    "Camila",
+    "Carla",
+    "Carlos",
+    "Carmen",
+    "Carolina",
+    "Catalina",
+    "Cecilia",
+    "César",
+    "Claudia",
+    "Concepción",
+    "Cristian",
+    "Cristina",
+    "Daniel",
+    "Daniela",
+    "David",
+    "Diana",
+    "Diego",
+    "Dolores",
+    "Eduardo",
+    "Elena",
+    "Elizabeth",
+    "Emilio",
+    "Emiliano",
+    "Enrique",
+    "Ernesto",
+    "Esperanza",
+    "Esteban",
+    "Estela",
+    "Eugenia",
+    "Eva",
+    "Fabiola",
+    "Felipe",
+    "Fernanda",
+    "Fernando",
+    "Francisco",
+    "Gabriel",
+    "Gabriela",
+    "Gerardo",
+    "Gilberto",
+    "Gloria",
+    "Gonzalo",
+    "Graciela",
+    "Guadalupe",
+    "Guillermo",
+    "Gustavo",
+    "Héctor",
+    "Hilda",
+    "Hugo",
+    "Ignacio",
+    "Irene",
+    "Isaac",
+    "Isabel",
+    "Israel",
+    "Iván",
+    "Jaime",
+    "Javier",
+    "Jazmín",
+    "Jesús",
+    "Jimena",
+    "Joaquín",
+    "Jorge",
+    "José",
+    "Josefina",
+    "Juan",
+    "Juana",
+    "Julia",
+    "Julián",
+    "Julio",
+    "Karen",
+    "Karla",
+    "Laura",
+    "Leonardo",
+    "Leticia",
+    "Lidia",
+    "Liliana",
+    "Lorena",
+    "Lourdes",
+    "Lucía",
+    "Luis",
+    "Luisa",
+    "Manuel",
+    "Marcela",
+    "Marco",
+    "Marcos",
+    "Margarita",
+    "María",
+    "Mariana",
+    "Mario",
+    "Marisol",
+    "Marta",
+    "Martha",
+    "Martín",
+    "Mateo",
+    "Mauricio",
+    "Miguel",
+    "Mónica",
+    "Natalia",
+    "Nicolás",
+    "Norma",
+    "Oscar",
+    "Pablo",
+    "Patricia",
+    "Paola",
+    "Pedro",
+    "Rafael",
+    "Ramón",
+    "Raúl",
+    "Rebeca",
+    "Regina",
+    "Ricardo",
+    "Roberto",
+    "Rocío",
+    "Rodrigo",
+    "Rosa",
+    "Rosario",
+    "Rubén",
+    "Salvador",
+    "Samuel",
+    "Santiago",
+    "Sara",
+    "Sebastián",
+    "Sergio",
+    "Silvia",
+    "Sofía",
+    "Sonia",
+    "Susana",
+    "Teresa",
+    "Tomás",
+    "Valentina",
+    "Valeria",
+    "Verónica",
+    "Víctor",
+    "Virginia",
+    "Ximena",
+    "Yolanda",
+    "Zoe",
+]
+MAX_NAME_TOKENS = 6
+
+CONFIRMATION_YES = {
+    "si",
+    "claro",
+    "correcto",
+    "es correcto",
+    "si es correcto",
+    "asi es",
+    "exacto",
+    "ok",
+    "okay",
+    "esta bien",
+    "si esta bien",
+    "afirmativo",
+    "perfecto",
+}
+# Words that may follow a "sí" or a "no" without changing the answer
+CONFIRMATION_FILLERS = {
+    "asi",
+    "bien",
+    "claro",
+    "correcto",
+    "es",
+    "esta",
+    "exacto",
+    "gracias",
+    "incorrecto",
+    "mal",
+    "muchas",
+    "ok",
+    "perfecto",
+    "todo",
+}
+CONFIRMATION_NO = {
+    "no",
+    "nop",
+    "incorrecto",
+    "no es correcto",
+    "esta mal",
+    "no esta bien",
+    "negativo",
+}
+
+# Estados, capitales y ciudades principales de México
+DEFAULT_CITIES = [
+    "Acapulco",
+    "Aguascalientes",
+    "Campeche",
+    "Cancún",
+    "Celaya",
+    "Chetumal",
+    "Chihuahua",
+    "Chilpancingo",
+    "Ciudad de México",
+    "Ciudad Juárez",
+    "Ciudad Obregón",
+    "Ciudad Victoria",
+    "Colima",
+    "Coatzacoalcos",
+    "Cuernavaca",
+    "Culiacán",
+    "Durango",
+    "Ensenada",
+    "Guadalajara",
+    "Guanajuato",
+    "Hermosillo",
+    "Irapuato",
+    "La Paz",
+    "León",
+    "Los Cabos",
+    "Los Mochis",
+    "Manzanillo",
+    "Matamoros",
+    "Mazatlán",
+    "Mérida",
+    "Mexicali",
+    "Monterrey",
+    "Morelia",
+    "Nuevo Laredo",
+    "Oaxaca",
+    "Pachuca",
+    "Playa del Carmen",
+    "Puebla",
+    "Puerto Vallarta",
+    "Querétaro",
+    "Reynosa",
+    "Saltillo",
+    "San Luis Potosí",
+    "San Pedro Garza García",
+    "Tampico",
+    "Tapachula",
+    "Tecomán",
+    "Tepic",
+    "Tijuana",
+    "Tlaxcala",
+    "Toluca",
+    "Torreón",
+    "Tuxtla Gutiérrez",
+    "Uruapan",
+    "Veracruz",
+    "Villahermosa",
+    "Xalapa",
+    "Zacatecas",
+    "Zapopan",
+]
+# States and country that may follow the city ("Guadalajara, Jalisco, México")
+CITY_SUFFIXES = [
+    "aguascalientes",
+    "baja california",
+    "baja california sur",
+    "bc",
+    "bcs",
+    "campeche",
+    "chiapas",
+    "chihuahua",
+    "coahuila",
+    "colima",
+    "durango",
+    "edomex",
+    "estado de mexico",
+    "guanajuato",
+    "guerrero",
+    "hidalgo",
+    "jalisco",
+    "jal",
+    "michoacan",
+    "morelos",
+    "nayarit",
+    "nuevo leon",
+    "nl",
+    "oaxaca",
+    "puebla",
+    "queretaro",
+    "quintana roo",
+    "san luis potosi",
+    "sinaloa",
+    "sonora",
+    "tabasco",
+    "tamaulipas",
+    "tlaxcala",
+    "veracruz",
+    "yucatan",
+    "zacatecas",
+    "mexico",
+    "mx",
+]
+CITY_PREFIX = (
+    r"(?:hola\s+)?(?:yo\s+)?"
+    r"(?:vivo\s+en|soy\s+de|estoy\s+en|radico\s+en|resido\s+en|vengo\s+de"
+    r"|mi\s+ciudad\s+es|desde|en|de)"
+)
+CITY_ALIASES = {
+    "cdmx": "Ciudad de México",
+    "df": "Ciudad de México",
+    "mexico df": "Ciudad de México",
+    "gdl": "Guadalajara",
+    "mty": "Monterrey",
+    "slp": "San Luis Potosí",
+    "juarez": "Ciudad Juárez",
+    "jalapa": "Xalapa",
+}
+
+
+def normalize(text):
+    """
+    Lowercases a text and strips accents and punctuation, for comparisons.
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+FIRST_NAMES = frozenset(normalize(name) for name in DEFAULT_FIRST_NAMES)
+
+
+@dataclass(frozen=True)
+class ParseResult:
+    """
+    The outcome of a fast-path parser.
+
+    Attributes:
+        status (str): ``accept``, ``reject`` or ``ambiguous`` (ask the LLM).
+        value: The parsed value when accepted.
+        reason (str): Why the input was rejected.
+    """
+
+    status: str
+    value: object = None
+    reason: str = ""
+
+    @property
+    def decided(self):
+        return self.status != AMBIGUOUS
+
+    @property
+    def accepted(self):
+        return self.status == ACCEPT
+
+
+def parse_date(text, today=None):
+    """
+    Parses a birthdate written in Spanish in the usual formats: ``29-01-2002``,
+    ``29/1/2002``, ``2002-01-29``, ``29 de enero del 2002``, ``29 ene 2002``
+    or ``enero 29, 2002``. Numeric dates are read day first, unless the first
+    number can only be a month.
+
+    Returns:
+        ParseResult: Accepted with a `date`, rejected when the date does not
+        exist or is in the future, ambiguous when no single date is found.
+    """
+    today = today or date.today()  # noqa: DTZ011
+    normalized = normalize(text)
+    normalized = re.sub(r"\bprimero\b", "1", normalized)
+    normalized = ORDINAL_DAY.sub(r"\1", normalized)
+    # normalize() drops the separators, so numeric dates are matched on the raw text
+    raw = ORDINAL_DAY.sub(r"\1", text)
+
+    candidates = set()
+    for match in ISO_DATE.finditer(raw):
+        candidates.add((int(match[1]), int(match[2]), int(match[3])))
+    for match in NUMERIC_DATE.finditer(raw):
+        day, month, year = int(match[1]), int(match[2]), match[3]
+        if len(year) != 4:  # noqa: PLR2004
+            return ParseResult(AMBIGUOUS)
+        if month > 12 >= day:  # noqa: PLR2004
+            day, month = month, day
+        candidates.add((int(year), month, day))
+    for match in TEXT_DATE.finditer(normalized):
+        candidates.add((int(match[3]), MONTHS[match[2]], int(match[1])))
+    for match in TEXT_DATE_MONTH_FIRST.finditer(normalized):
+        candidates.add((int(match[3]), MONTHS[match[1]], int(match[2])))
+
+    if len(candidates) != 1:
+        return ParseResult(AMBIGUOUS)
+
+    year, month, day = candidates.pop()
+    try:
+        parsed = date(year, month, day)
+    except ValueError:
+        return ParseResult(REJECT, reason="La fecha no existe")
+    if parsed > today or year < 1900:  # noqa: PLR2004
+        return ParseResult(REJECT, reason="La fecha no es una fecha de nacimiento válida")
+    return ParseResult(ACCEPT, parsed)
+
+
+def _format_name_token(token, first):
+    if token.lower() in NAME_PARTICLES and not first:
+        return token.lower()
+    return "-".join(part[:1].upper() + part[1:].lower() for part in token.split("-"))
+
+
+def parse_name(text, first_names=None):  # noqa: PLR0911
+    """
+    Normalizes a full name: drops prefixes like "mi nombre es", fixes the
+    capitalization and keeps particles ("de", "del", ...) in lowercase.
+
+    Only names that start with a known first name and have no common words
+    are accepted, so greetings or requests ("Buen día", "Por favor ayuda")
+    are never taken for a name.
+
+    Args:
+        text (str): The answer of the user.
+        first_names (set[str], optional): Normalized first names, defaults to
+            `DEFAULT_FIRST_NAMES`.
+
+    Returns:
+        ParseResult: Accepted with the normalized name when it has 2 to 6
+        words that look like a name, rejected when it is empty, ambiguous
+        otherwise (e.g. a single word, a sentence, or digits and symbols).
+    """
+    first_names = FIRST_NAMES if first_names is None else first_names
+    cleaned = NAME_PREFIX.sub("", " ".join(text.split())).strip(" .!¡?¿,")
+    if not cleaned:
+        return ParseResult(REJECT, reason="No se recibió un nombre")
+    # "Me llamo Ana, tengo 25" or "Juan Pérez 2do" may still hold a name
+    if re.search(r"[\d@#$%&*+=_/\\<>{}\[\]|~^]", cleaned):
+        return ParseResult(AMBIGUOUS)
+
+    tokens = cleaned.split()
+    if not 2 <= len(tokens) <= MAX_NAME_TOKENS:  # noqa: PLR2004
+        return ParseResult(AMBIGUOUS)
+    if normalize(tokens[0]) not in first_names:
+        return ParseResult(AMBIGUOUS)
+    for token in tokens:
+        lowered = token.lower()
+        plain = normalize(token)
+        if (
+            plain in NAME_STOPWORDS
+            or LAUGHTER.match(plain)
+            or not NAME_TOKEN.match(token)
+        ):
+            return ParseResult(AMBIGUOUS)
+        if lowered not in NAME_PARTICLES and (
+            len(token) < 2 or not re.search(r"[aeiouyáéíóúü]", lowered)  # noqa: PLR2004
+        ):
+            return ParseResult(AMBIGUOUS)
+
+    name = " ".join(
+        _format_name_token(token.rstrip("."), index == 0)
+        for index, token in enumerate(tokens)
+    )
+    return ParseResult(ACCEPT, name)
+
+
+def parse_confirmation(text):
+    """
+    Reads a yes/no answer. A "sí" or "no" is only accepted alone or followed
+    by words that do not change it ("sí, gracias"), so "no sé" or "sí, pero
+    mi nombre es Juan" are left to the LLM.
+
+    Returns:
+        ParseResult: Accepted with True or False, ambiguous otherwise.
+    """
+    normalized = normalize(text)
+    if normalized in CONFIRMATION_YES:
+        return ParseResult(ACCEPT, value=True)
+    if normalized in CONFIRMATION_NO:
+        return ParseResult(ACCEPT, value=False)
+
+    words = normalized.split()
+    if not words or words[0] not in {"si", "no"}:
+        return ParseResult(AMBIGUOUS)
+    if all(word in CONFIRMATION_FILLERS for word in words[1:]):
+        return ParseResult(ACCEPT, value=words[0] == "si")
+    return ParseResult(AMBIGUOUS)
+
+
+class CityGazetteer:
+    """
+    Finds known city names in a text, ignoring accents and case.
+
+    `parse` only accepts answers that are essentially a city name, optionally
+    after a short prefix ("vivo en", "soy de") and before the state or the
+    country; a city mentioned inside a sentence is left to the LLM, since the
+    sentence may be about another city ("no vivo en Guadalajara, vivo en
+    Tlaquepaque").
+
+    Args:
+        cities (list[str]): The canonical city names.
+        aliases (dict): Other spellings mapped to a canonical name.
+    """
+
+    def __init__(self, cities=None, aliases=None):
+        names = {normalize(city): city for city in cities or DEFAULT_CITIES}
+        names.update(
+            {normalize(alias): city for alias, city in (aliases or CITY_ALIASES).items()},
+        )
+        self.names = names
+        # Longest names first, so "ciudad juarez" wins over "juarez"
+        alternatives = "|".join(
+            re.escape(name) for name in sorted(names, key=len, reverse=True)
+        )
+        self.pattern = re.compile(rf"\b({alternatives})\b")
+        suffixes = "|".join(
+            re.escape(suffix) for suffix in sorted(CITY_SUFFIXES, key=len, reverse=True)
+        )
+        self.answer = re.compile(
+            rf"^(?:{CITY_PREFIX}\s+)?({alternatives})(?:\s+(?:{suffixes}))*$",
+        )
+
+    def find(self, text):
+        """Returns the canonical names of the cities mentioned in a text."""
+        return {self.names[match] for match in self.pattern.findall(normalize(text))}
+
+    def parse(self, text):
+        """
+        Returns the city of an answer that is only a known city name.
+
+        Returns:
+            ParseResult: Accepted with the canonical name, ambiguous when the
+            answer is not a known city or says more than the city.
+        """
+        match = self.answer.match(normalize(text))
+        if match is None:
+            return ParseResult(AMBIGUOUS)
+        return ParseResult(ACCEPT, self.names[match[1]])
+
+
+class OnboardingFastPath:
+    """
+    Local parsing stage that answers the onboarding validations that do not
+    need a model: well-formed names, dates and yes/no answers, and known
+    cities. Inputs it cannot decide are left to the LLM.
+
+    Every decision is counted per field, and reported to the call metrics as
+    ``onboarding.fast_path`` with the field and the result (hit or fallback).
+
+    Methods:
+        name(text), birthdate(text), city(text), confirmation(text):
+            Parse an answer, returning a `ParseResult`.
+        stats():
+            Returns the hit rate of every field.
+    """
+
+    def __init__(self, gazetteer=None, first_names=None, enabled=True):
+        self.gazetteer = gazetteer or CityGazetteer()
+        self.first_names = FIRST_NAMES if first_names is None else first_names
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Builds the fast path from the `BOT_AI_ONBOARDING` setting. Supported
+        keys: ``FAST_PATH`` (defaults to True), ``CITIES`` and ``CITY_ALIASES``
+        (extend the built-in gazetteer) and ``FIRST_NAMES`` (extends the
+        built-in first names).
+        """
+        config = getattr(settings, "BOT_AI_ONBOARDING", {})
+        gazetteer = CityGazetteer(
+            cities=[*DEFAULT_CITIES, *config.get("CITIES", [])],
+            aliases={**CITY_ALIASES, **config.get("CITY_ALIASES", {})},
+        )
+        first_names = FIRST_NAMES | {
+            normalize(name) for name in config.get("FIRST_NAMES", [])
+        }
+        return cls(
+            gazetteer=gazetteer,
+            first_names=first_names,
+            enabled=config.get("FAST_PATH", True),
+        )
+
+    def _run(self, field_name, parser, text):
+        if not self.enabled:
+            return ParseResult(AMBIGUOUS)
+        result = parser(text)
+        outcome = "hit" if result.decided else "fallback"
+        with self._lock:
+            key = (field_name, outcome)
+            self._counts[key] = self._counts.get(key, 0) + 1
+        metrics.emit(
+            CallRecord(
+                "onboarding.fast_path",
+                labels={"field": field_name, "result": outcome},
+            ),
+        )
+        return result
+
+    def name(self, text):
+        return self._run(
+            "name",
+            lambda value: parse_name(value, self.first_names),
+            text,
+        )
+
+    def birthdate(self, text):
+        return self._run("birthdate", parse_date, text)
+
+    def city(self, text):
+        return self._run("city", self.gazetteer.parse, text)
+
+    def confirmation(self, text):
+        return self._run("confirmation", parse_confirmation, text)
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        result = {}
+        for field_name in {key[0] for key in counts}:
+            hits = counts.get((field_name, "hit"), 0)
+            fallbacks = counts.get((field_name, "fallback"), 0)
+            result[field_name] = {
+                "hits": hits,
+                "fallbacks": fallbacks,
+                "hit_rate": hits / (hits + fallbacks) if hits + fallbacks else 0.0,
+            }
+        return result
+
+
+onboarding_fast_path = OnboardingFastPath.from_settings()
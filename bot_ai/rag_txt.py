@@ -1,20 +1,25 @@
 import os
-import time
 import uuid
+from dataclasses import replace
 from datetime import datetime
 from io import BytesIO
 from itertools import islice
 
-import numpy as np
-import pandas as pd
-import pdfplumber
-import tiktoken
-import vertexai
-from google.cloud import bigquery
-from google.cloud import storage
-from vertexai.language_models import TextEmbeddingModel
-
 from app.bot_ai.bot_multi_model import VertexAImultimodel
+from app.bot_ai.chunker import chunker
+from app.bot_ai.chunker import get_encoding
+from app.bot_ai.clients import make_bigquery_client
+from app.bot_ai.clients import make_embedding_model
+from app.bot_ai.clients import make_storage_client
+from app.bot_ai.clients import use_local_backends
+from app.bot_ai.embedding_cache import embedding_cache
+from app.bot_ai.embedding_executor import embedding_executor
+from app.bot_ai.instrumentation import current_record
+from app.bot_ai.instrumentation import instrumented
+from app.bot_ai.vector_store import VectorStoreBuilder
+
+# Namespace of the deterministic chunk ids (uuid5 of file name and chunk index)
+CHUNK_ID_NAMESPACE = uuid.UUID("6f1c4f53-8d0e-5a8e-9b41-2f6e0f3b7a10")
 
 
 class RAG_txt:  # noqa: N801
@@ -27,22 +32,23 @@ class RAG_txt:  # noqa: N801
 
     def __init__(self):
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "app/bot_ai/gcp_credentials.json"
-        self.storage_client = storage.Client()
-        self.bq_client = bigquery.Client()
-        vertexai.init(project=self.PROJECT_ID, location=self.LOCATION)
+        self.storage_client = make_storage_client()
+        self.bq_client = make_bigquery_client()
+        if not use_local_backends():
+            import vertexai
+
+            vertexai.init(project=self.PROJECT_ID, location=self.LOCATION)
         self.vx_model = VertexAImultimodel()
         self.chat, self.model = self.vx_model.start_chat()
-        self.embedding_model = TextEmbeddingModel.from_pretrained(
-            "text-multilingual-embedding-002",
-        )
+        self.embedding_model = make_embedding_model("text-multilingual-embedding-002")
 
+    @instrumented("rag.generate_embeddings")
     def generate_embeddings(self, texts, model):
-        embs = []
-        for i in range(0, len(texts), self.BATCH_SIZE):
-            time.sleep(1)
-            result = model.get_embeddings(texts[i : i + self.BATCH_SIZE])
-            embs = embs + [e.values for e in result]  # noqa: PD011
-        return embs
+        # Batches are sized and rate limited by the shared executor, and only
+        # the texts missing from the embedding cache are sent to it
+        if embedding_cache is None:
+            return embedding_executor.embed(list(texts), model)
+        return embedding_cache.embed(list(texts), model, embedding_executor.embed)
 
     def batched(self, iterable, n):
         """Batch data into tuples of length n. The last batch may be shorter."""
@@ -53,8 +59,7 @@ class RAG_txt:  # noqa: N801
             yield batch
 
     def chunked_tokens(self, text, chunk_length, encoding_name="cl100k_base"):
-        encoding = tiktoken.get_encoding(encoding_name)
-        tokens = encoding.encode(text)
+        tokens = get_encoding(encoding_name).encode(text, disallowed_special=())
         yield from self.batched(tokens, chunk_length)
 
     def len_safe_get_embedding(
@@ -64,66 +69,69 @@ class RAG_txt:  # noqa: N801
         max_tokens=EMBEDDING_CTX_LENGTH,
         encoding_name=EMBEDDING_ENCODING,
     ):
-        # Initialize lists to store embeddings and corresponding text chunks
-        chunk_texts = []
-        # Iterate over chunks of tokens from the input text
-        for chunk in self.chunked_tokens(
-            text,
-            chunk_length=max_tokens,
-            encoding_name=encoding_name,
-        ):
-            txt = tiktoken.get_encoding(encoding_name).decode(chunk)
-            chunk_texts.append(txt)
+        """
+        Splits a text, or an iterable with the text of every page, into
+        overlapping chunks of at most `max_tokens` tokens that end on sentence
+        boundaries, and embeds them.
+        """
+        pages = [text] if isinstance(text, str) else text
+        text_chunker = replace(chunker, max_tokens=max_tokens, encoding_name=encoding_name)
+        chunk_texts = list(text_chunker.chunk_pages(pages))
 
         # Generate embeddings for each chunk and append to the list
         chunk_embeddings = self.generate_embeddings(texts=chunk_texts, model=model)
         # Return the list of chunk embeddings and the corresponding text chunks
         return chunk_embeddings, chunk_texts
 
-    def chunking_n_vectorization(self, file_dict, model):
-        vector_store = pd.DataFrame(columns=["id", "name", "text", "embedding"])
+    @staticmethod
+    def page_texts(pdf):
+        """Yields the text of every page, dropping the parsed layout of each page."""
+        for page in pdf.pages:
+            yield page.extract_text() or ""
+            page.flush_cache()
+
+    @instrumented("rag.chunking_n_vectorization")
+    def build_vector_store(self, file_dict, model):
+        """
+        Chunks and embeds every PDF file into a `VectorStoreBuilder`.
+
+        Args:
+            file_dict (dict): The blobs to process, keyed by file name.
+            model (TextEmbeddingModel): The embedding model.
+
+        Returns:
+            VectorStoreBuilder: The chunks with their float32 embeddings.
+        """
+        import pdfplumber
+
+        vector_store = VectorStoreBuilder()
         for name, blob in file_dict.items():
             pdf_data = blob.download_as_bytes()
+            current_record().bytes_in += len(pdf_data)
             if len(pdf_data) < 5:  # noqa: PLR2004
                 continue
             with pdfplumber.open(BytesIO(pdf_data)) as pdf:
-                text = "".join(page.extract_text() for page in pdf.pages)
-            chunk_embeddings, chunk_texts = self.len_safe_get_embedding(
-                text,
-                model=model,
-            )
-            ids = [str(uuid.uuid4()) for _ in range(len(chunk_embeddings))]
+                chunk_embeddings, chunk_texts = self.len_safe_get_embedding(
+                    self.page_texts(pdf),
+                    model=model,
+                )
+            ids = [self.chunk_id(name, index) for index in range(len(chunk_embeddings))]
             name_lst = [name] * len(chunk_embeddings)
-            vector_store = pd.concat(
-                [
-                    vector_store,
-                    pd.DataFrame(
-                        {
-                            "id": ids,
-                            "name": name_lst,
-                            "text": chunk_texts,
-                            "embedding": chunk_embeddings,
-                        },
-                    ),
-                ],
-            )
+            vector_store.append(ids, name_lst, chunk_texts, chunk_embeddings)
         return vector_store
 
-    def embeddings_bucket2bigquery(self, bucket_name, prefix, table_name):
-        blobs = self.storage_client.list_blobs(bucket_name, prefix=prefix)
-        files = {blob.name.split("/")[-1]: blob for blob in blobs}
+    def chunking_n_vectorization(self, file_dict, model):
+        return self.build_vector_store(file_dict, model).to_dataframe()
 
-        vector_store = self.chunking_n_vectorization(
-            files,
-            model=self.embeddings_model,
-        ).reset_index(drop=True)
+    @staticmethod
+    def chunk_id(name, index):
+        """Returns the id of a chunk, stable across runs for the same file."""
+        return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{name}:{index}"))
 
-        try:
-            self.bq_client.get_table(table_name)
-        except Exception:  # noqa: BLE001
-            self.bq_client.create_table(table_name)
+    def vector_store_job_config(self, write_disposition):
+        from google.cloud import bigquery
 
-        job_config = bigquery.LoadJobConfig(
+        return bigquery.LoadJobConfig(
             # Specify a schema. The schema is used to assist in data type definitions.
             schema=[
                 # Specify the type of columns whose type cannot be auto-detected. For
@@ -137,16 +145,193 @@ class RAG_txt:  # noqa: N801
             # BigQuery appends loaded rows to an existing table by default,
             # but with WRITE_TRUNCATE write disposition it replaces the table
             # with the loaded data.
-            write_disposition="WRITE_TRUNCATE",
+            write_disposition=write_disposition,
         )
 
-        job = self.bq_client.load_table_from_dataframe(
-            vector_store,
+    @instrumented("rag.embeddings_bucket2bigquery")
+    def embeddings_bucket2bigquery(self, bucket_name, prefix, table_name):
+        """
+        Rebuilds the vector store table from every PDF file under a prefix,
+        and writes the manifest (``<table_name>_manifest``) that the next
+        `sync_bucket2bigquery` starts from. Rows are keyed by full blob name,
+        as in the incremental sync.
+        """
+        blobs = list(self.storage_client.list_blobs(bucket_name, prefix=prefix))
+        self.rebuild_table(table_name, blobs)
+
+    def rebuild_table(self, table_name, blobs):
+        """Replaces the table and its manifest with the chunks of the blobs."""
+        files = {blob.name: blob for blob in blobs}
+        vector_store = self.build_vector_store(files, model=self.embedding_model)
+
+        try:
+            self.bq_client.get_table(table_name)
+        except Exception:  # noqa: BLE001
+            self.bq_client.create_table(table_name)
+
+        vector_store.load_to_bigquery(
+            self.bq_client,
             table_name,
+            self.vector_store_job_config("WRITE_TRUNCATE"),
+        )
+        # Written last, so an interrupted rebuild is redone by the next sync
+        self.write_manifest(
+            f"{table_name}_manifest",
+            {blob.name: (blob.generation, blob.md5_hash) for blob in blobs},
+        )
+
+    def read_manifest(self, manifest_table):
+        """
+        Returns the (generation, md5) of every blob recorded by the syncs of
+        the table, keyed by full blob name, or None when the manifest does
+        not exist yet.
+        """
+        from google.api_core.exceptions import NotFound
+
+        try:
+            self.bq_client.get_table(manifest_table)
+        except NotFound:
+            return None
+
+        rows = self.bq_client.query_and_wait(
+            f"SELECT name, generation, md5 FROM `{manifest_table}`",  # noqa: S608
+        )
+        return {row["name"]: (int(row["generation"]), row["md5"]) for row in rows}
+
+    def write_manifest(self, manifest_table, manifest):
+        """
+        Replaces the manifest table with the given (generation, md5) of every
+        blob, keyed by full blob name.
+        """
+        import pandas as pd
+        from google.cloud import bigquery
+
+        manifest = pd.DataFrame(
+            {
+                "name": list(manifest),
+                "generation": [generation for generation, _ in manifest.values()],
+                "md5": [md5 for _, md5 in manifest.values()],
+            },
+            columns=["name", "generation", "md5"],
+        )
+        job_config = bigquery.LoadJobConfig(
+            schema=[
+                bigquery.SchemaField("name", bigquery.enums.SqlTypeNames.STRING),
+                bigquery.SchemaField("generation", bigquery.enums.SqlTypeNames.INT64),
+                bigquery.SchemaField("md5", bigquery.enums.SqlTypeNames.STRING),
+            ],
+            write_disposition="WRITE_TRUNCATE",
+        )
+        self.bq_client.load_table_from_dataframe(
+            manifest,
+            manifest_table,
             job_config=job_config,
-        )  # Make an API request.
-        job.result()  # Wait for the job to complete.
+        ).result()
+
+    def delete_file_rows(self, table_name, names):
+        """Deletes the chunks of the given files from the vector store table."""
+        from google.api_core.exceptions import NotFound
+        from google.cloud import bigquery
 
+        try:
+            self.bq_client.get_table(table_name)
+        except NotFound:
+            return
+
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ArrayQueryParameter("names", "STRING", sorted(names)),
+            ],
+        )
+        self.bq_client.query_and_wait(
+            f"DELETE FROM `{table_name}` WHERE name IN UNNEST(@names)",  # noqa: S608
+            job_config=job_config,
+        )
+
+    @instrumented("rag.sync_bucket2bigquery")
+    def sync_bucket2bigquery(self, bucket_name, prefix, table_name):
+        """
+        Incremental version of `embeddings_bucket2bigquery`. A manifest table
+        (``<table_name>_manifest``) keeps the generation and md5 of every blob
+        synced; only new or modified blobs are chunked and embedded, and the
+        rows of modified and removed blobs are replaced or deleted, so the
+        work scales with the changes instead of the size of the bucket.
+
+        Rows are keyed by the full blob name, so files with the same name in
+        different folders do not collide. Several prefixes can be synced into
+        the same table: a sync only updates the manifest entries under its
+        own prefix.
+
+        Without a manifest the rows of the table cannot be matched to blobs
+        (e.g. a table built before manifests existed), so the table is rebuilt
+        from the prefix and every blob is reported as added.
+
+        Args:
+            bucket_name (str): The bucket that holds the PDF files.
+            prefix (str): The folder of the files inside the bucket.
+            table_name (str): The vector store table (``project.dataset.table``).
+
+        Returns:
+            dict: The names of the added, modified, removed and unchanged blobs.
+        """
+        manifest_table = f"{table_name}_manifest"
+        manifest = self.read_manifest(manifest_table)
+        blobs = list(self.storage_client.list_blobs(bucket_name, prefix=prefix))
+        if manifest is None:
+            self.rebuild_table(table_name, blobs)
+            return {
+                "added": [blob.name for blob in blobs],
+                "modified": [],
+                "removed": [],
+                "unchanged": [],
+            }
+
+        changes = {"added": [], "modified": [], "removed": [], "unchanged": []}
+        for blob in blobs:
+            if blob.name not in manifest:
+                changes["added"].append(blob)
+                continue
+            generation, md5 = manifest[blob.name]
+            # A new generation with the same md5 is a re-upload of the same file
+            if generation == blob.generation or md5 == blob.md5_hash:
+                changes["unchanged"].append(blob)
+            else:
+                changes["modified"].append(blob)
+        current = {blob.name for blob in blobs}
+        changes["removed"] = [
+            name
+            for name in manifest
+            if name.startswith(prefix or "") and name not in current
+        ]
+
+        files = {blob.name: blob for blob in changes["added"] + changes["modified"]}
+        # Added blobs are deleted too: a sync interrupted after the load but
+        # before the manifest was written has already stored their rows
+        stale = set(files) | set(changes["removed"])
+        if stale:
+            self.delete_file_rows(table_name, stale)
+
+        if files:
+            vector_store = self.build_vector_store(files, model=self.embedding_model)
+            if len(vector_store):
+                vector_store.load_to_bigquery(
+                    self.bq_client,
+                    table_name,
+                    self.vector_store_job_config("WRITE_APPEND"),
+                )
+
+        for name in changes["removed"]:
+            del manifest[name]
+        manifest.update({blob.name: (blob.generation, blob.md5_hash) for blob in blobs})
+        # Written last, so an interrupted sync is redone on the next run
+        self.write_manifest(manifest_table, manifest)
+
+        return {
+            key: [getattr(item, "name", item) for item in value]
+            for key, value in changes.items()
+        }
+
+    @instrumented("rag.homemade_vector_search")
     def homemade_vector_search(
         self,
         prompt,
@@ -154,6 +339,8 @@ class RAG_txt:  # noqa: N801
         distance_metric="euclidean",
         neighbors=5,
     ):
+        import numpy as np
+
         vs_matrix = np.vstack(vector_store["embedding"].values.tolist())  # noqa: PD011
 
         q_emb = np.array(self.generate_embeddings([prompt], self.embedding_model))
@@ -0,0 +1,512 @@
+import asyncio
+import contextvars
+import inspect
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from functools import lru_cache
+
+from django.conf import settings
+from google.api_core import exceptions as google_exceptions
+
+from app.bot_ai.instrumentation import note_retry
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_EXCEPTIONS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.GatewayTimeout,
+    TimeoutError,
+)
+
+# Errors after which the request may have been processed by the service. They
+# are only retried for idempotent calls.
+TIMEOUT_EXCEPTIONS = (
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.GatewayTimeout,
+    TimeoutError,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit breaker is open."""
+
+
+class CallTimeoutError(TimeoutError):
+    """Raised when a call does not finish before its deadline."""
+
+
+@lru_cache(maxsize=256)
+def _accepts_timeout(func):
+    try:
+        parameters = inspect.signature(func).parameters
+    except (TypeError, ValueError):
+        return False
+    return "timeout" in parameters
+
+
+def accepts_timeout(func):
+    """Returns True when the function takes a per-request `timeout` argument."""
+    # Bound methods are looked up by their function, not by their instance
+    return _accepts_timeout(getattr(func, "__func__", func))
+
+
+class CircuitBreaker:
+    """
+    Fails fast when the error rate of the recent calls is too high.
+
+    The breaker looks at the outcome of the last `window` calls. When at least
+    `min_calls` were made and the share of failures reaches `failure_rate`,
+    the breaker opens and rejects every call for `reset_timeout` seconds. After
+    that a single trial call is let through (half-open): if it succeeds the
+    breaker closes, otherwise it opens again.
+
+    Methods:
+        before_call():
+            Raises CircuitOpenError if the call must be rejected.
+        record(success):
+            Records the outcome of a call.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_rate=0.5,
+        window=20,
+        min_calls=10,
+        reset_timeout=30.0,
+        clock=time.monotonic,
+    ):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError("Vertex AI circuit breaker is open")  # noqa: EM101, TRY003
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+
+            if self.state == self.HALF_OPEN:
+                if self._trial_running:
+                    raise CircuitOpenError("Vertex AI circuit breaker is half open")  # noqa: EM101, TRY003
+                self._trial_running = True
+
+    def record(self, success):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_running = False
+                if success:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (
+                len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) >= self.failure_rate
+            ):
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = self.clock()
+        logger.warning("Vertex AI circuit breaker opened")
+
+
+class LatencyTracker:
+    """
+    Keeps the durations of the last successful calls and computes percentiles.
+
+    With `max_age`, durations older than `max_age` seconds are forgotten, so
+    the percentiles recover when a model stops being called after a slow
+    period.
+
+    Methods:
+        observe(seconds):
+            Records the duration of a call.
+        percentile(q):
+            Returns the q-th percentile (0-100) of the recorded durations.
+    """
+
+    def __init__(self, window=200, min_samples=20, max_age=None, clock=time.monotonic):
+        self.min_samples = min_samples
+        self.max_age = max_age
+        self.clock = clock
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append((self.clock(), seconds))
+
+    def _expire(self):
+        if self.max_age is None:
+            return
+        oldest = self.clock() - self.max_age
+        while self._samples and self._samples[0][0] < oldest:
+            self._samples.popleft()
+
+    def percentile(self, q):
+        """
+        Returns the q-th percentile of the recorded durations, or None when
+        fewer than `min_samples` calls were recorded.
+        """
+        with self._lock:
+            self._expire()
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(seconds for _, seconds in self._samples)
+        index = min(len(ordered) - 1, round(q / 100 * (len(ordered) - 1)))
+        return ordered[index]
+
+    def __len__(self):
+        with self._lock:
+            self._expire()
+            return len(self._samples)
+
+
+class ResiliencePolicy:
+    """
+    Wraps calls to Vertex AI with a deadline, retries with jittered exponential
+    backoff on retryable errors, optional hedged requests and a circuit breaker.
+
+    With a deadline, blocking calls run in a thread pool and the caller waits
+    for them at most `deadline` seconds, so a function without a `timeout`
+    argument (e.g. `GenerativeModel.generate_content`) cannot block a worker
+    indefinitely; the deadline is also passed as the request `timeout` of the
+    SDK when the called function accepts it. Without a deadline nor hedging
+    the call runs inline in the calling thread.
+
+    Hedging sends a second identical request when the first one has not
+    answered after `hedge_after` seconds and returns whichever finishes first.
+    With ``hedge_after="p95"`` the delay is the observed p95 latency.
+    It must only be used for idempotent calls (e.g. `generate_content`), never
+    for chat turns, which change the session history. Chat turns are called
+    with ``idempotent=False``: they are never hedged and a timed out turn is
+    not sent again, since the service may already have answered it.
+
+    Attributes:
+        deadline (float | None): Seconds allowed for each attempt.
+        max_retries (int): Number of retries after the first attempt.
+        backoff_base (float): Delay before the first retry, in seconds.
+        backoff_max (float): Maximum delay between retries, in seconds.
+        hedge_after (float | str | None): Seconds before sending a hedged request,
+            or "p95" to use the observed p95 latency.
+        latency (LatencyTracker): Durations of the recent successful calls.
+        breaker (CircuitBreaker | None): The circuit breaker shared by the calls.
+
+    Methods:
+        call(func, *args, hedge=False, idempotent=True, **kwargs):
+            Runs a blocking call under the policy.
+        acall(func, *args, hedge=False, idempotent=True, **kwargs):
+            Runs a coroutine function under the policy.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        deadline=60.0,
+        max_retries=3,
+        backoff_base=0.5,
+        backoff_max=8.0,
+        hedge_after=None,
+        breaker=None,
+        retryable=RETRYABLE_EXCEPTIONS,
+        sleep=time.sleep,
+        async_sleep=asyncio.sleep,
+        max_workers=32,
+    ):
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.breaker = breaker
+        self.retryable = retryable
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+        self.max_workers = max_workers
+        self.latency = LatencyTracker()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Builds the policy from the `BOT_AI_RESILIENCE` setting. Supported keys:
+        ``DEADLINE``, ``MAX_RETRIES``, ``BACKOFF_BASE``, ``BACKOFF_MAX``,
+        ``HEDGE_AFTER``, ``BREAKER_FAILURE_RATE``, ``BREAKER_WINDOW``,
+        ``BREAKER_MIN_CALLS`` and ``BREAKER_RESET_TIMEOUT``.
+        """
+        config = getattr(settings, "BOT_AI_RESILIENCE", {})
+        breaker = CircuitBreaker(
+            failure_rate=config.get("BREAKER_FAILURE_RATE", 0.5),
+            window=config.get("BREAKER_WINDOW", 20),
+            min_calls=config.get("BREAKER_MIN_CALLS", 10),
+            reset_timeout=config.get("BREAKER_RESET_TIMEOUT", 30.0),
+        )
+        return cls(
+            deadline=config.get("DEADLINE", 60.0),
+            max_retries=config.get("MAX_RETRIES", 3),
+            backoff_base=config.get("BACKOFF_BASE", 0.5),
+            backoff_max=config.get("BACKOFF_MAX", 8.0),
+            hedge_after=config.get("HEDGE_AFTER"),
+            breaker=breaker,
+        )
+
+    @property
+    def executor(self):
+        """The thread pool of calls with a deadline, created on first use."""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="vertex-call",
+                )
+            return self._executor
+
+    def hedge_delay(self):
+        """Returns the seconds to wait before a hedged request, or None."""
+        if self.hedge_after == "p95":
+            return self.latency.percentile(95)
+        return self.hedge_after
+
+    def backoff(self, attempt):
+        """Returns the jittered delay before a retry (full jitter)."""
+        return random.uniform(  # noqa: S311
+            0,
+            min(self.backoff_max, self.backoff_base * 2**attempt),
+        )
+
+    def should_retry(self, error, attempt, idempotent):
+        """Returns True when a failed attempt can be sent again."""
+        if attempt >= self.max_retries:
+            return False
+        return idempotent or not isinstance(error, TIMEOUT_EXCEPTIONS)
+
+    def call(self, func, *args, hedge=False, idempotent=True, **kwargs):
+        """
+        Runs a blocking call under the policy.
+
+        Args:
+            func (callable): The function to call.
+            hedge (bool): Whether hedged requests are allowed for this call.
+            idempotent (bool): Whether the call can be sent again after a
+                timeout. Chat turns are not idempotent.
+
+        Returns:
+            The result of the call.
+
+        Raises:
+            CircuitOpenError: If the circuit breaker rejects the call.
+            CallTimeoutError: If an attempt misses its deadline.
+        """
+        hedge = hedge and idempotent
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_call()
+            try:
+                result = self._attempt(func, args, kwargs, hedge)
+            except self.retryable as e:
+                self._record(success=False)
+                if not self.should_retry(e, attempt, idempotent):
+                    raise
+                delay = self.backoff(attempt)
+                note_retry()
+                logger.warning(
+                    f"Vertex call failed ({e!r}), retry {attempt + 1} in {delay:.2f}s",  # noqa: G004
+                )
+                self.sleep(delay)
+                attempt += 1
+            except Exception:
+                self._record(success=True)
+                raise
+            else:
+                self._record(success=True)
+                return result
+
+    async def acall(self, func, *args, hedge=False, idempotent=True, **kwargs):
+        """
+        Runs a coroutine function under the policy.
+
+        Args:
+            func (callable): The coroutine function to call.
+            hedge (bool): Whether hedged requests are allowed for this call.
+            idempotent (bool): Whether the call can be sent again after a
+                timeout. Chat turns are not idempotent.
+
+        Returns:
+            The result of the call.
+        """
+        hedge = hedge and idempotent
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_call()
+            try:
+                result = await self._aattempt(func, args, kwargs, hedge)
+            except self.retryable as e:
+                self._record(success=False)
+                if not self.should_retry(e, attempt, idempotent):
+                    raise
+                delay = self.backoff(attempt)
+                note_retry()
+                logger.warning(
+                    f"Vertex call failed ({e!r}), retry {attempt + 1} in {delay:.2f}s",  # noqa: G004
+                )
+                await self.async_sleep(delay)
+                attempt += 1
+            except Exception:
+                self._record(success=True)
+                raise
+            else:
+                self._record(success=True)
+                return result
+
+    def _record(self, success):
+        # Non-retryable errors (bad request, safety blocks...) are caller errors
+        # and do not count against the health of the service.
+        if self.breaker is not None:
+            self.breaker.record(success)
+
+    def _with_timeout(self, func, kwargs):
+        if self.deadline is None or "timeout" in kwargs or not accepts_timeout(func):
+            return kwargs
+        return {**kwargs, "timeout": self.deadline}
+
+    def _remaining(self, started):
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - (time.monotonic() - started))
+
+    def _submit(self, func, args, kwargs):
+        # The request runs with the context of the caller, e.g. its call record
+        context = contextvars.copy_context()
+        return self.executor.submit(context.run, func, *args, **kwargs)
+
+    def _attempt(self, func, args, kwargs, hedge):  # noqa: C901
+        started = time.monotonic()
+        kwargs = self._with_timeout(func, kwargs)
+        hedge_delay = self.hedge_delay() if hedge else None
+
+        if hedge_delay is None and self.deadline is None:
+            result = func(*args, **kwargs)
+            self.latency.observe(time.monotonic() - started)
+            return result
+
+        # The attempt runs in the pool so the caller stops waiting at the
+        # deadline, even when the SDK call itself has no timeout
+        futures = [self._submit(func, args, kwargs)]
+        if hedge_delay is not None:
+            remaining = self._remaining(started)
+            if remaining is not None:
+                hedge_delay = min(hedge_delay, remaining)
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done and self._remaining(started) != 0.0:
+                logger.info("Sending hedged Vertex request")
+                futures.append(self._submit(func, args, kwargs))
+
+        remaining = self._remaining(started)
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(
+                pending,
+                timeout=remaining,
+                return_when=FIRST_COMPLETED,
+            )
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    self.latency.observe(time.monotonic() - started)
+                    return future.result()
+                error = future.exception()
+            remaining = self._remaining(started)
+
+        if error is not None and not pending:
+            raise error
+        # A running request cannot be interrupted, it finishes in the pool
+        for future in pending:
+            future.cancel()
+        raise CallTimeoutError(f"Vertex call exceeded its {self.deadline}s deadline")  # noqa: EM102, TRY003
+
+    async def _aattempt(self, func, args, kwargs, hedge):  # noqa: C901
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        hedge_delay = self.hedge_delay() if hedge else None
+
+        if hedge_delay is None:
+            try:
+                result = await asyncio.wait_for(
+                    func(*args, **kwargs),
+                    timeout=self.deadline,
+                )
+            except asyncio.TimeoutError as e:  # noqa: UP041
+                raise CallTimeoutError(  # noqa: TRY003
+                    f"Vertex call exceeded its {self.deadline}s deadline",  # noqa: EM102
+                ) from e
+            self.latency.observe(loop.time() - started)
+            return result
+
+        tasks = {asyncio.ensure_future(func(*args, **kwargs))}
+
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        if not done:
+            logger.info("Sending hedged Vertex request")
+            tasks.add(asyncio.ensure_future(func(*args, **kwargs)))
+
+        pending = tasks
+        error = None
+        try:
+            while pending:
+                remaining = None
+                if self.deadline is not None:
+                    remaining = max(0.0, self.deadline - (loop.time() - started))
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=remaining,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        self.latency.observe(loop.time() - started)
+                        return task.result()
+                    error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if error is not None and not pending:
+            raise error
+        raise CallTimeoutError(f"Vertex call exceeded its {self.deadline}s deadline")  # noqa: EM102, TRY003
+
+
+vertex_policy = ResiliencePolicy.from_settings()
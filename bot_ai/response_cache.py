@@ -0,0 +1,227 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60 * 60
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+
+class LRUTier:
+    """
+    In-memory LRU tier with a per-entry TTL and limits on the number of entries
+    and on the total size of the stored values.
+
+    Methods:
+        get(key):
+            Returns the stored value or None if it is missing or expired.
+        set(key, value, ttl):
+            Stores a value, evicting the least recently used entries if needed.
+        clear():
+            Drops every entry.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._size += size
+
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._size > self.max_bytes
+            ):
+                self._drop(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, key):
+        _, value = self._entries.pop(key)
+        self._size -= len(value.encode("utf-8"))
+
+
+class DjangoCacheTier:
+    """
+    Shared tier backed by a Django cache alias (for example a Redis cache), so
+    every worker process sees the responses stored by the others.
+    """
+
+    def __init__(self, alias="default", key_prefix="bot_ai:response:"):
+        from django.core.cache import caches
+
+        self.cache = caches[alias]
+        self.key_prefix = key_prefix
+
+    def get(self, key):
+        return self.cache.get(self.key_prefix + key)
+
+    def set(self, key, value, ttl):
+        self.cache.set(self.key_prefix + key, value, timeout=ttl)
+
+    def clear(self):
+        # Shared entries expire by TTL, other processes may still be using them.
+        return
+
+
+class ResponseCache:
+    """
+    Exact-match cache for the responses of stateless prompts.
+
+    The key is a hash of the model name, the instruction text, the prompt and
+    the generation config. Lookups go to the in-memory tier first and then to
+    the optional shared tier, which also refills the in-memory tier.
+
+    Attributes:
+        ttl (int): Seconds a response stays valid.
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups that needed a model call.
+
+    Methods:
+        make_key(model_name, instruction, prompt, generation_config):
+            Builds the cache key of a request.
+        get(key):
+            Returns the cached response or None.
+        set(key, value):
+            Stores a response in every tier.
+        stats():
+            Returns the hit-rate metrics.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, local_tier=None, shared_tier=None):
+        self.ttl = ttl
+        self.local_tier = local_tier if local_tier is not None else LRUTier()
+        self.shared_tier = shared_tier
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model_name, instruction, prompt, generation_config=None):
+        """
+        Builds the cache key of a request.
+
+        Args:
+            model_name (str): The name of the generative model.
+            instruction (str | list): The system instruction text.
+            prompt (str): The prompt sent to the model.
+            generation_config (dict, optional): The generation config.
+
+        Returns:
+            str: A sha256 hex digest identifying the request.
+        """
+        payload = json.dumps(
+            [model_name, instruction, prompt, generation_config],
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        value = self.local_tier.get(key)
+
+        if value is None and self.shared_tier is not None:
+            try:
+                value = self.shared_tier.get(key)
+            except Exception as e:  # noqa: BLE001
+                logger.warning(f"Shared response cache unavailable: {e}")  # noqa: G004
+                value = None
+            if value is not None:
+                self.local_tier.set(key, value, self.ttl)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.local_tier.set(key, value, self.ttl)
+
+        if self.shared_tier is not None:
+            try:
+                self.shared_tier.set(key, value, self.ttl)
+            except Exception as e:  # noqa: BLE001
+                logger.warning(f"Shared response cache unavailable: {e}")  # noqa: G004
+
+    def clear(self):
+        self.local_tier.clear()
+        if self.shared_tier is not None:
+            self.shared_tier.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """
+        Returns the hit-rate metrics of the cache.
+
+        Returns:
+            dict: Hits, misses, hit rate and the number of in-memory entries.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.local_tier),
+        }
+
+
+def build_response_cache():
+    """
+    Builds the response cache from the `BOT_AI_RESPONSE_CACHE` setting.
+
+    Supported keys: ``TTL``, ``MAX_ENTRIES``, ``MAX_BYTES`` and ``DJANGO_CACHE``
+    (the alias of a Django cache to use as the shared tier).
+    """
+    config = getattr(settings, "BOT_AI_RESPONSE_CACHE", {})
+
+    shared_tier = None
+    if config.get("DJANGO_CACHE"):
+        shared_tier = DjangoCacheTier(config["DJANGO_CACHE"])
+
+    return ResponseCache(
+        ttl=config.get("TTL", DEFAULT_TTL),
+        local_tier=LRUTier(
+            max_entries=config.get("MAX_ENTRIES", DEFAULT_MAX_ENTRIES),
+            max_bytes=config.get("MAX_BYTES", DEFAULT_MAX_BYTES),
+        ),
+        shared_tier=shared_tier,
+    )
+
+
+response_cache = build_response_cache()
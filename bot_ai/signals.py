@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent by GCSManager when a blob is created, overwritten or deleted.
+# Arguments: bucket_name (str), blob_name (str), generation (int | None).
+blob_generation_changed = Signal()
@@ -4,9 +4,7 @@ from pathlib import Path
 
 from celery import shared_task
 
-from app.bot_ai.bigquery import GCPBigQuery
-from app.bot_ai.file_extractor import PDFExtractor
-from app.bot_ai.gc_storage import GCSManager
+from app.bot_ai.instrumentation import instrumented
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +21,7 @@ def tasks_in_vertex(customer_name, customer_id):
 
 
 @shared_task
+@instrumented("task.from_csv_to_bigquery_table")
 def from_csv_to_bigquery_table(customer_name, customer_id):
     """
     A Celery task that uploads CSV files to a Google Cloud Storage bucket, processes them, and uploads them to BigQuery.
@@ -47,6 +46,11 @@ def from_csv_to_bigquery_table(customer_name, customer_id):
         bucket_url (str): The GCS path for the uploaded CSV file.
         bucket_file_url (str): The full GCS URL for the uploaded CSV file.
     """  # noqa: E501
+    # Imported here so Celery workers do not load the Google SDKs at startup
+    from app.bot_ai.bigquery import GCPBigQuery
+    from app.bot_ai.file_extractor import PDFExtractor
+    from app.bot_ai.gc_storage import GCSManager
+
     file_name = "amazon_products"
     bucket_name = "dev_lumi_company_files"
     project_id = os.getenv("GOOGLE_CLOUD_PROJECT_ID")
@@ -116,3 +120,23 @@ def from_csv_to_bigquery_table(customer_name, customer_id):
     # Delete temporary tables
     for file_name_in_list in files_name_list:
         bq_manager.delete_table(folder_name, file_name_in_list)
+
+
+@shared_task
+@instrumented("task.update_conversation_summary")
+def update_conversation_summary(conversation_id):
+    """
+    A Celery task that folds the older messages of a WhatsApp conversation into
+    its running summary.
+
+    Args:
+        conversation_id (str): The ID of the conversation.
+    """
+    from app.bot_ai.conversation_summary import ConversationSummarizer
+    from app.bot_whatsapp.models import MessageWhatsappModel
+
+    messages = MessageWhatsappModel.objects.filter(
+        conversation_id=conversation_id,
+    ).order_by("id")
+
+    ConversationSummarizer.from_settings().update_summary(conversation_id, messages)
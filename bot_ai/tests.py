@@ -0,0 +1,252 @@
+import io
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from app.bot_ai.captioning import ImageCaptioningService
+from app.bot_ai.onboarding_parsers import ACCEPT
+from app.bot_ai.onboarding_parsers import AMBIGUOUS
+from app.bot_ai.onboarding_parsers import CityGazetteer
+from app.bot_ai.onboarding_parsers import REJECT
+from app.bot_ai.onboarding_parsers import parse_confirmation
+from app.bot_ai.onboarding_parsers import parse_name
+from app.bot_ai.rag_txt import RAG_txt
+from app.bot_ai.resilience import CallTimeoutError
+from app.bot_ai.resilience import ResiliencePolicy
+
+
+class ParseNameTests(SimpleTestCase):
+    def test_accepts_full_names(self):
+        cases = {
+            "Ramon Aguirre": "Ramon Aguirre",
+            "mi nombre es juan pérez": "Juan Pérez",
+            "Hola soy maría de la luz": "María de la Luz",
+            "Me llamo pedro sánchez-gómez": "Pedro Sánchez-Gómez",
+        }
+        for text, name in cases.items():
+            with self.subTest(text=text):
+                result = parse_name(text)
+                self.assertEqual(result.status, ACCEPT)
+                self.assertEqual(result.value, name)
+
+    def test_leaves_messages_that_are_not_names_to_the_llm(self):
+        for text in [
+            "Por favor ayuda",
+            "Buen día",
+            "Ya te dije",
+            "jajaja jeje",
+            "Juan jajaja",
+            "Juan por favor",
+            "No quiero decir",
+            "ok gracias",
+            "Soy Ana",
+        ]:
+            with self.subTest(text=text):
+                self.assertEqual(parse_name(text).status, AMBIGUOUS)
+
+    def test_rejects_empty_answers(self):
+        for text in ["", "  ", "¿?"]:
+            with self.subTest(text=text):
+                self.assertEqual(parse_name(text).status, REJECT)
+
+    def test_leaves_digits_and_symbols_to_the_llm(self):
+        for text in [
+            "Me llamo Ana, tengo 25",
+            "Juan Pérez 2do",
+            "juan@correo.com",
+        ]:
+            with self.subTest(text=text):
+                self.assertEqual(parse_name(text).status, AMBIGUOUS)
+
+    def test_extra_first_names(self):
+        self.assertEqual(parse_name("Xochitl Pérez").status, AMBIGUOUS)
+        result = parse_name("Xochitl Pérez", first_names={"xochitl"})
+        self.assertEqual(result.value, "Xochitl Pérez")
+
+
+class ParseConfirmationTests(SimpleTestCase):
+    def test_plain_answers(self):
+        cases = {
+            "sí": True,
+            "Si, gracias": True,
+            "sí, es correcto": True,
+            "no": False,
+            "No, está mal": False,
+        }
+        for text, value in cases.items():
+            with self.subTest(text=text):
+                result = parse_confirmation(text)
+                self.assertEqual(result.status, ACCEPT)
+                self.assertIs(result.value, value)
+
+    def test_answers_with_more_information_are_ambiguous(self):
+        for text in [
+            "no sé",
+            "no se",
+            "sí, pero mi nombre es Juan",
+            "no, mi fecha es 3 de mayo",
+            "si no",
+            "tal vez",
+        ]:
+            with self.subTest(text=text):
+                self.assertEqual(parse_confirmation(text).status, AMBIGUOUS)
+
+
+
+class CityGazetteerTests(SimpleTestCase):
+    def setUp(self):
+        self.gazetteer = CityGazetteer()
+
+    def test_accepts_answers_that_are_a_city(self):
+        cases = {
+            "Guadalajara": "Guadalajara",
+            "vivo en cdmx": "Ciudad de México",
+            "Soy de Mérida, Yucatán": "Mérida",
+            "guadalajara jalisco mexico": "Guadalajara",
+            "En Ciudad Juárez.": "Ciudad Juárez",
+        }
+        for text, city in cases.items():
+            with self.subTest(text=text):
+                result = self.gazetteer.parse(text)
+                self.assertEqual(result.status, ACCEPT)
+                self.assertEqual(result.value, city)
+
+    def test_leaves_sentences_to_the_llm(self):
+        for text in [
+            "no vivo en Guadalajara, vivo en Tlaquepaque",
+            "trabajo en Monterrey pero vivo en Apodaca",
+            "Guadalajara o Zapopan",
+            "Tlaquepaque",
+            "Jalisco",
+        ]:
+            with self.subTest(text=text):
+                self.assertEqual(self.gazetteer.parse(text).status, AMBIGUOUS)
+
+
+class ResiliencePolicyTests(SimpleTestCase):
+    def test_deadline_applies_to_calls_without_timeout(self):
+        policy = ResiliencePolicy(deadline=0.1, max_retries=0)
+
+        def generate_content(prompt):
+            time.sleep(1)
+            return prompt
+
+        started = time.monotonic()
+        with self.assertRaises(CallTimeoutError):
+            policy.call(generate_content, "hola")
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_calls_within_the_deadline_return(self):
+        policy = ResiliencePolicy(deadline=1, max_retries=0)
+        self.assertEqual(policy.call(str.upper, "hola"), "HOLA")
+
+
+class FakeVectorStore:
+    def __init__(self, table, files):
+        self.table = table
+        self.names = list(files)
+
+    def __len__(self):
+        return len(self.names)
+
+    def load_to_bigquery(self, client, table_name, job_config):
+        if job_config.write_disposition == "WRITE_TRUNCATE":
+            self.table.clear()
+        self.table.extend(self.names)
+
+
+class SyncBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.table = []
+        self.manifests = {}
+        self.blobs = [
+            SimpleNamespace(name="docs/a/manual.pdf", generation=1, md5_hash="a"),
+            SimpleNamespace(name="docs/b/manual.pdf", generation=1, md5_hash="b"),
+        ]
+        self.rag = RAG_txt.__new__(RAG_txt)
+        self.rag.embedding_model = None
+        self.rag.bq_client = mock.Mock()
+        self.rag.storage_client = mock.Mock()
+        self.rag.storage_client.list_blobs.side_effect = lambda *a, **k: self.blobs
+
+        def delete_file_rows(table_name, names):
+            self.table[:] = [name for name in self.table if name not in names]
+
+        patches = [
+            mock.patch.object(
+                self.rag,
+                "build_vector_store",
+                lambda files, model: FakeVectorStore(self.table, files),
+            ),
+            mock.patch.object(self.rag, "read_manifest", self.manifests.get),
+            mock.patch.object(
+                self.rag,
+                "write_manifest",
+                lambda table, manifest: self.manifests.update({table: dict(manifest)}),
+            ),
+            mock.patch.object(self.rag, "delete_file_rows", delete_file_rows),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_sync_after_full_rebuild_keeps_one_copy_of_every_file(self):
+        self.rag.embeddings_bucket2bigquery("bucket", "docs/", "p.ds.vs")
+        changes = self.rag.sync_bucket2bigquery("bucket", "docs/", "p.ds.vs")
+
+        self.assertEqual(changes["added"], [])
+        self.assertEqual(sorted(self.table), ["docs/a/manual.pdf", "docs/b/manual.pdf"])
+
+        self.blobs[0] = SimpleNamespace(
+            name="docs/a/manual.pdf",
+            generation=2,
+            md5_hash="c",
+        )
+        changes = self.rag.sync_bucket2bigquery("bucket", "docs/", "p.ds.vs")
+        self.assertEqual(changes["modified"], ["docs/a/manual.pdf"])
+        self.assertEqual(sorted(self.table), ["docs/a/manual.pdf", "docs/b/manual.pdf"])
+
+    def test_sync_without_manifest_rebuilds_the_table(self):
+        self.table.extend(["manual.pdf", "manual.pdf"])
+        changes = self.rag.sync_bucket2bigquery("bucket", "docs/", "p.ds.vs")
+
+        self.assertEqual(len(changes["added"]), 2)
+        self.assertEqual(sorted(self.table), ["docs/a/manual.pdf", "docs/b/manual.pdf"])
+        self.assertIn("p.ds.vs_manifest", self.manifests)
+
+
+def solid_png(color):
+    from PIL import Image as PILImage
+
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (32, 32), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class ImageCaptioningTests(SimpleTestCase):
+    def setUp(self):
+        self.service = ImageCaptioningService(cache=None)
+        self.captioned = []
+
+        def caption(content, digest, language, number_of_results):
+            self.captioned.append(digest)
+            return [f"caption {len(self.captioned)}"]
+
+        patch = mock.patch.object(self.service, "_caption", caption)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_color_variants_get_their_own_captions(self):
+        red, blue = solid_png("red"), solid_png("blue")
+        self.assertNotEqual(self.service.prepare(red)[1], self.service.prepare(blue)[1])
+        self.assertNotEqual(self.service.caption(red), self.service.caption(blue))
+
+    def test_batch_captions_identical_images_once(self):
+        red, blue = solid_png("red"), solid_png("blue")
+        captions = self.service.caption_batch([red, blue, red])
+
+        self.assertEqual(len(self.captioned), 2)
+        self.assertEqual(captions[0], captions[2])
+        self.assertNotEqual(captions[0], captions[1])
@@ -0,0 +1,182 @@
+import logging
+
+from django.conf import settings
+
+from app.bot_ai.chunker import get_encoding
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_TOKEN_BUDGET = 24000
+DEFAULT_KEEP_LAST_TURNS = 2
+# Rough cost of a non-text part (image, video frame, file reference)
+FILE_PART_TOKENS = 258
+CHARS_PER_TOKEN = 4
+
+
+def part_text(part):
+    """Returns the text of a content part, or None for non-text parts."""
+    if isinstance(part, str):
+        return part
+    try:
+        return part.text
+    except (AttributeError, ValueError):
+        return None
+
+
+def content_parts(content):
+    """Returns the parts of a Content, a Part or a plain string."""
+    if isinstance(content, str):
+        return [content]
+    parts = getattr(content, "parts", None)
+    if parts is None:
+        return [content]
+    return list(parts)
+
+
+def estimate_text_tokens(text):
+    """
+    Estimates the number of tokens of a text with the local tokenizer, or by
+    characters when tiktoken is not available.
+    """
+    try:
+        encoding = get_encoding("cl100k_base")
+    except ImportError:
+        return len(text) // CHARS_PER_TOKEN + 1
+
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def estimate_tokens(contents):
+    """
+    Estimates the number of tokens of a list of contents without calling Vertex.
+
+    Args:
+        contents (list): Content objects, Parts or strings.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    total = 0
+    for content in contents:
+        for part in content_parts(content):
+            text = part_text(part)
+            total += FILE_PART_TOKENS if text is None else estimate_text_tokens(text)
+    return total
+
+
+def group_turns(history):
+    """
+    Groups a chat history into turns. A turn starts with a user content and
+    includes the model contents that answer it.
+    """
+    turns = []
+    for content in history:
+        if getattr(content, "role", "user") == "user" or not turns:
+            turns.append([content])
+        else:
+            turns[-1].append(content)
+    return turns
+
+
+class TokenBudget:
+    """
+    Keeps the prompt of a chat turn under a token budget by dropping the oldest
+    turns of the history. The system instruction and the newest turns are
+    always kept.
+
+    Attributes:
+        max_tokens (int): The token budget for instruction, history and message.
+        keep_last_turns (int): Number of newest turns never dropped.
+        model (GenerativeModel | None): When set, `count_tokens` is used instead
+            of the local estimate.
+
+    Methods:
+        count(contents):
+            Counts the tokens of a list of contents.
+        trim_history(history, system_instruction, message):
+            Returns the newest turns of the history that fit in the budget.
+    """
+
+    def __init__(
+        self,
+        max_tokens=DEFAULT_HISTORY_TOKEN_BUDGET,
+        keep_last_turns=DEFAULT_KEEP_LAST_TURNS,
+        model=None,
+    ):
+        self.max_tokens = max_tokens
+        self.keep_last_turns = keep_last_turns
+        self.model = model
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Builds the budget from the `BOT_AI_TOKEN_BUDGET` setting. Supported keys:
+        ``MAX_TOKENS`` and ``KEEP_LAST_TURNS``. Returns None when disabled with
+        ``MAX_TOKENS: None``.
+        """
+        config = getattr(settings, "BOT_AI_TOKEN_BUDGET", {})
+        max_tokens = config.get("MAX_TOKENS", DEFAULT_HISTORY_TOKEN_BUDGET)
+        if max_tokens is None:
+            return None
+        return cls(
+            max_tokens=max_tokens,
+            keep_last_turns=config.get("KEEP_LAST_TURNS", DEFAULT_KEEP_LAST_TURNS),
+        )
+
+    def count(self, contents):
+        """
+        Counts the tokens of a list of contents.
+
+        Args:
+            contents (list): Content objects, Parts or strings.
+
+        Returns:
+            int: The number of tokens.
+        """
+        if not contents:
+            return 0
+        if self.model is not None:
+            try:
+                return self.model.count_tokens(contents).total_tokens
+            except Exception as e:  # noqa: BLE001
+                logger.warning(f"count_tokens failed, using the estimate: {e}")  # noqa: G004
+        return estimate_tokens(contents)
+
+    def trim_history(self, history, system_instruction=None, message=None):
+        """
+        Returns the newest turns of the history that fit in the budget.
+
+        Args:
+            history (list[Content]): The chat history, oldest first.
+            system_instruction (str | list, optional): The system instruction.
+            message (list, optional): The contents of the message about to be sent.
+
+        Returns:
+            tuple: The trimmed history and a report dict with the token numbers.
+        """
+        if isinstance(system_instruction, str):
+            system_instruction = [system_instruction]
+
+        system_tokens = self.count(system_instruction or [])
+        message_tokens = self.count(message or [])
+        available = self.max_tokens - system_tokens - message_tokens
+
+        kept = []
+        history_tokens = 0
+        turns = group_turns(history)
+        for position, turn in enumerate(reversed(turns)):
+            turn_tokens = self.count(turn)
+            if position >= self.keep_last_turns and history_tokens + turn_tokens > available:
+                break
+            kept.insert(0, turn)
+            history_tokens += turn_tokens
+
+        report = {
+            "system_tokens": system_tokens,
+            "history_tokens": history_tokens,
+            "message_tokens": message_tokens,
+            "prompt_tokens": system_tokens + history_tokens + message_tokens,
+            "dropped_turns": len(turns) - len(kept),
+            "budget": self.max_tokens,
+        }
+        return [content for turn in kept for content in turn], report
@@ -0,0 +1,413 @@
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import field
+
+from django.conf import settings
+from google.api_core import exceptions as google_exceptions
+
+from app.bot_ai.clients import PROJECT_ID
+from app.bot_ai.clients import get_credentials
+from app.bot_ai.disk_cache import build_disk_cache
+
+logger = logging.getLogger(__name__)
+
+# Limits of a synchronous recognize request
+SYNC_LIMIT_SECONDS = 55
+SYNC_LIMIT_BYTES = 10 * 1024 * 1024
+
+DEFAULT_SEGMENT_SECONDS = 50
+DEFAULT_MIN_SILENCE_MS = 400
+DEFAULT_SILENCE_THRESH_DB = -40
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_speech_client(region="us-central1"):
+    """
+    Returns the process-wide SpeechClient of a region, building it on first use.
+    """
+    with _clients_lock:
+        client = _clients.get(region)
+        if client is None:
+            from google.api_core.client_options import ClientOptions
+            from google.cloud.speech_v2 import SpeechClient
+
+            client = SpeechClient(
+                client_options=ClientOptions(
+                    api_endpoint=f"{region}-speech.googleapis.com",
+                ),
+                credentials=get_credentials(),
+            )
+            _clients[region] = client
+        return client
+
+
+@dataclass
+class TranscriptSegment:
+    """
+    The transcript of a piece of audio.
+
+    Attributes:
+        start_ms (int): Start of the piece in the original audio.
+        end_ms (int): End of the piece in the original audio.
+        text (str): The transcript.
+        languages (list[str]): The languages detected in the piece.
+    """
+
+    start_ms: int
+    end_ms: int
+    text: str
+    languages: list = field(default_factory=list)
+
+
+@dataclass
+class TranscriptionResult:
+    """
+    The transcript of a whole audio file, stitched in order.
+
+    Attributes:
+        segments (list[TranscriptSegment]): The transcripts of every piece.
+    """
+
+    segments: list = field(default_factory=list)
+
+    @property
+    def text(self):
+        return " ".join(segment.text for segment in self.segments if segment.text)
+
+    @property
+    def languages(self):
+        languages = []
+        for segment in self.segments:
+            languages.extend(
+                language for language in segment.languages if language not in languages
+            )
+        return languages
+
+
+def split_on_silence_boundaries(
+    audio,
+    max_segment_ms,
+    min_silence_ms=DEFAULT_MIN_SILENCE_MS,
+    silence_thresh_db=DEFAULT_SILENCE_THRESH_DB,
+):
+    """
+    Returns the (start_ms, end_ms) boundaries of segments no longer than
+    `max_segment_ms`, cut in the middle of the last silence before each limit.
+    A segment with no silence in range is cut at the limit.
+
+    Args:
+        audio (AudioSegment): The audio to split.
+        max_segment_ms (int): The maximum length of a segment.
+        min_silence_ms (int): The minimum length of a silence.
+        silence_thresh_db (int): Loudness under which the audio counts as silence.
+
+    Returns:
+        list[tuple[int, int]]: The segment boundaries, in order.
+    """
+    from pydub.silence import detect_silence
+
+    silences = detect_silence(
+        audio,
+        min_silence_len=min_silence_ms,
+        silence_thresh=silence_thresh_db,
+    )
+    cut_points = [(start + end) // 2 for start, end in silences]
+
+    boundaries = []
+    start = 0
+    total = len(audio)
+    while total - start > max_segment_ms:
+        limit = start + max_segment_ms
+        candidates = [point for point in cut_points if start < point <= limit]
+        end = candidates[-1] if candidates else limit
+        boundaries.append((start, end))
+        start = end
+    boundaries.append((start, total))
+    return boundaries
+
+
+class TranscriptionService:
+    """
+    Transcribes audio with Chirp, reusing the Speech client of the region.
+
+    Short audio is sent as one synchronous request, without decoding it.
+    Audio over the synchronous limit is decoded with pydub (which needs
+    ffmpeg for compressed formats), split on silence boundaries, and the
+    segments are transcribed concurrently; their transcripts are stitched
+    back in order together with the detected languages.
+
+    When a cache is given, transcripts are stored under the hash of the audio
+    bytes and the recognition settings, so a forwarded voice note is only
+    sent to Chirp the first time.
+
+    Methods:
+        transcribe(audio_file):
+            Transcribes an audio file.
+        transcribe_bytes(content):
+            Transcribes audio already in memory.
+        stream(audio_chunks):
+            Transcribes live audio, yielding partial and final transcripts.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        project_id=PROJECT_ID,
+        region="us-central1",
+        model="chirp",
+        segment_seconds=DEFAULT_SEGMENT_SECONDS,
+        max_workers=DEFAULT_MAX_WORKERS,
+        min_silence_ms=DEFAULT_MIN_SILENCE_MS,
+        silence_thresh_db=DEFAULT_SILENCE_THRESH_DB,
+        streaming_model="long",
+        streaming_language_codes=None,
+        cache=None,
+    ):
+        self.project_id = project_id
+        self.region = region
+        self.model = model
+        self.segment_seconds = min(segment_seconds, SYNC_LIMIT_SECONDS)
+        self.max_workers = max_workers
+        self.min_silence_ms = min_silence_ms
+        self.silence_thresh_db = silence_thresh_db
+        self.streaming_model = streaming_model
+        self.streaming_language_codes = streaming_language_codes or ["es-MX"]
+        self.cache = cache
+
+    @classmethod
+    def from_settings(cls, project_id=PROJECT_ID, region="us-central1"):
+        """
+        Builds the service from the `BOT_AI_TRANSCRIPTION` setting. Supported
+        keys: ``MODEL``, ``SEGMENT_SECONDS``, ``MAX_WORKERS``,
+        ``MIN_SILENCE_MS``, ``SILENCE_THRESH_DB``, ``STREAMING_MODEL``,
+        ``STREAMING_LANGUAGE_CODES``, ``CACHE`` (defaults to True) and
+        ``CACHE_MAX_BYTES``.
+        """
+        config = getattr(settings, "BOT_AI_TRANSCRIPTION", {})
+        cache = None
+        if config.get("CACHE", True):
+            cache = build_disk_cache(
+                "transcripts",
+                max_bytes=config.get("CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES),
+            )
+        return cls(
+            project_id=project_id,
+            region=region,
+            model=config.get("MODEL", "chirp"),
+            segment_seconds=config.get("SEGMENT_SECONDS", DEFAULT_SEGMENT_SECONDS),
+            max_workers=config.get("MAX_WORKERS", DEFAULT_MAX_WORKERS),
+            min_silence_ms=config.get("MIN_SILENCE_MS", DEFAULT_MIN_SILENCE_MS),
+            silence_thresh_db=config.get(
+                "SILENCE_THRESH_DB",
+                DEFAULT_SILENCE_THRESH_DB,
+            ),
+            streaming_model=config.get("STREAMING_MODEL", "long"),
+            streaming_language_codes=config.get("STREAMING_LANGUAGE_CODES"),
+            cache=cache,
+        )
+
+    @property
+    def client(self):
+        return get_speech_client(self.region)
+
+    @property
+    def recognizer(self):
+        return f"projects/{self.project_id}/locations/{self.region}/recognizers/_"
+
+    def cache_key(self, content):
+        """
+        Returns the cache key of some audio: the hash of its bytes plus the
+        settings that change the transcript.
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        return (
+            f"{digest}:{self.model}:{self.segment_seconds}:"
+            f"{self.min_silence_ms}:{self.silence_thresh_db}"
+        )
+
+    def transcribe(self, audio_file):
+        """
+        Transcribes an audio file.
+
+        Args:
+            audio_file (str): Path of the audio file.
+
+        Returns:
+            TranscriptionResult: The stitched transcript and detected languages.
+        """
+        with open(audio_file, "rb") as f:  # noqa: PTH123
+            content = f.read()
+        return self.transcribe_bytes(content)
+
+    def transcribe_bytes(self, content):
+        """
+        Transcribes audio already in memory.
+
+        Args:
+            content (bytes): The encoded audio (any format supported by Chirp).
+
+        Returns:
+            TranscriptionResult: The stitched transcript and detected languages.
+        """
+        if self.cache is None:
+            return self._transcribe_bytes(content)
+
+        key = self.cache_key(content)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return TranscriptionResult(
+                [TranscriptSegment(**segment) for segment in cached["segments"]],
+            )
+
+        result = self._transcribe_bytes(content)
+        self.cache.set(
+            key,
+            {"segments": [asdict(segment) for segment in result.segments]},
+        )
+        return result
+
+    def _transcribe_bytes(self, content):
+        # Short clips go to Chirp as they are, only long audio is decoded
+        if len(content) <= SYNC_LIMIT_BYTES:
+            try:
+                return TranscriptionResult([self._recognize(content, 0)])
+            except google_exceptions.InvalidArgument as e:
+                # The request is rejected when the audio is over the duration
+                # limit, which is only known after decoding
+                logger.info(f"Audio rejected by the synchronous API ({e}), splitting it")  # noqa: E501, G004
+
+        return self._transcribe_segments(content)
+
+    def _transcribe_segments(self, content):
+        """
+        Decodes the audio and transcribes it in segments. Needs pydub and an
+        ffmpeg binary to decode compressed formats such as OGG/Opus.
+        """
+        from pydub import AudioSegment
+
+        audio = AudioSegment.from_file(io.BytesIO(content))
+        boundaries = split_on_silence_boundaries(
+            audio,
+            self.segment_seconds * 1000,
+            self.min_silence_ms,
+            self.silence_thresh_db,
+        )
+        logger.info(
+            f"Transcribing {len(audio) / 1000:.0f}s of audio in {len(boundaries)} segments",  # noqa: E501, G004
+        )
+
+        def transcribe_segment(boundary):
+            start, end = boundary
+            buffer = io.BytesIO()
+            audio[start:end].export(buffer, format="flac")
+            return self._recognize(buffer.getvalue(), start, end)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            segments = list(executor.map(transcribe_segment, boundaries))
+
+        return TranscriptionResult(segments)
+
+    def _recognize(self, content, start_ms, end_ms=None):
+        from google.cloud.speech_v2.types import cloud_speech
+
+        config = cloud_speech.RecognitionConfig(
+            auto_decoding_config=cloud_speech.AutoDetectDecodingConfig(),
+            language_codes=["auto"],  # Set language code to auto to detect language.
+            model=self.model,
+        )
+        request = cloud_speech.RecognizeRequest(
+            recognizer=self.recognizer,
+            config=config,
+            content=content,
+        )
+
+        # Transcribes the audio into text
+        response = self.client.recognize(request=request)
+
+        text = ""
+        languages = []
+        for result in response.results:
+            if not result.alternatives:
+                continue
+            logger.info(f"Transcript: {result.alternatives[0].transcript}")  # noqa: G004
+            logger.info(f"Detected Language: {result.language_code}")  # noqa: G004
+            text += result.alternatives[0].transcript
+            if result.language_code and result.language_code not in languages:
+                languages.append(result.language_code)
+
+        if end_ms is None:
+            # Undecoded audio: its length is the duration billed by the API
+            billed = response.metadata.total_billed_duration
+            end_ms = start_ms + int(billed.total_seconds() * 1000)
+
+        return TranscriptSegment(start_ms, end_ms, text.strip(), languages)
+
+    def stream(self, audio_chunks):
+        """
+        Transcribes live audio as it arrives.
+
+        Args:
+            audio_chunks (Iterable[bytes]): Pieces of the encoded audio, in order.
+                Each piece must be under 25 KB.
+
+        Yields:
+            tuple[str, str, bool]: The transcript, its language and whether it
+            is final (partial transcripts may still change).
+        """
+        from google.cloud.speech_v2.types import cloud_speech
+
+        streaming_config = cloud_speech.StreamingRecognitionConfig(
+            config=cloud_speech.RecognitionConfig(
+                auto_decoding_config=cloud_speech.AutoDetectDecodingConfig(),
+                language_codes=self.streaming_language_codes,
+                model=self.streaming_model,
+            ),
+            streaming_features=cloud_speech.StreamingRecognitionFeatures(
+                interim_results=True,
+            ),
+        )
+
+        def requests():
+            yield cloud_speech.StreamingRecognizeRequest(
+                recognizer=self.recognizer,
+                streaming_config=streaming_config,
+            )
+            for chunk in audio_chunks:
+                yield cloud_speech.StreamingRecognizeRequest(audio=chunk)
+
+        for response in self.client.streaming_recognize(requests=requests()):
+            for result in response.results:
+                if result.alternatives:
+                    yield (
+                        result.alternatives[0].transcript,
+                        result.language_code,
+                        result.is_final,
+                    )
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_transcription_service(project_id=PROJECT_ID, region="us-central1"):
+    """
+    Returns the process-wide TranscriptionService of a project and region,
+    built from the settings on first use so its disk cache is opened once.
+    """
+    with _services_lock:
+        service = _services.get((project_id, region))
+        if service is None:
+            service = TranscriptionService.from_settings(
+                project_id=project_id,
+                region=region,
+            )
+            _services[(project_id, region)] = service
+        return service
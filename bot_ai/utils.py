@@ -4,23 +4,47 @@ import secrets
 from datetime import date
 from datetime import datetime
 from datetime import timedelta
+from functools import lru_cache
 from pathlib import Path
 
-from langchain_core.output_parsers import JsonOutputParser
-from langchain_core.prompts import PromptTemplate
-from langchain_google_vertexai import ChatVertexAI
 from pydantic import BaseModel
 from pydantic import Field
-from vertexai.generative_models import Part
-from vertexai.generative_models._generative_models import Content
 
-from app.bot_ai.bot_multi_model import VertexAImultimodel
+from app.bot_ai.model_router import model_router
+from app.bot_ai.onboarding_parsers import onboarding_fast_path
 from app.common.models import ErrorLogModel
 
-vx_model = VertexAImultimodel()
 logger = logging.getLogger(__name__)
 
 
+def onboarding_model_name(input_chars=0):
+    """Returns the model the router picks for an onboarding validation."""
+    return model_router.route("onboarding_validation", input_chars).model_name
+
+
+@lru_cache(maxsize=None)
+def get_vx_model_for(model_name):
+    """Returns the onboarding instance of a model, built on first use."""
+    from app.bot_ai.bot_multi_model import VertexAImultimodel
+
+    return VertexAImultimodel(model_name=model_name)
+
+
+def get_vx_model(input_chars=0):
+    """
+    Returns the model used by the onboarding helpers. The model is routed on
+    every call; the instance of each model is reused.
+    """
+    return get_vx_model_for(onboarding_model_name(input_chars))
+
+
+def __getattr__(name):
+    # Module-level vx_model is kept for callers, but built on first access
+    if name == "vx_model":
+        return get_vx_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")  # noqa: EM102
+
+
 def extract_text_after_folders(text):
     # Buscar el texto que sigue de "folders/"
     match = re.search(r"folders/(.*)", text)
@@ -52,6 +76,9 @@ def get_file_divition(file_path):
 
 
 def generate_user_response_class(prompt):
+    from vertexai.generative_models import Part
+    from vertexai.generative_models._generative_models import Content
+
     return Content(
         role="user",
         parts=[
@@ -61,6 +88,9 @@ def generate_user_response_class(prompt):
 
 
 def generate_bot_response_class(response):
+    from vertexai.generative_models import Part
+    from vertexai.generative_models._generative_models import Content
+
     return Content(
         role="model",
         parts=[
@@ -70,10 +100,14 @@ def generate_bot_response_class(response):
 
 
 def onboarding_process_name(prompt):
+    parsed = onboarding_fast_path.name(prompt)
+    if parsed.decided:
+        return {"complete": parsed.accepted, "value": parsed.value or ""}
+
     max_output_tokens = 100
     instruction = "get_name_instruction.txt"
 
-    response = vx_model.generate_message_without_history_and_files(
+    response = get_vx_model(len(prompt)).generate_message_without_history_and_files(
         prompt.encode("utf-8", "replace").decode("utf-8"),
         instruction,
         max_output_tokens,
@@ -100,35 +134,102 @@ class Information(BaseModel):
     respuesta: str = Field(description=respuesta_description)
 
 
-def onboarding_process_name_v2(prompt):
-    template = """
+NAME_TEMPLATE = """
       dando el siguiente nombre dime si es correcto o no: {name}. {format_instructions}
     """
-    output_parser = JsonOutputParser(pydantic_object=Information)
+
+ONBOARDING_CONCURRENCY = 10
+
+
+@lru_cache(maxsize=None)
+def get_onboarding_llm(model_name):
+    """
+    Returns the chat model of a model name shared by the onboarding chains, so
+    every chain reuses the same client and connection pool.
+    """
+    from langchain_google_vertexai import ChatVertexAI
+
+    return ChatVertexAI(
+        model=model_name,
+        temperature=0,
+        max_tokens=None,
+        max_retries=6,
+        stop=None,
+    )
+
+
+def build_validation_chain(template, input_variable, pydantic_object, model_name):
+    """
+    Composes prompt, shared chat model and JSON parser into a chain.
+
+    Args:
+        template (str): The prompt template, with `{format_instructions}`.
+        input_variable (str): The name of the variable filled with the answer.
+        pydantic_object (type[BaseModel]): The schema of the expected JSON.
+        model_name (str): The model of the chain.
+
+    Returns:
+        Runnable: The chain, which supports invoke, ainvoke, batch and abatch.
+    """
+    from langchain_core.output_parsers import JsonOutputParser
+    from langchain_core.prompts import PromptTemplate
+
+    output_parser = JsonOutputParser(pydantic_object=pydantic_object)
     template_prompt = PromptTemplate(
-        input_variables=["name"],
+        input_variables=[input_variable],
         template=template,
         partial_variables={
             "format_instructions": output_parser.get_format_instructions(),
         },
     )
+    return template_prompt | get_onboarding_llm(model_name) | output_parser
 
-    llm = ChatVertexAI(
-        model="gemini-1.5-pro-001",
-        temperature=0,
-        max_tokens=None,
-        max_retries=6,
-        stop=None,
+
+@lru_cache(maxsize=None)
+def _name_chain(model_name):
+    return build_validation_chain(NAME_TEMPLATE, "name", Information, model_name)
+
+
+def get_name_chain():
+    """Returns the name validation chain of the routed model, built on first use."""
+    return _name_chain(onboarding_model_name())
+
+
+def onboarding_process_name_v2(prompt):
+    return get_name_chain().invoke(input={"name": prompt})
+
+
+async def aonboarding_process_name_v2(prompt):
+    return await get_name_chain().ainvoke(input={"name": prompt})
+
+
+async def abatch_onboarding_process_name_v2(prompts, concurrency=ONBOARDING_CONCURRENCY):
+    """
+    Validates many names concurrently through the shared chain.
+
+    Returns:
+        list: The parsed answers, in the same order as `prompts`. A failed
+        prompt returns its exception instead of a dict.
+    """
+    return await get_name_chain().abatch(
+        [{"name": prompt} for prompt in prompts],
+        config={"max_concurrency": concurrency},
+        return_exceptions=True,
     )
-    chain = template_prompt | llm | output_parser
-    return chain.invoke(input={"name": prompt})
 
 
 def onboarding_process_date(prompt):
+    parsed = onboarding_fast_path.birthdate(prompt)
+    if parsed.accepted:
+        condition, value = date_processor(parsed.value.strftime("%d-%m-%Y"))
+        return {"complete": condition, "value": value}
+    if parsed.decided:
+        return {"complete": False, "value": ""}
+
     max_output_tokens = 100
     instruction = "get_date_instruction.txt"
 
-    response = vx_model.generate_message_without_history_and_files(
+    response = get_vx_model(len(prompt)).generate_message_without_history_and_files(
         prompt.encode("utf-8", "replace").decode("utf-8"),
         instruction,
         max_output_tokens,
@@ -144,36 +245,143 @@ class BirthdateInformation(BaseModel):
     )
 
 
-def onboarding_process_date_2(prompt):
-    template = """
+DATE_TEMPLATE = """
         dada la siguiente fecha en cualquier formato,
         diga si es correcto o no: {prompt}. {format_instructions}
     """
-    output_parser = JsonOutputParser(pydantic_object=BirthdateInformation)
-    template_prompt = PromptTemplate(
-        input_variables=["prompt"],
-        template=template,
-        partial_variables={
-            "format_instructions": output_parser.get_format_instructions(),
-        },
+
+
+@lru_cache(maxsize=None)
+def _date_chain(model_name):
+    return build_validation_chain(
+        DATE_TEMPLATE,
+        "prompt",
+        BirthdateInformation,
+        model_name,
     )
 
-    llm = ChatVertexAI(
-        model="gemini-1.5-pro-001",
-        temperature=0,
-        max_tokens=None,
-        max_retries=6,
-        stop=None,
+
+def get_date_chain():
+    """Returns the birthdate validation chain of the routed model, built on first use."""  # noqa: E501
+    return _date_chain(onboarding_model_name())
+
+
+def onboarding_process_date_2(prompt):
+    return get_date_chain().invoke(input={"prompt": prompt})
+
+
+async def aonboarding_process_date_2(prompt):
+    return await get_date_chain().ainvoke(input={"prompt": prompt})
+
+
+async def abatch_onboarding_process_date_2(prompts, concurrency=ONBOARDING_CONCURRENCY):
+    """
+    Validates many birthdates concurrently through the shared chain.
+
+    Returns:
+        list: The parsed answers, in the same order as `prompts`. A failed
+        prompt returns its exception instead of a dict.
+    """
+    return await get_date_chain().abatch(
+        [{"prompt": prompt} for prompt in prompts],
+        config={"max_concurrency": concurrency},
+        return_exceptions=True,
+    )
+
+
+class OnboardingInformation(BaseModel):
+    name: Information | None = Field(
+        default=None,
+        description="El nombre completo de la persona, solo si lo menciona",
     )
-    chain = template_prompt | llm | output_parser
-    return chain.invoke(input={"prompt": prompt})
+    birthdate: BirthdateInformation | None = Field(
+        default=None,
+        description="La fecha de nacimiento de la persona, solo si la menciona",
+    )
+    city: str | None = Field(
+        default=None,
+        description="La ciudad donde vive la persona, solo si la menciona",
+    )
+
+
+ONBOARDING_EXTRACTION_INSTRUCTION = """
+    Extrae del mensaje de una persona en spanish los datos de registro que
+    mencione: su nombre completo, su fecha de nacimiento y la ciudad donde
+    vive. Deja en null los datos que no mencione, no inventes ninguno.
+"""
+
+
+def _extraction_fields(information):
+    """
+    Converts the extracted information into the (complete, value) pairs of
+    `BotOnboardingV1`, keeping only the fields found in the message.
+    """
+    fields = {}
+    if information.name is not None:
+        fields["name"] = (information.name.correct, information.name.respuesta)
+    if information.birthdate is not None:
+        value = information.birthdate.value
+        fields["birthdate"] = (
+            information.birthdate.complete and value is not None,
+            value.isoformat() if value else None,
+        )
+    if information.city:
+        fields["city"] = (True, information.city)
+    return fields
+
+
+def onboarding_extract(prompt):
+    """
+    Extracts every onboarding field present in a message with a single model
+    call in JSON mode.
+
+    Returns:
+        dict: (complete, value) pairs keyed by ``name``, ``birthdate`` and
+        ``city``, only for the fields found. Empty when the call fails.
+    """
+    try:
+        information = get_vx_model(len(prompt)).generate_structured_message(
+            prompt.encode("utf-8", "replace").decode("utf-8"),
+            OnboardingInformation,
+            ONBOARDING_EXTRACTION_INSTRUCTION,
+        )
+    except Exception as e:  # noqa: BLE001
+        ErrorLogModel.objects.create(
+            app="bot_ai",
+            function="onboarding_extract",
+            error=f"Error: {e}",
+        )
+        return {}
+    return _extraction_fields(information)
+
+
+async def aonboarding_extract(prompt):
+    """Async version of `onboarding_extract`."""
+    try:
+        information = await get_vx_model(len(prompt)).agenerate_structured_message(
+            prompt.encode("utf-8", "replace").decode("utf-8"),
+            OnboardingInformation,
+            ONBOARDING_EXTRACTION_INSTRUCTION,
+        )
+    except Exception as e:  # noqa: BLE001
+        await ErrorLogModel.objects.acreate(
+            app="bot_ai",
+            function="aonboarding_extract",
+            error=f"Error: {e}",
+        )
+        return {}
+    return _extraction_fields(information)
 
 
 def onboarding_process_city(prompt):
+    parsed = onboarding_fast_path.city(prompt)
+    if parsed.accepted:
+        return {"complete": True, "value": parsed.value}
+
     max_output_tokens = 100
     instruction = "get_city_instruction.txt"
 
-    response = vx_model.generate_message_without_history_and_files(
+    response = get_vx_model(len(prompt)).generate_message_without_history_and_files(
         prompt.encode("utf-8", "replace").decode("utf-8"),
         instruction,
         max_output_tokens,
@@ -183,10 +391,14 @@ def onboarding_process_city(prompt):
 
 
 def onboarding_process_name_retry(prompt):
+    parsed = onboarding_fast_path.name(prompt)
+    if parsed.decided:
+        return {"complete": parsed.accepted, "value": parsed.value or ""}
+
     max_output_tokens = 100
     instruction = "get_name_retry_instruction.txt"
 
-    response = vx_model.generate_message_without_history_and_files(
+    response = get_vx_model(len(prompt)).generate_message_without_history_and_files(
         prompt.encode("utf-8", "replace").decode("utf-8"),
         instruction,
         max_output_tokens,
@@ -196,10 +408,14 @@ def onboarding_process_name_retry(prompt):
 
 
 def onboarding_process_name_confirmation(prompt):
+    parsed = onboarding_fast_path.confirmation(prompt)
+    if parsed.decided:
+        return parsed.value
+
     max_output_tokens = 100
     instruction = "get_name_check_instruction.txt"
 
-    response = vx_model.generate_message_without_history_and_files(
+    response = get_vx_model(len(prompt)).generate_message_without_history_and_files(
         prompt.encode("utf-8", "replace").decode("utf-8"),
         instruction,
         max_output_tokens,
@@ -348,9 +564,28 @@ class BotOnboardingV1:
         """Convert the input data to the expected format"""
         return input_data["complete"], input_data["value"]
 
+    @staticmethod
+    def _name_fast_path(name):
+        """Returns the fast path answer for a name, or None to ask the LLM"""
+        parsed = onboarding_fast_path.name(name)
+        if parsed.decided:
+            return parsed.accepted, parsed.value if parsed.accepted else parsed.reason
+        return None
+
+    @staticmethod
+    def _birthdate_fast_path(birthdate):
+        """Returns the fast path answer for a birthdate, or None to ask the LLM"""
+        parsed = onboarding_fast_path.birthdate(birthdate)
+        if parsed.decided:
+            return parsed.accepted, parsed.value.isoformat() if parsed.accepted else None
+        return None
+
     @classmethod
     def process_name(cls, name) -> tuple[bool, str]:
-        """Process the name"""
+        """Process the name, asking the LLM only when the fast path cannot decide"""
+        result = cls._name_fast_path(name)
+        if result is not None:
+            return result
         process = onboarding_process_name_v2(name)
         return process["correct"], process["respuesta"]
 
@@ -361,9 +596,87 @@ class BotOnboardingV1:
         process = onboarding_process_date(birthdate)
         return cls._convert_output(process)
         """
+        result = cls._birthdate_fast_path(birthdate)
+        if result is not None:
+            return result
         process = onboarding_process_date_2(birthdate)
         return process["complete"], process["value"]
 
+    @classmethod
+    async def aprocess_name(cls, name) -> tuple[bool, str]:
+        """Async version of `process_name`"""
+        result = cls._name_fast_path(name)
+        if result is not None:
+            return result
+        process = await aonboarding_process_name_v2(name)
+        return process["correct"], process["respuesta"]
+
+    @classmethod
+    async def aprocess_birthdate(cls, birthdate) -> tuple[bool, str]:
+        """Async version of `process_birthdate`"""
+        result = cls._birthdate_fast_path(birthdate)
+        if result is not None:
+            return result
+        process = await aonboarding_process_date_2(birthdate)
+        return process["complete"], process["value"]
+
+    @classmethod
+    async def aprocess_names(cls, names, concurrency=ONBOARDING_CONCURRENCY) -> list:
+        """
+        Process the names of many users at once. Only the names the fast path
+        cannot decide are sent to the LLM, in one concurrent batch. A failed
+        name returns its exception instead of a tuple.
+        """
+        results = [cls._name_fast_path(name) for name in names]
+        pending = [index for index, result in enumerate(results) if result is None]
+        processes = await abatch_onboarding_process_name_v2(
+            [names[index] for index in pending],
+            concurrency=concurrency,
+        )
+        for index, process in zip(pending, processes, strict=True):
+            results[index] = (
+                process
+                if isinstance(process, Exception)
+                else (process["correct"], process["respuesta"])
+            )
+        return results
+
+    @classmethod
+    async def aprocess_birthdates(
+        cls,
+        birthdates,
+        concurrency=ONBOARDING_CONCURRENCY,
+    ) -> list:
+        """
+        Process the birthdates of many users at once, like `aprocess_names`.
+        """
+        results = [cls._birthdate_fast_path(birthdate) for birthdate in birthdates]
+        pending = [index for index, result in enumerate(results) if result is None]
+        processes = await abatch_onboarding_process_date_2(
+            [birthdates[index] for index in pending],
+            concurrency=concurrency,
+        )
+        for index, process in zip(pending, processes, strict=True):
+            results[index] = (
+                process
+                if isinstance(process, Exception)
+                else (process["complete"], process["value"])
+            )
+        return results
+
+    @classmethod
+    def process_message(cls, message) -> dict:
+        """
+        Process every field the user answered in one message, so users who
+        give their name, birthdate and city together finish in one round trip
+        """
+        return onboarding_extract(message)
+
+    @classmethod
+    async def aprocess_message(cls, message) -> dict:
+        """Async version of `process_message`"""
+        return await aonboarding_extract(message)
+
     @classmethod
     def get_name_quote(cls) -> str:
         """Get a random quote for the name"""
@@ -0,0 +1,163 @@
+import logging
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCK_ROWS = 4096
+COLUMNS = ("id", "name", "text", "embedding")
+
+
+class VectorStoreBuilder:
+    """
+    Accumulates the chunks of a vector store in columnar buffers and builds
+    the table once at the end, instead of concatenating a DataFrame per file.
+
+    Embeddings are copied into preallocated float32 blocks of `block_rows`
+    rows, so memory grows by blocks and no Python float lists are kept.
+
+    Args:
+        dimensions (int | None): Length of the vectors, taken from the first
+            appended embedding when not given.
+        block_rows (int): Rows of each embedding block.
+
+    Methods:
+        append(ids, names, texts, embeddings):
+            Adds the chunks of a file.
+        matrix():
+            Returns the embeddings as one (rows, dimensions) float32 array.
+        to_arrow():
+            Builds the Arrow table.
+        to_dataframe():
+            Builds a pandas DataFrame with one float32 array per row.
+        load_to_bigquery(client, table_name, job_config):
+            Loads the table into BigQuery as a Parquet file.
+    """
+
+    def __init__(self, dimensions=None, block_rows=DEFAULT_BLOCK_ROWS):
+        self.dimensions = dimensions
+        self.block_rows = block_rows
+        self.ids = []
+        self.names = []
+        self.texts = []
+        self._blocks = []
+        self._filled = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _new_block(self):
+        import numpy as np
+
+        self._blocks.append(np.empty((self.block_rows, self.dimensions), dtype=np.float32))
+        self._filled = 0
+
+    def append(self, ids, names, texts, embeddings):
+        """
+        Adds chunks to the store. The four sequences must have the same length.
+        """
+        import numpy as np
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if not len(embeddings):
+            return
+        if embeddings.ndim != 2 or not (  # noqa: PLR2004
+            len(ids) == len(names) == len(texts) == len(embeddings)
+        ):
+            raise ValueError("ids, names, texts and embeddings must have one row per chunk")  # noqa: EM101, TRY003
+        if self.dimensions is None:
+            self.dimensions = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dimensions:
+            raise ValueError(  # noqa: TRY003
+                f"Expected vectors of {self.dimensions} dimensions, got {embeddings.shape[1]}",  # noqa: EM102
+            )
+
+        self.ids.extend(ids)
+        self.names.extend(names)
+        self.texts.extend(texts)
+
+        start = 0
+        while start < len(embeddings):
+            if not self._blocks or self._filled == self.block_rows:
+                self._new_block()
+            count = min(self.block_rows - self._filled, len(embeddings) - start)
+            self._blocks[-1][self._filled : self._filled + count] = embeddings[
+                start : start + count
+            ]
+            self._filled += count
+            start += count
+
+    def matrix(self):
+        import numpy as np
+
+        if not self._blocks:
+            return np.empty((0, self.dimensions or 0), dtype=np.float32)
+        blocks = [*self._blocks[:-1], self._blocks[-1][: self._filled]]
+        return np.concatenate(blocks) if len(blocks) > 1 else blocks[0]
+
+    def to_arrow(self):
+        import numpy as np
+        import pyarrow as pa
+
+        matrix = self.matrix()
+        # Offsets of a plain list are int32, big stores need a large list
+        large = matrix.size > np.iinfo(np.int32).max
+        offsets = np.arange(len(matrix) + 1, dtype=np.int64) * matrix.shape[1]
+        list_array = pa.LargeListArray if large else pa.ListArray
+        embeddings = list_array.from_arrays(
+            pa.array(offsets, pa.int64() if large else pa.int32()),
+            pa.array(matrix.reshape(-1)),
+        )
+        return pa.table(
+            [
+                pa.array(self.ids, pa.string()),
+                pa.array(self.names, pa.string()),
+                pa.array(self.texts, pa.string()),
+                embeddings,
+            ],
+            names=list(COLUMNS),
+        )
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        return pd.DataFrame(
+            {
+                "id": self.ids,
+                "name": self.names,
+                "text": self.texts,
+                "embedding": list(self.matrix()),
+            },
+            columns=list(COLUMNS),
+        )
+
+    def load_to_bigquery(self, client, table_name, job_config):
+        """
+        Writes the Arrow table to an in-memory Parquet file and loads it with
+        `load_table_from_file`, skipping the DataFrame conversion.
+
+        Args:
+            client (bigquery.Client): The BigQuery client.
+            table_name (str): The destination table.
+            job_config (bigquery.LoadJobConfig): Schema and write disposition;
+                the source format is set to Parquet.
+
+        Returns:
+            LoadJob: The finished load job.
+        """
+        import pyarrow.parquet as pq
+        from google.cloud import bigquery
+
+        buffer = BytesIO()
+        pq.write_table(self.to_arrow(), buffer)
+        buffer.seek(0)
+
+        job_config.source_format = bigquery.SourceFormat.PARQUET
+        parquet_options = bigquery.ParquetOptions()
+        # Reads list<float> as REPEATED FLOAT64 instead of a nested record
+        parquet_options.enable_list_inference = True
+        job_config.parquet_options = parquet_options
+
+        job = client.load_table_from_file(buffer, table_name, job_config=job_config)
+        job.result()
+        logger.info(f"Loaded {len(self)} chunks into {table_name}")  # noqa: G004
+        return job